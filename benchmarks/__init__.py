@@ -0,0 +1,22 @@
+"""
+Micro-benchmarks for the slash command request path.
+
+Each module is a script; run it from the project root, e.g.
+
+    python -m benchmarks.rendering
+"""
+import os
+import timeit
+
+
+def setup_django(settings_module='tintg.settings'):
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_module)
+    import django
+    django.setup()
+
+
+def report(name, func, number=10000, repeat=5):
+    """Print and return the best per-call time of `func`, in seconds."""
+    best = min(timeit.repeat(func, number=number, repeat=repeat)) / number
+    print('{:<45} {:>10.2f} us'.format(name, best * 1e6))
+    return best
@@ -0,0 +1,87 @@
+"""
+Load-test running servers with concurrent slash commands.
+
+Start the servers to compare, for example the sync worker and the threaded
+worker from tintg/gunicorn_conf.py:
+
+    WEB_WORKER_CLASS=sync gunicorn tintg.wsgi -c tintg/gunicorn_conf.py -b :8001
+    WEB_WORKER_CLASS=gthread gunicorn tintg.wsgi -c tintg/gunicorn_conf.py -b :8002
+
+then drive both with the same traffic from one asyncio client:
+
+    python -m benchmarks.concurrency --token TOKEN \\
+        http://127.0.0.1:8001/slack/ http://127.0.0.1:8002/slack/
+"""
+import argparse
+import asyncio
+import time
+
+from slack.loadgen import percentile, post
+
+
+async def load(url, requests, concurrency, fields_for):
+    """
+    Send `requests` POSTs to `url`, at most `concurrency` at a time, where
+    fields_for(n) builds the form for request n. Returns (latencies, errors,
+    elapsed seconds).
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = []
+
+    async def one(n):
+        async with semaphore:
+            try:
+                status, _, seconds = await post(url, fields_for(n))
+            except (OSError, asyncio.TimeoutError) as error:
+                errors.append(error)
+                return
+            if status != 200:
+                errors.append(status)
+            latencies.append(seconds)
+
+    started = time.perf_counter()
+    await asyncio.gather(*[one(n) for n in range(requests)])
+    return latencies, errors, time.perf_counter() - started
+
+
+def summarize(url, latencies, errors, elapsed):
+    print('{}\n  {:>8.1f} req/s  p50 {:>7.1f} ms  p99 {:>7.1f} ms  '
+          'errors {}'.format(
+              url,
+              len(latencies) / elapsed if elapsed else 0,
+              percentile(latencies, 0.50) * 1000,
+              percentile(latencies, 0.99) * 1000,
+              len(errors),
+          ))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('urls', nargs='+')
+    parser.add_argument('--token', required=True)
+    parser.add_argument('--text', default='tictac show')
+    parser.add_argument('--channels', type=int, default=50)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=50)
+    args = parser.parse_args()
+
+    def fields_for(n):
+        return {
+            'token': args.token,
+            'channel_id': 'CLOAD{}'.format(n % args.channels),
+            'user_id': 'U{}'.format(n),
+            'user_name': 'load{}'.format(n),
+            'command': '/tintg',
+            'text': args.text,
+        }
+
+    loop = asyncio.get_event_loop()
+    for url in args.urls:
+        summarize(url, *loop.run_until_complete(
+            load(url, args.requests, args.concurrency, fields_for),
+        ))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""
+Compare slash commands that reconnect to the database on every request
+with ones that keep a persistent connection (CONN_MAX_AGE).
+
+    python -m benchmarks.connections
+
+This runs against a throwaway test database on the configured backend;
+connect overhead is small on SQLite and much larger against Postgres, so
+to measure production-like numbers point it at a Postgres database:
+
+    DJANGO_SETTINGS_MODULE=tintg.prod_settings python -m benchmarks.connections
+"""
+import os
+import tempfile
+
+from . import report, setup_django
+
+
+def main():
+    setup_django()
+    from django.db import connection
+    from django.test import Client
+    from django.test.utils import setup_test_environment
+    from slack.models import Team
+
+    setup_test_environment()
+    if connection.vendor == 'sqlite':
+        # An in-memory database is never really closed, which would hide
+        # the cost being measured.
+        connection.settings_dict['TEST'] = {'NAME': os.path.join(
+            tempfile.mkdtemp(), 'benchmark.sqlite3',
+        )}
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        team = Team.objects.create(
+            name='bench', slack_id='TBENCH', domain='bench',
+            token='bench-token',
+        )
+        client = Client()
+        fields = {
+            'token': team.token,
+            'channel_id': 'CBENCH',
+            'user_id': 'U1',
+            'user_name': 'stewart',
+            'command': '/tintg',
+        }
+        client.post('/slack/', dict(fields, text='tictac @cal'))
+
+        def wrong_turn():
+            # Reads the players and replies without writing anything, so
+            # every call does the same work.
+            client.post('/slack/', dict(
+                fields, user_id='U2', user_name='cal', text='tictac move 5',
+            ))
+
+        results = {}
+        for max_age in (0, 600):
+            connection.close()
+            connection.settings_dict['CONN_MAX_AGE'] = max_age
+            results[max_age] = report(
+                'wrong-turn move, CONN_MAX_AGE={}'.format(max_age),
+                wrong_turn, number=500,
+            )
+        print('saved per request: {:.2f} us'.format(
+            (results[0] - results[600]) * 1e6,
+        ))
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,35 @@
+"""
+Compare decoding game state as jsonfield's JSONField did, into OrderedDicts
+as each model instance was built, against StateField.from_db_value.
+
+    python -m benchmarks.decoding
+
+On PostgreSQL, psycopg2 decodes jsonb itself and StateField.from_db_value
+passes the dict through; here the state is text, so both parse JSON.
+"""
+import json
+from collections import OrderedDict
+
+from . import report, setup_django
+
+
+def main():
+    setup_django()
+    from games import engines
+    from games.fields import StateField, dumps
+
+    native = StateField()
+    for kind in ('tictactoe', 'connectfour', 'gomoku'):
+        state = engines.get(kind).initial_state()
+        state.update(x=0b1001, o=0b110)
+        text = dumps(state)
+        report('{} jsonfield'.format(kind),
+               lambda: json.loads(text, object_pairs_hook=OrderedDict))
+        report('{} StateField'.format(kind),
+               lambda: native.from_db_value(text, None, None, None))
+        report('{} StateField, decoded by the driver'.format(kind),
+               lambda: native.from_db_value(state, None, None, None))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""
+Measure the bytes each move writes: rewriting the whole state on every
+move, as before the move log, against logging the move and checkpointing
+the state every TINTG_CHECKPOINT_INTERVAL moves.
+
+    python -m benchmarks.movelog
+
+Bytes are the length of the SQL for each write, with its parameters, as
+sent to the database.
+"""
+import random
+
+from . import setup_django
+
+
+def play_game(kind, interval, channel, seed=0):
+    """Play a random game; return (moves, game row bytes, move log bytes)."""
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext, override_settings
+    from games import engines, services
+    from games.models import Game, Player
+
+    engine = engines.get(kind)
+    game = Game.objects.start_game(kind=kind, channel=channel)
+    Player.objects.create(game=game, name='Stewart', is_current=True)
+    Player.objects.create(game=game, name='cal')
+    if kind == 'tictactoe':
+        candidates = [str(cell) for cell in range(1, 10)]
+    elif engine.gravity:
+        candidates = [str(col) for col in range(1, engine.width + 1)]
+    else:
+        candidates = [
+            '{}{}'.format(chr(ord('a') + col), row + 1)
+            for row in range(engine.height) for col in range(engine.width)
+        ]
+    rng = random.Random(seed)
+    rng.shuffle(candidates)
+    players = ('Stewart', 'cal')
+    moves = game_bytes = log_bytes = 0
+    with override_settings(TINTG_CHECKPOINT_INTERVAL=interval), \
+            CaptureQueriesContext(connection) as queries:
+        for text in candidates * 2:
+            result = services.play_move(channel, players[moves % 2], 'U1', text)
+            if result.status in (services.PLAYED, services.WON,
+                                 services.TIE):
+                moves += 1
+            if result.status in (services.WON, services.TIE):
+                break
+    for query in queries:
+        sql = query['sql']
+        if sql.startswith('UPDATE "games_game"'):
+            game_bytes += len(sql.encode('utf8'))
+        elif sql.startswith('INSERT INTO "games_move"'):
+            log_bytes += len(sql.encode('utf8'))
+    return moves, game_bytes, log_bytes
+
+
+def main():
+    setup_django()
+    from django.db import connection
+    from django.test.utils import setup_test_environment
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        for kind in ('tictactoe', 'connectfour', 'gomoku'):
+            moves, before, _ = play_game(kind, 1, 'B-' + kind)
+            _, game_bytes, log_bytes = play_game(kind, 4, 'A-' + kind)
+            after = game_bytes + log_bytes
+            print('{:<12} {:>3} moves  state every move {:>6.0f} B/move  '
+                  'log + checkpoint {:>6.0f} B/move ({:.0f} + {:.0f})'.format(
+                      kind, moves, before / moves, after / moves,
+                      game_bytes / moves, log_bytes / moves,
+                  ))
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""
+Compare board rendering before and after memoization.
+
+    python -m benchmarks.rendering
+"""
+import random
+
+from . import report, setup_django
+
+
+def legacy_board_state_to_slack(board):
+    """The original string-concatenating renderer, kept for comparison."""
+    text = ""
+    for index, row in enumerate(board):
+        for space in row:
+            if space == 0:
+                text += ':white_medium_square: '
+            if space == 'X':
+                text += ':x: '
+            if space == 'O':
+                text += ':o: '
+        if index < 2:
+            text += '\n'
+    return text
+
+
+def random_positions(count, seed=0):
+    from games import tictactoe
+    rng = random.Random(seed)
+    positions = []
+    for _ in range(count):
+        x = o = 0
+        cells = list(tictactoe.CELLS)
+        rng.shuffle(cells)
+        for ply, cell in enumerate(cells[:rng.randint(0, 9)]):
+            piece = tictactoe.X if ply % 2 == 0 else tictactoe.O
+            x, o = tictactoe.play(x, o, cell, piece)
+        positions.append((x, o))
+    return positions
+
+
+def main():
+    setup_django()
+    from games import rendering, tictactoe
+
+    positions = random_positions(200)
+    boards = [tictactoe.to_rows(x, o) for x, o in positions]
+    for (x, o), board in zip(positions, boards):
+        assert rendering.render(x, o, 'slack') == \
+            legacy_board_state_to_slack(board)
+
+    def legacy():
+        for board in boards:
+            legacy_board_state_to_slack(board)
+
+    def uncached():
+        for x, o in positions:
+            rendering.render.__wrapped__(x, o, 'slack')
+
+    def memoized():
+        for x, o in positions:
+            rendering.render(x, o, 'slack')
+
+    print('Rendering {} boards per call'.format(len(positions)))
+    before = report('legacy string concatenation', legacy, number=200)
+    report('rendering.render, cache bypassed', uncached, number=200)
+    after = report('rendering.render, memoized', memoized, number=200)
+    print('speedup: {:.1f}x'.format(before / after))
+
+
+if __name__ == '__main__':
+    main()
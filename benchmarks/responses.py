@@ -0,0 +1,51 @@
+"""
+Compare the cost of serializing slash command responses.
+
+    python -m benchmarks.responses
+"""
+from . import report, setup_django
+
+
+def main():
+    setup_django()
+    from django.http import JsonResponse
+    from games import engines
+    from slack import responses, views
+
+    help_payload = dict(views.help_response(engines.get('tictactoe')))
+    board_payload = {
+        'response_type': 'in_channel',
+        'text': "Stewart has played. It's cal's turn now.",
+        'attachments': [
+            {'text': engines.get('tictactoe').render({'x': 273, 'o': 10})},
+        ],
+    }
+
+    print('encoder: {}'.format(
+        'ujson' if responses.ujson is not None else 'json (stdlib)',
+    ))
+    report('help, JsonResponse(dict)', lambda: JsonResponse({
+        'text': help_payload['text'],
+        'attachments': help_payload['attachments'],
+    }))
+    report('help, static bytes', lambda: responses.render(
+        views.help_response(engines.get('tictactoe')),
+    ))
+    report('error, JsonResponse(dict)', lambda: JsonResponse({
+        'text': views.WRONG_TURN,
+    }))
+    report('error, static bytes', lambda: responses.render(
+        views.WRONG_TURN_RESPONSE,
+    ))
+    report('board, JsonResponse(dict)', lambda: JsonResponse(board_payload))
+    report('board, responses.render', lambda: responses.render(board_payload))
+    report('board, json.dumps only', lambda: responses.stdlib_dumps(
+        board_payload,
+    ))
+    report('board, responses.dumps only', lambda: responses.dumps(
+        board_payload,
+    ))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,20 @@
+"""
+Settings for benchmarks.suite: the development settings, on the database
+in TINTG_BENCH_DB_URL if it is set, e.g.
+
+    TINTG_BENCH_DB_URL=postgres://localhost/tintg python -m benchmarks.suite
+
+The suite runs in a test database created next to that one.
+"""
+import os
+
+import dj_database_url
+from tintg.settings import *
+
+# Don't time Django's query logging.
+DEBUG = False
+
+if os.environ.get('TINTG_BENCH_DB_URL'):
+    DATABASES['default'] = dj_database_url.parse(
+        os.environ['TINTG_BENCH_DB_URL'],
+    )
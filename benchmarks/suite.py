@@ -0,0 +1,360 @@
+"""
+The benchmark suite: game engine methods and the slash command POST path,
+run against a test database, with JSON baselines to compare against.
+
+    python -m benchmarks.suite --save baseline.json
+    python -m benchmarks.suite --compare baseline.json
+
+Each case is timed for a number of rounds. A round builds its fixtures
+(untimed), then times `number` calls. A comparison run exits with status 1
+if any case's best time per call is more than --threshold slower than the
+baseline's. Baselines only compare with runs on the same machine and
+database, ideally back to back on a quiet one; --scale adds rounds where
+the numbers are noisy. Set TINTG_BENCH_DB_URL to run on Postgres (see
+benchmarks/settings.py).
+"""
+import argparse
+import datetime
+import functools
+import gc
+import itertools
+import json
+import platform
+import statistics
+import sys
+import time
+from urllib.parse import urlencode
+
+
+CASES = []
+
+DEFAULT_THRESHOLD = 0.2
+
+_channels = itertools.count()
+
+
+class Case(object):
+
+    def __init__(self, name, factory, number=1, rounds=200):
+        self.name = name
+        self.factory = factory
+        self.number = number
+        self.rounds = rounds
+
+    def run(self, scale=1.0):
+        """Return per-call times, in seconds, one for each round."""
+        times = []
+        for _ in range(max(1, int(self.rounds * scale))):
+            func = self.factory()
+            # As timeit does, so a collection doesn't land in one round.
+            collecting = gc.isenabled()
+            gc.disable()
+            try:
+                started = time.perf_counter()
+                for _ in range(self.number):
+                    func()
+                times.append((time.perf_counter() - started) / self.number)
+            finally:
+                if collecting:
+                    gc.enable()
+        return times
+
+
+def case(name, number=1, rounds=200):
+    """
+    Register a benchmark. The decorated factory is called once per round to
+    set up fixtures, and returns the function to time.
+    """
+    def decorator(factory):
+        CASES.append(Case(name, factory, number, rounds))
+        return factory
+    return decorator
+
+
+def new_channel():
+    return 'CBENCH{}'.format(next(_channels))
+
+
+def start_game(kind='tictactoe', state=None):
+    """A game in a new channel, Stewart to play against cal."""
+    from games.models import Game, Player
+    game = Game.objects.start_game(kind=kind, channel=new_channel())
+    if state is not None:
+        game.state = state
+        game.save()
+    Player.objects.create(
+        game=game, name='Stewart', remote_user_id='U1', is_current=True,
+    )
+    Player.objects.create(game=game, name='cal', remote_user_id='U2')
+    return game
+
+
+# A tic-tac-toe position mid-game, X to move: X on 1 and 5, O on 2 and 9.
+MIDGAME = {'last_move': 'O', 'x': 0b000010001, 'o': 0b100000010}
+
+
+# Engine
+
+
+@case('engine.make_move_if_valid')
+def make_move_if_valid():
+    game = start_game(state=dict(MIDGAME))
+    return lambda: game.make_move_if_valid('3')
+
+
+@case('engine.make_move_if_valid, invalid', number=1000, rounds=20)
+def make_move_if_valid_invalid():
+    from games.models import Game
+    game = Game(kind='tictactoe', channel='CBENCH', state=dict(MIDGAME))
+    return lambda: game.make_move_if_valid('5')
+
+
+@case('engine.is_won', number=1000, rounds=20)
+def is_won():
+    from games.models import Game
+    game = Game(kind='tictactoe', channel='CBENCH', state=dict(MIDGAME))
+    return game.is_won
+
+
+@case('engine.is_decided', number=1000, rounds=20)
+def is_decided():
+    from games.models import Game
+    game = Game(kind='tictactoe', channel='CBENCH', state=dict(MIDGAME))
+    return game.is_decided
+
+
+@case('engine.is_won, connectfour', number=1000, rounds=20)
+def is_won_connectfour():
+    from games import engines
+    from games.models import Game
+    state = engines.get('connectfour').initial_state()
+    state.update(x=0b1001001, o=0b100100)
+    game = Game(kind='connectfour', channel='CBENCH', state=state)
+    return game.is_won
+
+
+@case('engine.board_state_to_slack', number=1000, rounds=20)
+def board_state_to_slack():
+    from games.models import Game
+    game = Game(kind='tictactoe', channel='CBENCH', state=dict(MIDGAME))
+    return game.board_state_to_slack
+
+
+@case('engine.board_state_to_slack, uncached', number=1000, rounds=20)
+def board_state_to_slack_uncached():
+    from games import rendering
+    render = rendering.render.__wrapped__
+    return lambda: render(MIDGAME['x'], MIDGAME['o'], 'slack')
+
+
+@case('views.get_players')
+def get_players():
+    from slack import views
+    game = start_game()
+    data = {'user_name': 'Stewart', 'user_id': 'U1'}
+    return lambda: views.get_players(game, data)
+
+
+# The slash command POST path, through the test client and middleware.
+
+
+_client = None
+
+
+def client():
+    """One test client for every case, so middleware is only loaded once."""
+    global _client
+    if _client is None:
+        from django.test import Client
+        _client = Client()
+    return _client
+
+
+def poster(text, channel=None, user=('Stewart', 'U1')):
+    from slack.models import Team
+    team = Team.objects.get(slack_id='TBENCH')
+    data = {
+        'token': team.token,
+        'team_id': team.slack_id,
+        'team_domain': team.domain,
+        'channel_id': channel or new_channel(),
+        'channel_name': 'general',
+        'user_name': user[0],
+        'user_id': user[1],
+        'command': '/tintg',
+        'text': text,
+        'response_url': 'https://hooks.slack.com/commands/1234/5678',
+    }
+    # Form-encoded like Slack's requests; the test client defaults to
+    # multipart, which costs more to parse.
+    return functools.partial(
+        client().post, '/slack/', urlencode(data),
+        content_type='application/x-www-form-urlencoded',
+    )
+
+
+@case('slash_command hello', number=20, rounds=20)
+def post_hello():
+    return poster('hello')
+
+
+@case('slash_command usage', number=20, rounds=20)
+def post_usage():
+    return poster('')
+
+
+@case('slash_command help', number=20, rounds=20)
+def post_help():
+    return poster('tictac help')
+
+
+@case('slash_command start')
+def post_start():
+    return poster('tictac @cal')
+
+
+@case('slash_command bot')
+def post_bot():
+    return poster('tictac bot')
+
+
+@case('slash_command move')
+def post_move():
+    return poster('tictac move 5', start_game().channel)
+
+
+@case('slash_command move, against the bot')
+def post_bot_move():
+    from games.models import Game, Player
+    game = Game.objects.start_game(kind='tictactoe', channel=new_channel())
+    Player.objects.create(
+        game=game, name='Stewart', remote_user_id='U1', is_current=True,
+    )
+    Player.objects.create(
+        game=game, name=Player.BOT_NAME, remote_user_id=Player.BOT_USER_ID,
+    )
+    return poster('tictac move 5', game.channel)
+
+
+@case('slash_command move, wrong turn', number=20, rounds=20)
+def post_wrong_turn():
+    return poster('tictac move 5', start_game().channel, ('cal', 'U2'))
+
+
+@case('slash_command show')
+def post_show():
+    return poster('tictac show', start_game().channel)
+
+
+@case('slash_command show, no game', number=20, rounds=20)
+def post_show_no_game():
+    return poster('tictac show')
+
+
+@case('slash_command forfeit')
+def post_forfeit():
+    return poster('tictac forfeit', start_game().channel)
+
+
+def run(cases, scale=1.0, output=sys.stdout):
+    from django.db import connection
+    from django.test.utils import setup_test_environment
+    from slack import teams
+    from slack.models import Team
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0)
+    results = {}
+    try:
+        Team.objects.create(
+            slack_id='TBENCH', domain='bench', token='bench-token',
+        )
+        teams.clear()
+        for benchmark in cases:
+            times = benchmark.run(scale)
+            results[benchmark.name] = {
+                'best': min(times),
+                'median': statistics.median(times),
+                'rounds': len(times),
+                'number': benchmark.number,
+            }
+            output.write('{:<45} {:>10.2f} us  (median {:.2f} us)\n'.format(
+                benchmark.name, min(times) * 1e6,
+                statistics.median(times) * 1e6,
+            ))
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+    return {
+        'created': datetime.datetime.utcnow().isoformat(),
+        'database': connection.vendor,
+        'python': platform.python_version(),
+        'machine': platform.node(),
+        'results': results,
+    }
+
+
+def compare(current, baseline, threshold=DEFAULT_THRESHOLD,
+            output=sys.stdout):
+    """Print `current` against `baseline`; return the regressed cases."""
+    if current['database'] != baseline['database']:
+        output.write('warning: baseline ran on {}, this run on {}\n'.format(
+            baseline['database'], current['database'],
+        ))
+    regressed = []
+    for name, result in sorted(current['results'].items()):
+        before = baseline['results'].get(name)
+        if before is None:
+            output.write('{:<45} new\n'.format(name))
+            continue
+        ratio = result['best'] / before['best']
+        flag = ''
+        if ratio > 1 + threshold:
+            regressed.append(name)
+            flag = '  REGRESSED'
+        output.write(
+            '{:<45} {:>10.2f} us -> {:>10.2f} us  {:>5.2f}x{}\n'.format(
+                name, before['best'] * 1e6, result['best'] * 1e6, ratio, flag,
+            ),
+        )
+    return regressed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--save', metavar='PATH',
+                        help="Write the results to PATH as JSON.")
+    parser.add_argument('--compare', metavar='PATH',
+                        help="Compare with the baseline at PATH.")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help="Fraction slower than the baseline that counts "
+                             "as a regression.")
+    parser.add_argument('--filter', default='',
+                        help="Only run cases whose names contain this.")
+    parser.add_argument('--scale', type=float, default=1.0,
+                        help="Multiply the number of rounds by this.")
+    options = parser.parse_args(argv)
+
+    from . import setup_django
+    setup_django('benchmarks.settings')
+    result = run(
+        [benchmark for benchmark in CASES if options.filter in benchmark.name],
+        options.scale,
+    )
+    if options.save:
+        with open(options.save, 'w') as output:
+            json.dump(result, output, indent=2, sort_keys=True)
+    if options.compare:
+        with open(options.compare) as baseline:
+            regressed = compare(
+                result, json.load(baseline), options.threshold,
+            )
+        if regressed:
+            print('{} case(s) regressed by more than {:.0%}'.format(
+                len(regressed), options.threshold,
+            ))
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,105 @@
+"""
+Compare the full middleware stack with the webhook's lean one, per request,
+and worker memory with the default settings against tintg.webhook_settings.
+
+    python -m benchmarks.webhook
+"""
+import io
+import os
+import subprocess
+import sys
+from urllib.parse import urlencode
+
+from . import report, setup_django
+
+
+# ru_maxrss survives exec on Linux, so it would report the parent's peak;
+# read the current RSS from /proc where there is one.
+MEMORY_SCRIPT = """
+import resource, django
+django.setup()
+from django.core.wsgi import get_wsgi_application
+from django.core.urlresolvers import resolve
+application = get_wsgi_application()
+application.load_middleware()
+resolve('/slack/')
+try:
+    with open('/proc/self/status') as status:
+        print(next(l for l in status if l.startswith('VmRSS')).split()[1])
+except IOError:
+    print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+"""
+
+
+def worker_rss(settings_module, base='tintg.settings'):
+    """RSS in KiB of a process that has loaded Django and its URLs."""
+    environ = dict(
+        os.environ,
+        DJANGO_SETTINGS_MODULE=settings_module,
+        TINTG_BASE_SETTINGS=base,
+    )
+    output = subprocess.check_output(
+        [sys.executable, '-c', MEMORY_SCRIPT], env=environ,
+    )
+    return int(output.split()[-1])
+
+
+def main():
+    setup_django()
+    from django.core.handlers.wsgi import WSGIHandler
+    from django.db import connection
+    from django.test.utils import setup_test_environment
+    from slack.models import Team
+    from tintg.webhook import WebhookHandler
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        team = Team.objects.create(
+            name='bench', slack_id='TBENCH', domain='bench',
+            token='bench-token',
+        )
+        body = urlencode({
+            'token': team.token,
+            'channel_id': 'CBENCH',
+            'user_id': 'U1',
+            'user_name': 'stewart',
+            'command': '/tintg',
+            'text': 'tictac help',
+        }).encode('ascii')
+
+        def call(handler):
+            environ = {
+                'REQUEST_METHOD': 'POST',
+                'PATH_INFO': '/slack/',
+                'SERVER_NAME': 'testserver',
+                'SERVER_PORT': '80',
+                'wsgi.url_scheme': 'http',
+                'wsgi.input': io.BytesIO(body),
+                'CONTENT_TYPE': 'application/x-www-form-urlencoded',
+                'CONTENT_LENGTH': str(len(body)),
+            }
+            status = []
+            handler(environ, lambda s, headers: status.append(s))
+            assert status == ['200 OK'], status
+
+        full = WSGIHandler()
+        lean = WebhookHandler()
+        before = report('tictac help, full middleware', lambda: call(full),
+                        number=2000)
+        after = report('tictac help, webhook middleware',
+                       lambda: call(lean), number=2000)
+        print('saved per request: {:.2f} us'.format((before - after) * 1e6))
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    full_rss = worker_rss('tintg.settings')
+    lean_rss = worker_rss('tintg.webhook_settings')
+    print('{:<45} {:>10} KiB'.format('worker RSS, tintg.settings', full_rss))
+    print('{:<45} {:>10} KiB'.format(
+        'worker RSS, tintg.webhook_settings', lean_rss,
+    ))
+
+
+if __name__ == '__main__':
+    main()
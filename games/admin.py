@@ -3,3 +3,4 @@ from . import models
 
 admin.site.register(models.Game)
 admin.site.register(models.Player)
+admin.site.register(models.ArchivedGame)
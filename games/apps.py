@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class GamesConfig(AppConfig):
     name = 'games'
+
+    def ready(self):
+        from . import engines
+        engines.load_engines()
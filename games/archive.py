@@ -0,0 +1,121 @@
+"""
+Archiving finished games.
+
+Games stay in games_game and games_player after they end, so those tables,
+and every query against them, grow without bound. archive_finished() moves
+finished games, with their players and move logs, out in batches: each batch
+is copied to ArchivedGame rows, or appended to a JSON Lines file, and
+deleted from the live tables in one short transaction, with a pause between
+batches so the job never holds locks for long.
+
+Run it with `manage.py archive_games`, e.g. from Heroku Scheduler.
+"""
+import json
+import time
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import ArchivedGame, Game, Move, Player
+
+
+DEFAULT_BATCH_SIZE = 500
+DEFAULT_PAUSE = 0.5
+
+
+def batch_size():
+    return getattr(settings, 'TINTG_ARCHIVE_BATCH_SIZE', DEFAULT_BATCH_SIZE)
+
+
+def pause():
+    return getattr(settings, 'TINTG_ARCHIVE_PAUSE', DEFAULT_PAUSE)
+
+
+def dumps(value):
+    return json.dumps(value, separators=(',', ':'))
+
+
+def archive_record(game, players, moves=()):
+    """
+    The archived form of `game`, as a dict of ArchivedGame fields. `moves`
+    are its Move rows in ply order.
+    """
+    index = {player.id: n for n, player in enumerate(players)}
+    return {
+        'game_id': game.id,
+        'kind': game.kind,
+        'channel': game.channel,
+        'outcome': game.outcome,
+        'state': dumps(game.state),
+        'players': dumps([
+            [player.name, player.remote_user_id, player.is_current]
+            for player in players
+        ]),
+        'moves': dumps([
+            [move.move, index.get(move.player_id)] for move in moves
+        ]),
+    }
+
+
+def archive_batch(size, output=None):
+    """
+    Archive up to `size` finished games, oldest first. Records go to the
+    ArchivedGame table, or are written as lines to the `output` file if
+    one is given. Returns how many games were archived.
+    """
+    with transaction.atomic():
+        games = list(
+            Game.objects.filter(is_active=False)
+            .select_for_update()
+            .order_by('id')[:size]
+        )
+        if not games:
+            return 0
+        ids = [game.id for game in games]
+        players = {}
+        for player in Player.objects.filter(game_id__in=ids).order_by('id'):
+            players.setdefault(player.game_id, []).append(player)
+        moves = {}
+        for move in Move.objects.filter(game_id__in=ids).order_by('ply'):
+            moves.setdefault(move.game_id, []).append(move)
+        records = [
+            archive_record(
+                game, players.get(game.id, ()), moves.get(game.id, ()),
+            )
+            for game in games
+        ]
+        if output is None:
+            ArchivedGame.objects.bulk_create(
+                ArchivedGame(**record) for record in records
+            )
+        else:
+            # Written before the delete commits: if it fails, the batch
+            # is archived again next time, so readers should expect the
+            # odd duplicate game_id.
+            output.write(''.join(dumps(record) + '\n' for record in records))
+            output.flush()
+        Move.objects.filter(game_id__in=ids).delete()
+        Player.objects.filter(game_id__in=ids).delete()
+        Game.objects.filter(id__in=ids).delete()
+    return len(games)
+
+
+def archive_finished(size=None, delay=None, limit=None, output=None):
+    """
+    Archive finished games in batches of `size`, sleeping `delay` seconds
+    between batches, until none are left or `limit` have been archived.
+    Returns the number archived.
+    """
+    size = size or batch_size()
+    delay = pause() if delay is None else delay
+    total = 0
+    while limit is None or total < limit:
+        if limit is not None:
+            size = min(size, limit - total)
+        archived = archive_batch(size, output)
+        total += archived
+        if archived < size:
+            break
+        if delay:
+            time.sleep(delay)
+    return total
@@ -0,0 +1,364 @@
+"""
+Game engines.
+
+An engine implements the rules of one kind of game over a JSON-serializable
+state dict: its initial state, move parsing, applying a move, the outcome and
+rendering. Engines are registered by kind and by slash command, so requests
+are dispatched with a dict lookup. The built-in engines are registered when
+this module is imported; engine classes listed by dotted path in
+TINTG_GAME_ENGINES are registered when the games app is ready.
+"""
+import collections
+import re
+import string
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from . import moves, rendering, tictactoe
+
+
+ENGINES = collections.OrderedDict()
+COMMANDS = {}
+
+
+def register(engine_class):
+    engine = engine_class()
+    ENGINES[engine.kind] = engine
+    COMMANDS[engine.command] = engine
+    return engine_class
+
+
+def load_engines(paths=None):
+    if paths is None:
+        paths = getattr(settings, 'TINTG_GAME_ENGINES', ())
+    for path in paths:
+        register(import_string(path))
+
+
+def get(kind):
+    return ENGINES[kind]
+
+
+def for_command(command):
+    """Return the engine for a slash command such as 'tictac', or None."""
+    return COMMANDS.get(command)
+
+
+def choices():
+    return tuple((kind, engine.label) for kind, engine in ENGINES.items())
+
+
+class Choices(object):
+    """
+    Field choices that follow the registry, so engines registered from
+    TINTG_GAME_ENGINES after the models are imported are included.
+    """
+
+    def __iter__(self):
+        return iter(choices())
+
+    def __len__(self):
+        return len(ENGINES)
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return repr(list(self))
+
+
+class Engine(object):
+    """
+    Base class for engines. Moves alternate between X and O, starting with
+    X, and the state records the piece that moved last under 'last_move'.
+    """
+    kind = None
+    # Shown in the admin, e.g. "Tic-tac-toe".
+    label = None
+    # Used in channel messages, e.g. "TicTacToe".
+    title = None
+    command = None
+    # The mask of every cell on the board.
+    full = None
+    # Help text for `move`: the argument, and what it does.
+    move_argument = 'space'
+    move_help = "play in an empty space"
+    has_bot = False
+
+    def initial_state(self):
+        raise NotImplementedError
+
+    def parse_move(self, text):
+        """Return a move for `text`, or None if it isn't one."""
+        raise NotImplementedError
+
+    def apply_move(self, state, move):
+        """Return the state after `move`, or None if it isn't legal."""
+        raise NotImplementedError
+
+    def outcome(self, state):
+        """Return the winning piece, tictactoe.TIE, or None if undecided."""
+        raise NotImplementedError
+
+    def forced_outcome(self, state):
+        """
+        Like outcome(), but as soon as the result is settled: the piece
+        that can force a win whatever the other side plays, or
+        tictactoe.TIE once neither side can complete a line. Engines that
+        can't tell early just report the outcome.
+        """
+        return self.outcome(state)
+
+    def render(self, state, theme=None):
+        raise NotImplementedError
+
+    def bot_move(self, state):
+        """Return the bot's reply to `state`, for engines with a bot."""
+        return None
+
+    def next_piece(self, state):
+        if state.get('last_move') == tictactoe.O:
+            return tictactoe.X
+        return tictactoe.O
+
+    def play(self, state, text):
+        move = self.parse_move(text)
+        if move is None:
+            return None
+        return self.apply_move(state, move)
+
+
+@register
+class TicTacToeEngine(Engine):
+    kind = 'tictactoe'
+    label = "Tic-tac-toe"
+    title = "TicTacToe"
+    command = 'tictac'
+    has_bot = True
+    full = tictactoe.FULL
+
+    def initial_state(self):
+        return {
+            'last_move': tictactoe.O,
+            'x': 0,
+            'o': 0,
+        }
+
+    def masks(self, state):
+        """Return (x, o), reading legacy list-of-lists boards too."""
+        board = state.get('board')
+        if board is not None:
+            return tictactoe.from_rows(board)
+        return state.get('x', 0), state.get('o', 0)
+
+    def parse_move(self, text):
+        return moves.parse_move(text)
+
+    def apply_move(self, state, move):
+        piece = self.next_piece(state)
+        x, o = self.masks(state)
+        board = tictactoe.play(x, o, move, piece)
+        if board is None:
+            return None
+        return {
+            'last_move': piece,
+            'x': board[0],
+            'o': board[1],
+        }
+
+    def outcome(self, state):
+        return tictactoe.outcome(*self.masks(state))
+
+    def forced_outcome(self, state):
+        from . import solver
+        x, o = self.masks(state)
+        result = solver.forced_outcome(x, o)
+        if result is None:
+            # Unreachable boards aren't in the table.
+            return tictactoe.outcome(x, o)
+        return result
+
+    def render(self, state, theme=None):
+        x, o = self.masks(state)
+        return rendering.render(x, o, theme or rendering.default_theme())
+
+    def bot_move(self, state):
+        # The solver builds its symmetry tables on import; only games
+        # against the bot need them.
+        from . import solver
+        x, o = self.masks(state)
+        cell = solver.best_move(x, o)
+        if cell is None:
+            cell = next(
+                cell for cell in tictactoe.CELLS
+                if not (x | o) & tictactoe.cell_bit(cell)
+            )
+        return cell
+
+
+class MNKEngine(Engine):
+    """
+    An m,n,k-game: get `k` in a row on a `width` by `height` board. With
+    `gravity`, a move names a column and the piece drops to the lowest
+    free row, as in Connect Four; otherwise a move names a cell such as
+    "h8" (column letter, then row number counted from the top).
+
+    Each side is a bitmask of width * height bits, with the cell at (row,
+    col) at bit row * width + col. The state also records the last cell
+    played, so the outcome only has to check the four lines through it.
+    """
+    width = 15
+    height = 15
+    k = 5
+    gravity = False
+
+    DIRECTIONS = ((0, 1), (1, 0), (1, 1), (1, -1))
+
+    _CELL = re.compile(r'^([a-z])\s*(\d+)$')
+    _CELL_REVERSED = re.compile(r'^(\d+)\s*([a-z])$')
+
+    @property
+    def full(self):
+        return (1 << self.width * self.height) - 1
+
+    def initial_state(self):
+        return {
+            'last_move': tictactoe.O,
+            'x': 0,
+            'o': 0,
+            'last': None,
+        }
+
+    def parse_move(self, text):
+        text = moves.normalize(text)
+        if self.gravity:
+            if text.isdigit() and 1 <= int(text) <= self.width:
+                return int(text) - 1
+            return None
+        match = self._CELL.match(text)
+        if match:
+            letter, number = match.groups()
+        else:
+            match = self._CELL_REVERSED.match(text)
+            if not match:
+                return None
+            number, letter = match.groups()
+        col = ord(letter) - ord('a')
+        row = int(number) - 1
+        if not (0 <= col < self.width and 0 <= row < self.height):
+            return None
+        return row * self.width + col
+
+    def apply_move(self, state, move):
+        x, o = state['x'], state['o']
+        taken = x | o
+        if self.gravity:
+            for row in range(self.height - 1, -1, -1):
+                index = row * self.width + move
+                if not taken >> index & 1:
+                    break
+            else:
+                return None
+        else:
+            index = move
+            if taken >> index & 1:
+                return None
+        piece = self.next_piece(state)
+        if piece == tictactoe.X:
+            x |= 1 << index
+        else:
+            o |= 1 << index
+        return {
+            'last_move': piece,
+            'x': x,
+            'o': o,
+            'last': index,
+        }
+
+    def completes_line(self, mask, index):
+        """True if the piece at `index` is part of `k` in a row in `mask`."""
+        row, col = divmod(index, self.width)
+        for d_row, d_col in self.DIRECTIONS:
+            count = 1
+            for sign in (1, -1):
+                r, c = row + sign * d_row, col + sign * d_col
+                while (0 <= r < self.height and 0 <= c < self.width and
+                       mask >> (r * self.width + c) & 1):
+                    count += 1
+                    if count >= self.k:
+                        return True
+                    r, c = r + sign * d_row, c + sign * d_col
+        return False
+
+    def outcome(self, state):
+        last = state.get('last')
+        if last is None:
+            return None
+        piece = state['last_move']
+        mask = state['x'] if piece == tictactoe.X else state['o']
+        if self.completes_line(mask, last):
+            return piece
+        if state['x'] | state['o'] == self.full:
+            return tictactoe.TIE
+        return None
+
+    def render(self, state, theme=None):
+        """
+        Draw the board. Boards played by coordinates get the column letters
+        above and each row's number after it; numbers in front would push
+        the rows out of line.
+        """
+        pieces = rendering.THEMES[theme or rendering.default_theme()]
+        symbols = (
+            pieces.empty + pieces.separator,
+            pieces.x + pieces.separator,
+            pieces.o + pieces.separator,
+        )
+        x, o = state['x'], state['o']
+        rows = []
+        if not self.gravity:
+            rows.append(''.join(
+                pieces.column.format(letter) + pieces.separator
+                for letter in string.ascii_lowercase[:self.width]
+            ))
+        for row in range(self.height):
+            start = row * self.width
+            cells = ''.join(
+                symbols[(x >> i & 1) | (o >> i & 1) << 1]
+                for i in range(start, start + self.width)
+            )
+            if not self.gravity:
+                cells += str(row + 1)
+            rows.append(cells)
+        return '\n'.join(rows)
+
+
+@register
+class ConnectFourEngine(MNKEngine):
+    kind = 'connectfour'
+    label = "Connect Four"
+    title = "Connect Four"
+    command = 'connect4'
+    move_argument = 'column'
+    move_help = "drop a piece into a column (1-7)"
+    width = 7
+    height = 6
+    k = 4
+    gravity = True
+
+
+@register
+class GomokuEngine(MNKEngine):
+    kind = 'gomoku'
+    label = "Gomoku"
+    title = "Gomoku"
+    command = 'gomoku'
+    move_argument = 'cell'
+    move_help = "play in an empty cell, e.g. `h8`"
+    width = 15
+    height = 15
+    k = 5
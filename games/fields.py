@@ -0,0 +1,91 @@
+"""
+Native JSON storage for game state.
+
+StateField is a jsonb column on PostgreSQL, decoded by psycopg2, and JSON
+text elsewhere. Its `contains` lookup matches games whose state includes
+the given keys and values: `@>` on PostgreSQL, which a GIN index can
+answer, and the JSON1 extension's json_extract() on SQLite.
+"""
+import json
+
+from django import forms
+from django.core.exceptions import ValidationError
+from django.db import models
+
+
+def dumps(value):
+    return json.dumps(value, separators=(',', ':'))
+
+
+class StateFormField(forms.CharField):
+    widget = forms.Textarea
+
+    def prepare_value(self, value):
+        if isinstance(value, str):
+            return value
+        return json.dumps(value, indent=2, sort_keys=True)
+
+    def to_python(self, value):
+        value = super(StateFormField, self).to_python(value)
+        try:
+            return json.loads(value)
+        except ValueError:
+            raise ValidationError("Enter valid JSON.", code='invalid')
+
+
+class StateField(models.Field):
+    description = "JSON data, stored as jsonb on PostgreSQL"
+
+    def db_type(self, connection):
+        if connection.vendor == 'postgresql':
+            return 'jsonb'
+        return 'text'
+
+    def from_db_value(self, value, expression, connection, context):
+        # psycopg2 decodes jsonb itself.
+        if isinstance(value, str):
+            return json.loads(value)
+        return value
+
+    def to_python(self, value):
+        if isinstance(value, str):
+            try:
+                return json.loads(value)
+            except ValueError:
+                raise ValidationError("Enter valid JSON.", code='invalid')
+        return value
+
+    def get_prep_value(self, value):
+        if value is None:
+            return None
+        return dumps(value)
+
+    def value_to_string(self, obj):
+        return dumps(self.value_from_object(obj))
+
+    def formfield(self, **kwargs):
+        defaults = {'form_class': StateFormField}
+        defaults.update(kwargs)
+        return super(StateField, self).formfield(**defaults)
+
+
+@StateField.register_lookup
+class Contains(models.Lookup):
+    """`state__contains={'last_move': 'X'}`: the state has these values."""
+    lookup_name = 'contains'
+
+    def get_prep_lookup(self):
+        return self.rhs
+
+    def as_postgresql(self, compiler, connection):
+        lhs, params = self.process_lhs(compiler, connection)
+        return '{} @> %s::jsonb'.format(lhs), params + [dumps(self.rhs)]
+
+    def as_sql(self, compiler, connection):
+        # Through the JSON1 extension; flat keys with scalar values only.
+        lhs, params = self.process_lhs(compiler, connection)
+        clauses = []
+        for key, value in sorted(self.rhs.items()):
+            clauses.append('json_extract({}, %s) = %s'.format(lhs))
+            params.extend(['$.{}'.format(key), value])
+        return '({})'.format(' AND '.join(clauses) or '1 = 1'), params
@@ -0,0 +1,57 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from games import archive
+
+
+class Command(BaseCommand):
+    help = (
+        "Move finished games and their players out of the live tables, in "
+        "batches, to the archive table or a JSON Lines file."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=None,
+            help="Games per batch (TINTG_ARCHIVE_BATCH_SIZE).",
+        )
+        parser.add_argument(
+            '--pause', type=float, default=None,
+            help="Seconds to sleep between batches (TINTG_ARCHIVE_PAUSE).",
+        )
+        parser.add_argument(
+            '--limit', type=int, default=None,
+            help="Stop after archiving this many games.",
+        )
+        parser.add_argument(
+            '--jsonl', metavar='PATH',
+            help="Append records to this file instead of the archive table.",
+        )
+        parser.add_argument(
+            '--every', type=float, default=None, metavar='SECONDS',
+            help="Keep running, archiving again every SECONDS.",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            self.run(options)
+            if not options['every']:
+                break
+            time.sleep(options['every'])
+
+    def run(self, options):
+        output = None
+        if options['jsonl']:
+            output = open(options['jsonl'], 'a')
+        try:
+            archived = archive.archive_finished(
+                size=options['batch_size'],
+                delay=options['pause'],
+                limit=options['limit'],
+                output=output,
+            )
+        finally:
+            if output is not None:
+                output.close()
+        self.stdout.write("Archived {} finished games.".format(archived))
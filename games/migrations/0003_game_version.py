@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.5 on 2026-10-18 12:09
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('games', '0002_game_is_active'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='game',
+            name='version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.5 on 2026-10-18 12:11
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+from ._indexes import (
+    CREATE_ACTIVE_INDEX,
+    DROP_ACTIVE_INDEX,
+    PARTIAL_INDEX_VENDORS,
+)
+
+
+def deactivate_duplicate_games(apps, schema_editor):
+    """Keep only the newest active game in each channel."""
+    Game = apps.get_model('games', 'Game')
+    seen = set()
+    duplicates = []
+    active = Game.objects.filter(is_active=True).order_by('-id')
+    for game_id, channel in active.values_list('id', 'channel'):
+        if channel in seen:
+            duplicates.append(game_id)
+        seen.add(channel)
+    Game.objects.filter(id__in=duplicates).update(is_active=False)
+
+
+def create_active_index(apps, schema_editor):
+    if schema_editor.connection.vendor in PARTIAL_INDEX_VENDORS:
+        schema_editor.execute(CREATE_ACTIVE_INDEX)
+
+
+def drop_active_index(apps, schema_editor):
+    if schema_editor.connection.vendor in PARTIAL_INDEX_VENDORS:
+        schema_editor.execute(DROP_ACTIVE_INDEX)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('games', '0003_game_version'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='game',
+            index_together=set([('channel', 'is_active')]),
+        ),
+        migrations.RunPython(
+            deactivate_duplicate_games,
+            migrations.RunPython.noop,
+        ),
+        migrations.RunPython(create_active_index, drop_active_index),
+    ]
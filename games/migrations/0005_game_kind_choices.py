@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.5 on 2026-10-18 12:17
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+from ._indexes import restore_active_index
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('games', '0004_one_active_game_per_channel'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='game',
+            name='kind',
+            field=models.CharField(choices=[('tictactoe', 'Tic-tac-toe'), ('connectfour', 'Connect Four'), ('gomoku', 'Gomoku')], max_length=100),
+        ),
+        # SQLite rebuilds the table to alter a column, which drops the partial
+        # unique index added in 0004.
+        migrations.RunPython(restore_active_index, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.5 on 2026-10-18 12:28
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('games', '0005_game_kind_choices'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedGame',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('game_id', models.PositiveIntegerField(unique=True)),
+                ('kind', models.CharField(max_length=100)),
+                ('channel', models.CharField(blank=True, max_length=100)),
+                ('outcome', models.CharField(blank=True, max_length=3)),
+                ('state', models.TextField()),
+                ('players', models.TextField()),
+                ('archived', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
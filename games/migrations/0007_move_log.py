@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.5 on 2026-10-18 12:30
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+from ._indexes import restore_active_index
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('games', '0006_archivedgame'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Move',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ply', models.PositiveSmallIntegerField()),
+                ('move', models.PositiveSmallIntegerField()),
+            ],
+        ),
+        migrations.AddField(
+            model_name='archivedgame',
+            name='moves',
+            field=models.TextField(default='[]'),
+        ),
+        migrations.AddField(
+            model_name='game',
+            name='checkpoint_ply',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='game',
+            name='ply',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='move',
+            name='game',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='games.Game'),
+        ),
+        migrations.AddField(
+            model_name='move',
+            name='player',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='games.Player'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='move',
+            unique_together=set([('game', 'ply')]),
+        ),
+        # Adding columns to games_game rebuilds the table on SQLite, which
+        # drops the partial unique index from 0004.
+        migrations.RunPython(restore_active_index, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.5 on 2026-10-18 12:32
+from __future__ import unicode_literals
+
+from django.db import migrations
+import games.fields
+
+from ._indexes import restore_active_index
+
+# GIN index for `state__contains` lookups on PostgreSQL.
+CREATE_STATE_INDEX = (
+    'CREATE INDEX games_game_state_gin '
+    'ON games_game USING gin (state jsonb_path_ops)'
+)
+
+DROP_STATE_INDEX = 'DROP INDEX IF EXISTS games_game_state_gin'
+
+
+def convert_legacy_boards(apps, schema_editor):
+    """
+    Store list-of-lists tic-tac-toe boards as x and o masks, so every state
+    can be queried the same way in the database.
+    """
+    from games import tictactoe
+    Game = apps.get_model('games', 'Game')
+    for game in Game.objects.only('id', 'state').iterator():
+        state = game.state
+        if not isinstance(state, dict) or 'board' not in state:
+            continue
+        x, o = tictactoe.from_rows(state['board'])
+        Game.objects.filter(id=game.id).update(state={
+            'last_move': state.get('last_move', tictactoe.O),
+            'x': x,
+            'o': o,
+        })
+
+
+def create_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(CREATE_STATE_INDEX)
+    # SQLite rebuilds the table to alter a column, which drops the partial
+    # unique index added in 0004.
+    restore_active_index(apps, schema_editor)
+
+
+def drop_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(DROP_STATE_INDEX)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('games', '0007_move_log'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            convert_legacy_boards,
+            migrations.RunPython.noop,
+        ),
+        migrations.AlterField(
+            model_name='game',
+            name='state',
+            field=games.fields.StateField(default=dict),
+        ),
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
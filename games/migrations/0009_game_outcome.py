@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.5 on 2026-10-18 12:57
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+from ._indexes import restore_active_index
+
+
+def backfill_outcomes(apps, schema_editor):
+    """
+    Record the result on games that have already ended, from their final
+    boards. Games forfeited before now stay blank: the board doesn't say
+    who forfeited.
+    """
+    from games import engines
+    Game = apps.get_model('games', 'Game')
+    finished = Game.objects.filter(is_active=False).only('id', 'kind', 'state')
+    for game in finished.iterator():
+        try:
+            outcome = engines.get(game.kind).outcome(game.state)
+        except KeyError:
+            # A kind whose engine is no longer registered.
+            continue
+        if outcome:
+            Game.objects.filter(id=game.id).update(outcome=outcome)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('games', '0008_native_json_state'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='game',
+            name='outcome',
+            field=models.CharField(blank=True, max_length=3),
+        ),
+        # SQLite rebuilds the table to add a column, which drops the
+        # partial unique index added in 0004.
+        migrations.RunPython(restore_active_index, migrations.RunPython.noop),
+        migrations.RunPython(backfill_outcomes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.5 on 2026-10-18 13:00
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+from ._indexes import CREATE_FILLED_INDEX, DROP_FILLED_INDEX
+
+
+def create_filled_index(apps, schema_editor):
+    sql = CREATE_FILLED_INDEX.get(schema_editor.connection.vendor)
+    if sql:
+        schema_editor.execute(sql)
+
+
+def drop_filled_index(apps, schema_editor):
+    if schema_editor.connection.vendor in CREATE_FILLED_INDEX:
+        schema_editor.execute(DROP_FILLED_INDEX)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('games', '0009_game_outcome'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_filled_index, drop_filled_index),
+    ]
@@ -1,9 +1,13 @@
-import collections
-from django.db import models
-from jsonfield import JSONField
+from django.conf import settings
+from django.db import IntegrityError, connections, models, transaction
+
+from . import engines, moves, rendering, snapshots, tictactoe
+from .fields import StateField
 
 
 class Player(models.Model):
+    BOT_NAME = 'tintg'
+    BOT_USER_ID = 'tintg-bot'
 
     game = models.ForeignKey('Game')
     name = models.CharField(max_length=100, blank=True)
@@ -17,159 +21,301 @@ class Player(models.Model):
             return self.remote_user_id
         return "Player"
 
+    @property
+    def is_bot(self):
+        return self.remote_user_id == self.BOT_USER_ID
+
 
 class GameManager(models.Manager):
 
+    def active_for_channel(self, channel):
+        """Return the active game in `channel`, or None if there isn't one."""
+        return self.filter(channel=channel, is_active=True).first()
+
     def start_game(self, kind, channel):
-        game = self.create(kind=kind, channel=channel, is_active=True)
-        if kind == Game.TICTACTOE:
-            game.state = {
-                'last_move': 'O',
-                'board': [[0,0,0],[0,0,0],[0,0,0]]
-            }
-            game.save()
-        return game
+        """
+        Start a game of `kind` in `channel`. Returns None if another game
+        became active in the channel first.
+        """
+        state = engines.get(kind).initial_state()
+        try:
+            with transaction.atomic():
+                return self.create(
+                    kind=kind,
+                    channel=channel,
+                    is_active=True,
+                    state=state,
+                )
+        except IntegrityError:
+            return None
+
+    def full_boards(self):
+        """
+        Games whose board has no empty cells, found by the database from the
+        JSON state with the games_game_filled expression index (migration
+        0010). The stored state of an active game can lag its move log, but
+        a board only fills on the move that ends the game, and that move is
+        always checkpointed, so the stored state answers this exactly.
+        SQLite can't add masks wider than 63 bits, so gomoku games are left
+        out there.
+        """
+        # Must match the indexed expression, or the index isn't used.
+        postgres = connections[self.db].vendor == 'postgresql'
+        if postgres:
+            filled = (
+                "((games_game.state->>'x')::numeric + "
+                "(games_game.state->>'o')::numeric)"
+            )
+        else:
+            filled = (
+                "(json_extract(games_game.state, '$.x') + "
+                "json_extract(games_game.state, '$.o'))"
+            )
+        clauses = []
+        params = []
+        for kind, engine in engines.ENGINES.items():
+            if not postgres and engine.full.bit_length() > 63:
+                continue
+            # x and o never share a cell, so x + o is x | o.
+            clauses.append('(games_game.kind = %s AND {} = %s)'.format(filled))
+            params += [kind, engine.full]
+        return self.get_queryset().extra(
+            where=['({})'.format(' OR '.join(clauses) or '1 = 0')],
+            params=params,
+        )
 
 
 class Game(models.Model):
-    TICTACTOE = 'tictactoe'
-
-    MOVE_OPTIONS = {
-        1: ['upper left', 'top left', 'top left corner', 'upper left corner'],
-        2: ['top mid', 'top middle', 'upper mid', 'upper middle'],
-        3: ['top right', 'upper right', 'top right corner', 'upper right corner'],
-        4: ['middle left', 'mid left', 'center left'],
-        5: ['middle middle', 'middle', 'center'],
-        6: ['middle right', 'center right', 'mid right'],
-        7: ['bottom left', 'bot left', 'bot left corner', 'lower left', 'lower left corner', 'bottom left corner'],
-        8: ['bottom middle', 'bot middle', 'bot middle', 'lower middle', 'lower mid', 'bottom mid', 'bot mid'],
-        9: ['bottom right', 'bot right', 'bot right corner', 'lower right', 'lower right corner', 'bottom right corner'],
-    }
-
-    GAME_TYPES = (
-        (TICTACTOE, "Tic-tac-toe"),
-    )
+    TICTACTOE = engines.TicTacToeEngine.kind
+    CONNECT_FOUR = engines.ConnectFourEngine.kind
+    GOMOKU = engines.GomokuEngine.kind
+
+    MOVE_OPTIONS = moves.MOVE_OPTIONS
+
+    GAME_TYPES = engines.Choices()
 
     kind = models.CharField(max_length=100, choices=GAME_TYPES)
-    state = JSONField(
-        load_kwargs={'object_pairs_hook': collections.OrderedDict},
-    )
+    # The state as of move `checkpoint_ply`. Moves since then are in the
+    # move log and replayed when the game is loaded; see from_db().
+    state = StateField(default=dict)
+    ply = models.PositiveSmallIntegerField(default=0)
+    checkpoint_ply = models.PositiveSmallIntegerField(default=0)
     channel = models.CharField(max_length=100, blank=True)
     is_active = models.BooleanField(default=False)
+    # Bumped on every write, so concurrent movers can compare-and-swap.
+    version = models.PositiveIntegerField(default=0)
+    # The winning piece or 'tie', set when the game ends; blank while it is
+    # on, or if it was abandoned.
+    outcome = models.CharField(max_length=3, blank=True)
 
     objects = GameManager()
 
-    def board_state_to_slack(self):
-        text = ""
-        board = self.state.get('board')
-        for index, row in enumerate(board):
-            for space in row:
-                if space == 0:
-                    text += ':white_medium_square: '
-                if space == 'X':
-                    text += ':x: '
-                if space == 'O':
-                    text += ':o: '
-            if index < 2:
-                text += '\n'
-        return text
+    class Meta:
+        index_together = [
+            ('channel', 'is_active'),
+        ]
+
+    REPLAY_FIELDS = frozenset(['kind', 'state', 'ply', 'checkpoint_ply'])
+
+    def __init__(self, *args, **kwargs):
+        super(Game, self).__init__(*args, **kwargs)
+        # (move, player) pairs applied in memory but not yet logged.
+        self.unsaved_moves = []
+
+    @classmethod
+    def from_db(cls, db, field_names, values, moves=None):
+        """
+        Load a game, replaying the moves since its checkpoint. `moves`, if
+        given, are those moves, already read alongside the row.
+        """
+        game = super(Game, cls).from_db(db, field_names, values)
+        # Only when the checkpoint was loaded; with .only() or .defer() the
+        # caller replays if it needs to.
+        if cls.REPLAY_FIELDS.issubset(field_names) and \
+                game.ply > game.checkpoint_ply:
+            game.replay(moves)
+        return game
+
+    @staticmethod
+    def pending_moves_sql(vendor):
+        """
+        SQL for a comma-separated list of ply:move pairs since the
+        checkpoint of the joined games_game row, or NULL if there are none.
+        SQLite doesn't promise group_concat's order, so parse_moves() sorts.
+        """
+        if vendor == 'postgresql':
+            return (
+                "SELECT string_agg(games_move.ply || ':' || games_move.move, "
+                "',' ORDER BY games_move.ply) FROM games_move "
+                "WHERE games_move.game_id = games_game.id "
+                "AND games_move.ply > games_game.checkpoint_ply"
+            )
+        return (
+            "SELECT group_concat(games_move.ply || ':' || games_move.move) "
+            "FROM games_move WHERE games_move.game_id = games_game.id "
+            "AND games_move.ply > games_game.checkpoint_ply"
+        )
+
+    @staticmethod
+    def parse_moves(pending):
+        """The moves in a pending_moves_sql() value, in ply order."""
+        if not pending:
+            return []
+        pairs = sorted(
+            tuple(int(part) for part in pair.split(':'))
+            for pair in str(pending).split(',')
+        )
+        return [move for ply, move in pairs]
+
+    def replay(self, moves=None):
+        """Bring `state` up to date from the checkpoint and the move log."""
+        if moves is None:
+            moves = self.move_set.filter(
+                ply__gt=self.checkpoint_ply,
+            ).order_by('ply').values_list('move', flat=True)
+        for move in moves:
+            self.state = self.engine.apply_move(self.state, move)
+
+    def rebuild(self):
+        """
+        Return the state rebuilt from the initial position and the whole
+        move log. Games started before the log existed can't be rebuilt.
+        """
+        state = self.engine.initial_state()
+        for move in self.move_set.order_by('ply').values_list(
+            'move', flat=True,
+        ):
+            state = self.engine.apply_move(state, move)
+        return state
+
+    def checkpoint_due(self):
+        """True if the next write should include the full state."""
+        return (
+            not self.is_active or
+            self.ply - self.checkpoint_ply >= checkpoint_interval()
+        )
+
+    def logged_moves(self):
+        """Move rows for the unsaved moves, clearing the list."""
+        first = self.ply - len(self.unsaved_moves) + 1
+        rows = [
+            Move(game=self, ply=ply, move=move, player=player)
+            for ply, (move, player) in enumerate(self.unsaved_moves, first)
+        ]
+        self.unsaved_moves = []
+        return rows
+
+    def save(self, *args, **kwargs):
+        # A full save writes the whole state, so it is always a checkpoint.
+        self.version += 1
+        self.checkpoint_ply = self.ply
+        with transaction.atomic():
+            super(Game, self).save(*args, **kwargs)
+            if self.unsaved_moves:
+                Move.objects.bulk_create(self.logged_moves())
+        snapshots.delete(self.channel)
+
+    @property
+    def engine(self):
+        return engines.get(self.kind)
+
+    def get_board(self):
+        """Return the (x, o) bitboards for a tic-tac-toe game."""
+        return self.engine.masks(self.state)
+
+    def board_state_to_slack(self, theme=None):
+        return self.engine.render(self.state, theme)
+
+    @classmethod
+    def render_board(cls, x, o, theme=None):
+        return rendering.render(x, o, theme or rendering.default_theme())
 
     def make_move_if_valid(self, move):
-        board = self.state.get('board')
-        last_move = self.state.get('last_move')
-        move = move.lower()
-        is_valid = False
-        if last_move == 'O':
-            piece = 'X'
-        else:
-            piece = 'O'
-        if move == '1' or move in self.MOVE_OPTIONS[1]:
-            if board[0][0] == 0:
-                is_valid = True
-                board[0][0] = piece
-                last_move = piece
-        if move == '2' or move in self.MOVE_OPTIONS[2]:
-            if board[0][1] == 0:
-                is_valid = True
-                board[0][1] = piece
-                last_move = piece
-        if move == '3' or move in self.MOVE_OPTIONS[3]:
-            if board[0][2] == 0:
-                is_valid = True
-                board[0][2] = piece
-                last_move = piece
-        if move == '4' or move in self.MOVE_OPTIONS[4]:
-            if board[1][0] == 0:
-                is_valid = True
-                board[1][0] = piece
-                last_move = piece
-        if move == '5' or move in self.MOVE_OPTIONS[5]:
-            if board[1][1] == 0:
-                is_valid = True
-                board[1][1] = piece
-                last_move = piece
-        if move == '6' or move in self.MOVE_OPTIONS[6]:
-            if board[1][2] == 0:
-                is_valid = True
-                board[1][2] = piece
-                last_move = piece
-        if move == '7' or move in self.MOVE_OPTIONS[7]:
-            if board[2][0] == 0:
-                is_valid = True
-                board[2][0] = piece
-                last_move = piece
-        if move == '8' or move in self.MOVE_OPTIONS[8]:
-            if board[2][1] == 0:
-                is_valid = True
-                board[2][1] = piece
-                last_move = piece
-        if move == '9' or move in self.MOVE_OPTIONS[9]:
-            if board[2][2] == 0:
-                is_valid = True
-                board[2][2] = piece
-                last_move = piece
-        self.state['board'] = board
-        self.state['last_move'] = last_move
+        if not self.apply_move(move):
+            return False
         self.save()
-        return is_valid
+        return True
+
+    def apply_move(self, move, player=None):
+        """
+        Play the move in the text `move` on the in-memory state without
+        saving the game. Legacy tic-tac-toe boards are stored in the compact
+        form from here on.
+        """
+        parsed = self.engine.parse_move(move)
+        if parsed is None:
+            return False
+        return self.play_parsed(parsed, player)
+
+    def play_parsed(self, move, player=None):
+        """Like apply_move(), for a move the engine has already parsed."""
+        state = self.engine.apply_move(self.state, move)
+        if state is None:
+            return False
+        self.state = state
+        self.ply += 1
+        self.unsaved_moves.append((move, player))
+        return True
 
     def is_won(self):
-        board = self.state.get('board')
-        row_tie = False
-        # check rows
-        for row in board:
-            if len(set(row)) == 1:
-                row_tie = False
-                if list(set(row))[0] != 0:
-                    return True
-            elif not 0 in list(set(row)):
-                    row_tie = True
-        # check columns
-        column_tie = False
-        column_sets = [
-            set([board[0][0], board[1][0], board[2][0]]),
-            set([board[0][1], board[1][1], board[2][1]]),
-            set([board[0][2], board[1][2], board[2][2]]),
-        ]
-        for column in column_sets:
-            if len(column) == 1:
-                if list(column)[0] != 0:
-                    return True
-            elif 0 not in list(column):
-                column_tie = True
-        # check diagonals
-        diagonal_tie = False
-        diagonal_sets = [
-            set([board[0][0], board[1][1], board[2][2]]),
-            set([board[0][2], board[1][1], board[2][0]]),
-        ]
-        for diagonal in diagonal_sets:
-            if len(diagonal) == 1:
-                if list(diagonal)[0] != 0:
-                    return True
-            elif not 0 in list(diagonal):
-                diagonal_tie = True
-        if row_tie and column_tie and diagonal_tie:
+        result = self.engine.outcome(self.state)
+        if result == tictactoe.TIE:
             return 'tie'
-        return False
+        return result is not None
+
+    def piece_of(self, player):
+        """The piece `player` plays: the current player moves next."""
+        piece = self.engine.next_piece(self.state)
+        return piece if player.is_current else tictactoe.other(piece)
+
+    def is_decided(self):
+        """
+        Return 'tie' if nobody can win any more, the piece that can force a
+        win if one can, or None while the game is still open.
+        """
+        result = self.engine.forced_outcome(self.state)
+        if result == tictactoe.TIE:
+            return 'tie'
+        return result
+
 
+def checkpoint_interval():
+    return getattr(settings, 'TINTG_CHECKPOINT_INTERVAL', 4)
+
+
+class Move(models.Model):
+    """One move, in the append-only log each game's state is replayed from."""
+    game = models.ForeignKey(Game)
+    ply = models.PositiveSmallIntegerField()
+    # The engine's parsed move: a cell, column or board index.
+    move = models.PositiveSmallIntegerField()
+    player = models.ForeignKey(Player, null=True, blank=True)
+
+    class Meta:
+        unique_together = [
+            ('game', 'ply'),
+        ]
+
+    def __str__(self):
+        return "{} in game {}".format(self.ply, self.game_id)
+
+
+class ArchivedGame(models.Model):
+    """
+    A finished game moved out of the live tables by games.archive. The
+    state and players are stored as compact JSON text.
+    """
+    game_id = models.PositiveIntegerField(unique=True)
+    kind = models.CharField(max_length=100)
+    channel = models.CharField(max_length=100, blank=True)
+    # The winning piece, 'tie', or blank if the game was abandoned.
+    outcome = models.CharField(max_length=3, blank=True)
+    state = models.TextField()
+    # [[name, remote_user_id, is_current], ...] in player id order.
+    players = models.TextField()
+    # [[move, player index or null], ...] in ply order.
+    moves = models.TextField(default='[]')
+    archived = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return "{} in {} ({})".format(self.kind, self.channel, self.game_id)
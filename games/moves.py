@@ -0,0 +1,99 @@
+"""
+Move parsing shared by every game kind.
+
+Each parser builds its alias lookup once, so resolving a move is a single
+dict lookup on the normalized text, with an optional second lookup in a
+precomputed table of every alias one typo away.
+"""
+import re
+import string
+import types
+
+from django.utils.functional import cached_property
+
+
+MOVE_OPTIONS = {
+    1: ['upper left', 'top left', 'top left corner', 'upper left corner'],
+    2: ['top mid', 'top middle', 'upper mid', 'upper middle'],
+    3: ['top right', 'upper right', 'top right corner', 'upper right corner'],
+    4: ['middle left', 'mid left', 'center left'],
+    5: ['middle middle', 'middle', 'center'],
+    6: ['middle right', 'center right', 'mid right'],
+    7: ['bottom left', 'bot left', 'bot left corner', 'lower left', 'lower left corner', 'bottom left corner'],
+    8: ['bottom middle', 'bot middle', 'bot middle', 'lower middle', 'lower mid', 'bottom mid', 'bot mid'],
+    9: ['bottom right', 'bot right', 'bot right corner', 'lower right', 'lower right corner', 'bottom right corner'],
+}
+
+FUZZY_ALPHABET = string.ascii_lowercase + string.digits + ' '
+
+_NOISE = re.compile(r'[^a-z0-9]+')
+
+
+def normalize(text):
+    """Lowercase `text` and collapse whitespace, punctuation and @s."""
+    return ' '.join(_NOISE.sub(' ', text.lower()).split())
+
+
+def edits(word, alphabet=FUZZY_ALPHABET):
+    """Yield every string one deletion, swap, substitution or insertion away."""
+    for index in range(len(word) + 1):
+        left, right = word[:index], word[index:]
+        if right:
+            yield left + right[1:]
+            if len(right) > 1:
+                yield left + right[1] + right[0] + right[2:]
+            for char in alphabet:
+                yield left + char + right[1:]
+        for char in alphabet:
+            yield left + char + right
+
+
+class MoveParser(object):
+    """
+    Resolve free-form move text to a move key, such as a tic-tac-toe cell.
+
+    `options` maps each move key to a list of aliases; the key itself is
+    always accepted as an alias. Aliases shorter than `min_fuzzy_length`
+    are never fuzzy-matched, so "1" does not also accept "7".
+    """
+
+    def __init__(self, options, min_fuzzy_length=4):
+        aliases = {}
+        for key, names in options.items():
+            aliases[normalize(str(key))] = key
+            for name in names:
+                aliases[normalize(name)] = key
+        self.aliases = types.MappingProxyType(aliases)
+        self.min_fuzzy_length = min_fuzzy_length
+
+    @cached_property
+    def fuzzy_aliases(self):
+        fuzzy = {}
+        ambiguous = set()
+        for alias, key in self.aliases.items():
+            if len(alias) < self.min_fuzzy_length:
+                continue
+            for variant in edits(alias):
+                if fuzzy.setdefault(variant, key) != key:
+                    ambiguous.add(variant)
+        for variant in ambiguous:
+            del fuzzy[variant]
+        for alias in self.aliases:
+            fuzzy.pop(alias, None)
+        return types.MappingProxyType(fuzzy)
+
+    def parse(self, text, fuzzy=True):
+        """Return the move key for `text`, or None if it isn't recognized."""
+        text = normalize(text)
+        key = self.aliases.get(text)
+        if key is None and fuzzy:
+            key = self.fuzzy_aliases.get(text)
+        return key
+
+
+tictactoe_moves = MoveParser(MOVE_OPTIONS)
+
+
+def parse_move(text, fuzzy=True):
+    """Return the tic-tac-toe cell (1-9) named by `text`, or None."""
+    return tictactoe_moves.parse(text, fuzzy=fuzzy)
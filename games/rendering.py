@@ -0,0 +1,48 @@
+"""
+Board rendering.
+
+A tic-tac-toe board has at most 3^9 positions, so rendered boards are
+memoized on (theme, x, o) and each move or show only pays for a cache
+lookup.
+"""
+import collections
+import functools
+
+from django.conf import settings
+
+
+# `column` formats a column letter for the header of boards played by
+# coordinates, as wide as a cell.
+Theme = collections.namedtuple(
+    'Theme', ['empty', 'x', 'o', 'separator', 'column'],
+)
+
+THEMES = {
+    'slack': Theme(':white_medium_square:', ':x:', ':o:', ' ',
+                   ':regional_indicator_{}:'),
+    'ascii': Theme('.', 'X', 'O', ' ', '{}'),
+    'hearts': Theme(':white_heart:', ':heart:', ':blue_heart:', ' ',
+                    ':regional_indicator_{}:'),
+}
+
+DEFAULT_THEME = 'slack'
+
+RENDER_CACHE_SIZE = 4096
+
+
+def default_theme():
+    return getattr(settings, 'TINTG_BOARD_THEME', DEFAULT_THEME)
+
+
+@functools.lru_cache(maxsize=RENDER_CACHE_SIZE)
+def render(x, o, theme=DEFAULT_THEME):
+    """Render the board held in the (x, o) masks using the named theme."""
+    pieces = THEMES[theme]
+    # Indexed by (x bit | o bit << 1) for each cell.
+    symbols = (
+        pieces.empty + pieces.separator,
+        pieces.x + pieces.separator,
+        pieces.o + pieces.separator,
+    )
+    cells = [symbols[(x >> i & 1) | (o >> i & 1) << 1] for i in range(9)]
+    return '\n'.join(''.join(cells[i:i + 3]) for i in (0, 3, 6))
@@ -0,0 +1,273 @@
+"""
+Request-path operations on games that need to keep database round trips
+to a minimum.
+"""
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import BooleanField, Case, CharField, F, Value, When
+
+from . import snapshots, tictactoe
+from .models import Game, Move, Player
+
+
+NO_GAME = 'no_game'
+NO_PLAYERS = 'no_players'
+WRONG_TURN = 'wrong_turn'
+# The active game in the channel is another kind.
+WRONG_GAME = 'wrong_game'
+INVALID_MOVE = 'invalid_move'
+PLAYED = 'played'
+WON = 'won'
+TIE = 'tie'
+CONFLICT = 'conflict'
+BOT_PLAYED = 'bot_played'
+BOT_WON = 'bot_won'
+# The player's move left the opponent a forced win.
+LOST = 'lost'
+
+# Statuses that end the game.
+FINISHED = (WON, TIE, BOT_WON, LOST)
+
+MOVE_ATTEMPTS = 3
+
+
+class MoveResult(object):
+
+    def __init__(self, status, game=None, player=None, opponent=None,
+                 reply=None, forced=False):
+        self.status = status
+        self.game = game
+        self.player = player
+        self.opponent = opponent
+        # The cell the bot answered with, in games against the bot.
+        self.reply = reply
+        # Whether the game ended because its result was settled, before
+        # anyone completed a line or the board filled.
+        self.forced = forced
+
+
+def end_forced_games():
+    return getattr(settings, 'TINTG_END_FORCED_GAMES', True)
+
+
+def decide(game, piece):
+    """
+    Return (status, forced, outcome) for `game` after a move by `piece`:
+    WON, TIE or LOST and the winning piece or tictactoe.TIE if the game is
+    over or its result settled, else (None, False, '').
+    """
+    win_state = game.is_won()
+    if win_state == 'tie':
+        return TIE, False, tictactoe.TIE
+    if win_state:
+        return WON, False, piece
+    if not end_forced_games():
+        return None, False, ''
+    win_state = game.is_decided()
+    if win_state == 'tie':
+        return TIE, True, tictactoe.TIE
+    if win_state == piece:
+        return WON, True, piece
+    if win_state:
+        return LOST, True, win_state
+    return None, False, ''
+
+
+PLAYER_FIELDS = [field.attname for field in Player._meta.concrete_fields]
+GAME_FIELDS = [field.attname for field in Game._meta.concrete_fields]
+
+
+def load_players(channel):
+    """
+    Load the active game in `channel` and its players with a single query.
+
+    Returns (game, players). The moves since the game's last checkpoint
+    come back in the same query, so the game is replayed once without
+    reading the move log again. A second query is only made when the game
+    has no players.
+    """
+    queryset = Player.objects.filter(
+        game__channel=channel,
+        game__is_active=True,
+    )
+    rows = list(
+        queryset.extra(select={
+            'pending_moves': Game.pending_moves_sql(
+                connections[queryset.db].vendor,
+            ),
+        }).order_by('game_id', 'id').values_list(*(
+            PLAYER_FIELDS +
+            ['game__{}'.format(name) for name in GAME_FIELDS] +
+            ['pending_moves']
+        ))
+    )
+    if not rows:
+        return Game.objects.active_for_channel(channel), []
+    split = len(PLAYER_FIELDS)
+    first = rows[0]
+    game = Game.from_db(
+        queryset.db, GAME_FIELDS, first[split:-1],
+        moves=Game.parse_moves(first[-1]),
+    )
+    players = []
+    for row in rows:
+        player = Player.from_db(queryset.db, PLAYER_FIELDS, row[:split])
+        if player.game_id != game.id:
+            break
+        player.game = game
+        players.append(player)
+    return game, players
+
+
+def load_game(channel, user_name, user_id):
+    """
+    Load the active game in `channel` and its players.
+
+    Returns (game, player, opponent), where `player` is the one matching
+    `user_name` (or `user_id`, if the name doesn't match). Any of these may
+    be None.
+    """
+    game, players = load_players(channel)
+    name = user_name.strip('@')
+    player = next((p for p in players if p.name == name), None)
+    if player is None:
+        player = next(
+            (p for p in players if p.remote_user_id == user_id), None,
+        )
+    opponent = None
+    if player:
+        opponent = next((p for p in players if p.id != player.id), None)
+    return game, player, opponent
+
+
+def active_snapshot(channel):
+    """
+    Return the cached snapshot of the active game in `channel`, loading and
+    caching it on a miss. Returns None if there's no active game.
+
+    A snapshot from a process-local cache may have been overtaken by a move
+    in another worker, so it is only used if the active game's version
+    still matches; that check is one indexed query.
+    """
+    snapshot = snapshots.get(channel)
+    if snapshot is not None and not snapshots.is_shared():
+        current = Game.objects.filter(
+            channel=channel, is_active=True,
+        ).values_list('id', 'version').first()
+        if current is None:
+            snapshots.delete(channel)
+            return None
+        if current != (snapshot['id'], snapshot['version']):
+            snapshot = None
+    if snapshot is None:
+        game, players = load_players(channel)
+        if game is not None:
+            snapshot = snapshots.store(game, players)
+    return snapshot
+
+
+def play_move(channel, user_name, user_id, move, kind=None):
+    """
+    Play `move` in the active game in `channel` for the requesting user.
+    If `kind` is given and the game is another kind, nothing is played.
+
+    Reads the game and both players in one query and writes every change
+    in a single transaction: the move is appended to the move log, and the
+    game and players get one UPDATE each. The game row is
+    only written if its version hasn't changed since it was read; if
+    another move got there first, the whole move is retried against the
+    new state, up to MOVE_ATTEMPTS times.
+    """
+    for attempt in range(MOVE_ATTEMPTS):
+        result = _play_move_once(channel, user_name, user_id, move, kind)
+        if result.status != CONFLICT:
+            break
+    return result
+
+
+def _play_move_once(channel, user_name, user_id, move, kind=None):
+    game, player, opponent = load_game(channel, user_name, user_id)
+    if game is None:
+        return MoveResult(NO_GAME)
+    if kind is not None and game.kind != kind:
+        return MoveResult(WRONG_GAME, game, player, opponent)
+    if not player or not opponent:
+        return MoveResult(NO_PLAYERS, game, player, opponent)
+    remember_user = (
+        player.name == user_name.strip('@') and
+        player.remote_user_id != user_id
+    )
+    player.remote_user_id = user_id
+    forced = False
+    if not player.is_current:
+        status = WRONG_TURN
+    elif not game.apply_move(move, player):
+        status = INVALID_MOVE
+    else:
+        piece = game.state.get('last_move')
+        status, forced, game.outcome = decide(game, piece)
+        status = status or PLAYED
+        if status == LOST and opponent.is_bot:
+            status = BOT_WON
+    reply = None
+    if status == PLAYED and opponent.is_bot:
+        reply = game.engine.bot_move(game.state)
+        game.play_parsed(reply, opponent)
+        # Decided from the bot's side: its win is the player's loss.
+        status, forced, game.outcome = decide(
+            game, game.state.get('last_move'),
+        )
+        status = {
+            WON: BOT_WON, LOST: WON, None: BOT_PLAYED,
+        }.get(status, status)
+    if status in (WRONG_TURN, INVALID_MOVE) and not remember_user:
+        return MoveResult(status, game, player, opponent)
+    with transaction.atomic():
+        if status in (PLAYED, BOT_PLAYED) + FINISHED:
+            game.is_active = status in (PLAYED, BOT_PLAYED)
+            # The move log carries each move; the state itself is only
+            # written every few moves, and when the game ends.
+            changes = {}
+            if game.checkpoint_due():
+                changes = {'state': game.state, 'checkpoint_ply': game.ply}
+            if not game.is_active:
+                changes['outcome'] = game.outcome
+            swapped = Game.objects.filter(
+                id=game.id,
+                version=game.version,
+            ).update(
+                ply=game.ply,
+                is_active=game.is_active,
+                version=F('version') + 1,
+                **changes
+            )
+            if not swapped:
+                return MoveResult(CONFLICT, game, player, opponent)
+            game.version += 1
+            game.checkpoint_ply = changes.get(
+                'checkpoint_ply', game.checkpoint_ply,
+            )
+            Move.objects.bulk_create(game.logged_moves())
+        updates = {}
+        if status == PLAYED:
+            player.is_current = False
+            opponent.is_current = True
+            updates['is_current'] = Case(
+                When(id=opponent.id, then=Value(True)),
+                default=Value(False),
+                output_field=BooleanField(),
+            )
+        if remember_user:
+            updates['remote_user_id'] = Case(
+                When(id=player.id, then=Value(user_id)),
+                default=F('remote_user_id'),
+                output_field=CharField(),
+            )
+        if updates:
+            Player.objects.filter(game=game).update(**updates)
+    if status in (PLAYED, BOT_PLAYED):
+        snapshots.store(game, [player, opponent])
+    elif status in FINISHED:
+        snapshots.delete(channel)
+    return MoveResult(status, game, player, opponent, reply, forced)
+
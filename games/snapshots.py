@@ -0,0 +1,68 @@
+"""
+Cached snapshots of the active game in each channel.
+
+A snapshot holds everything needed to show a game (board, whose turn it
+is and who is playing), so read-only commands can be answered from the
+cache. The move service writes snapshots through after every move, and
+any other change to a game deletes its channel's snapshot.
+
+Those writes only reach the worker process that made them when the cache
+is process-local, like LocMemCache, so a snapshot from such a cache is
+checked against the game's version before it is used; see is_shared().
+"""
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from tintg import metrics
+
+
+def cache():
+    return caches[getattr(settings, 'TINTG_GAME_CACHE', 'default')]
+
+
+def is_shared():
+    """
+    Whether every process serving requests sees the same game cache. Set
+    TINTG_GAME_CACHE_SHARED to say so for caches this can't tell about.
+    """
+    shared = getattr(settings, 'TINTG_GAME_CACHE_SHARED', None)
+    if shared is None:
+        return not isinstance(cache(), LocMemCache)
+    return shared
+
+
+def key(channel):
+    return 'tintg:game-channel:{}'.format(channel)
+
+
+def build(game, players):
+    players = sorted(players, key=lambda p: p.id)
+    current = next((p for p in players if p.is_current), None)
+    return {
+        'id': game.id,
+        'version': game.version,
+        'kind': game.kind,
+        'state': dict(game.state),
+        'players': [str(p) for p in players],
+        'current': str(current) if current else None,
+    }
+
+
+def get(channel):
+    snapshot = cache().get(key(channel))
+    metrics.cache_result('game', snapshot is not None)
+    return snapshot
+
+
+def store(game, players):
+    snapshot = build(game, players)
+    cache().set(
+        key(game.channel),
+        snapshot,
+        getattr(settings, 'TINTG_GAME_CACHE_TIMEOUT', 600),
+    )
+    return snapshot
+
+
+def delete(channel):
+    cache().delete(key(channel))
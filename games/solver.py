@@ -0,0 +1,277 @@
+"""
+Perfect-play tic-tac-toe.
+
+Every reachable position is solved once with negamax, folded under the
+eight symmetries of the board, and written to TABLE_PATH as a sorted array
+of canonical position codes followed by one entry byte per position: the
+result and best move for the side to move, and whether X and O can still
+complete a line at all. The table is memory-mapped on first use, so forked
+workers share its pages, and a bot move or an outcome check costs a
+canonicalization and a binary search.
+
+Regenerate the table after changing anything here with
+
+    python -m games.solver
+"""
+import array
+import bisect
+import mmap
+import os
+import sys
+import threading
+
+from . import tictactoe
+
+
+TABLE_PATH = os.path.join(os.path.dirname(__file__), 'data', 'tictactoe.table')
+TABLE_MAGIC = b'TTT2'
+
+LOSS = 0
+DRAW = 1
+WIN = 2
+
+# Entry byte layout: the best cell in the low four bits, then the result,
+# then one bit per side that can still complete a line in some
+# continuation, however badly either side plays.
+RESULT_SHIFT = 4
+RESULT_MASK = 0x3
+X_LIVE = 0x40
+O_LIVE = 0x80
+
+# Board symmetries as cell permutations: the cell at index i moves to
+# SYMMETRIES[n][i]. Cells here are 0-based bit positions.
+_ROTATE = (6, 3, 0, 7, 4, 1, 8, 5, 2)
+_MIRROR = (2, 1, 0, 5, 4, 3, 8, 7, 6)
+
+
+def _compose(first, second):
+    return tuple(second[first[i]] for i in range(9))
+
+
+def _symmetries():
+    identity = tuple(range(9))
+    rotations = [identity]
+    for _ in range(3):
+        rotations.append(_compose(rotations[-1], _ROTATE))
+    return tuple(rotations + [_compose(r, _MIRROR) for r in rotations])
+
+
+SYMMETRIES = _symmetries()
+
+# For each symmetry, the image of every 9-bit mask.
+_MASK_IMAGES = tuple(
+    tuple(
+        sum(1 << perm[i] for i in range(9) if mask >> i & 1)
+        for mask in range(tictactoe.FULL + 1)
+    )
+    for perm in SYMMETRIES
+)
+
+# Base-3 digit weights of every 9-bit mask, for position codes.
+_TERNARY = tuple(
+    sum(3 ** i for i in range(9) if mask >> i & 1)
+    for mask in range(tictactoe.FULL + 1)
+)
+
+
+def code(x, o):
+    """Encode a position as a base-3 number below 3^9 (X=1, O=2)."""
+    return _TERNARY[x] + 2 * _TERNARY[o]
+
+
+def canonical(x, o):
+    """
+    Return (code, symmetry) for the smallest code among the eight images of
+    the position, and the index of the symmetry that produces it.
+    """
+    return min(
+        (code(images[x], images[o]), index)
+        for index, images in enumerate(_MASK_IMAGES)
+    )
+
+
+def to_move(x, o):
+    """X moves first, so it is X's turn whenever the counts are level."""
+    if bin(x).count('1') == bin(o).count('1'):
+        return tictactoe.X
+    return tictactoe.O
+
+
+def solve():
+    """
+    Solve every position reachable from the empty board.
+
+    Returns a dict of canonical code to (result, cell, x_live, o_live),
+    where result is WIN, DRAW or LOSS for the side to move, cell is its
+    best move (1-9, in canonical orientation) or 0 if the game is over, and
+    x_live and o_live say whether X and O can still complete a line.
+    Symmetries never swap the pieces, so liveness needs no folding.
+    """
+    results = {}
+
+    def negamax(x, o):
+        """Return (score, x_live, o_live) for the position."""
+        key, symmetry = canonical(x, o)
+        if key in results:
+            return results[key][2:]
+        images = _MASK_IMAGES[symmetry]
+        piece = to_move(x, o)
+        empties = 9 - bin(x | o).count('1')
+        if tictactoe.has_line(x) or tictactoe.has_line(o):
+            # The previous player just won; quicker wins score higher.
+            results[key] = (LOSS, 0, -(empties + 1),
+                            tictactoe.has_line(x), tictactoe.has_line(o))
+            return results[key][2:]
+        if not empties:
+            results[key] = (DRAW, 0, 0, False, False)
+            return results[key][2:]
+        best_score = best_cell = None
+        x_live = o_live = False
+        for cell in tictactoe.CELLS:
+            child = tictactoe.play(x, o, cell, piece)
+            if child is None:
+                continue
+            score, child_x_live, child_o_live = negamax(*child)
+            score = -score
+            x_live = x_live or child_x_live
+            o_live = o_live or child_o_live
+            canonical_cell = images[tictactoe.cell_bit(cell)].bit_length()
+            if best_score is None or (score, -canonical_cell) > (
+                best_score, -best_cell
+            ):
+                best_score, best_cell = score, canonical_cell
+        result = WIN if best_score > 0 else LOSS if best_score < 0 else DRAW
+        results[key] = (result, best_cell, best_score, x_live, o_live)
+        return results[key][2:]
+
+    negamax(0, 0)
+    return {
+        key: (result, cell, x_live, o_live)
+        for key, (result, cell, score, x_live, o_live) in results.items()
+    }
+
+
+def encode(results):
+    codes = array.array('H', sorted(results))
+    entries = array.array('B', (
+        results[key][0] << RESULT_SHIFT | results[key][1] |
+        (X_LIVE if results[key][2] else 0) |
+        (O_LIVE if results[key][3] else 0)
+        for key in codes
+    ))
+    if sys.byteorder == 'big':
+        codes.byteswap()
+    count = len(codes).to_bytes(2, 'little')
+    return TABLE_MAGIC + count + codes.tobytes() + entries.tobytes()
+
+
+def write_table(path=TABLE_PATH):
+    data = encode(solve())
+    with open(path, 'wb') as table:
+        table.write(data)
+    return len(data)
+
+
+class Table(object):
+    """A read-only view of an encoded table."""
+
+    def __init__(self, buffer):
+        if bytes(buffer[:4]) != TABLE_MAGIC:
+            raise ValueError("Not a tic-tac-toe table")
+        count = int.from_bytes(bytes(buffer[4:6]), 'little')
+        codes = memoryview(buffer)[6:6 + 2 * count]
+        if sys.byteorder == 'big':
+            codes = array.array('H', bytes(codes))
+            codes.byteswap()
+        else:
+            codes = codes.cast('H')
+        self.codes = codes
+        self.entries = memoryview(buffer)[6 + 2 * count:6 + 3 * count]
+
+    def __len__(self):
+        return len(self.codes)
+
+    def entry(self, key):
+        """Return the entry byte for a canonical code, or None."""
+        index = bisect.bisect_left(self.codes, key)
+        if index == len(self.codes) or self.codes[index] != key:
+            return None
+        return self.entries[index]
+
+    def lookup(self, key):
+        """Return (result, canonical cell) for a canonical code, or None."""
+        entry = self.entry(key)
+        if entry is None:
+            return None
+        return entry >> RESULT_SHIFT & RESULT_MASK, entry & 0xF
+
+
+_table = None
+_table_lock = threading.Lock()
+
+
+def table():
+    """Map the table on first use; fall back to solving in-process."""
+    global _table
+    if _table is None:
+        with _table_lock:
+            if _table is None:
+                try:
+                    with open(TABLE_PATH, 'rb') as f:
+                        buffer = mmap.mmap(
+                            f.fileno(), 0, access=mmap.ACCESS_READ,
+                        )
+                except (IOError, OSError, ValueError):
+                    buffer = encode(solve())
+                _table = Table(buffer)
+    return _table
+
+
+def analyse(x, o):
+    """
+    Return (result, cell) for the side to move in the given position:
+    result is WIN, DRAW or LOSS under perfect play, and cell is its best
+    move (0 if the game is over). Returns None for unreachable positions.
+    """
+    key, symmetry = canonical(x, o)
+    found = table().lookup(key)
+    if found is None:
+        return None
+    result, cell = found
+    if cell:
+        cell = SYMMETRIES[symmetry].index(cell - 1) + 1
+    return result, cell
+
+
+def forced_outcome(x, o):
+    """
+    Return how the position must end, as soon as that is settled: X or O
+    once that side has won or can force a win whatever the other plays,
+    tictactoe.TIE once neither side can complete a line however the game
+    goes on, and None while it is open. Unreachable positions give None.
+    """
+    key, symmetry = canonical(x, o)
+    entry = table().entry(key)
+    if entry is None:
+        return None
+    result = entry >> RESULT_SHIFT & RESULT_MASK
+    if result == WIN:
+        return to_move(x, o)
+    if result == LOSS:
+        # Including a finished game: the side that just moved has won.
+        return tictactoe.other(to_move(x, o))
+    if not entry & (X_LIVE | O_LIVE):
+        return tictactoe.TIE
+    return None
+
+
+def best_move(x, o):
+    """Return the perfect-play cell (1-9) for the side to move, or None."""
+    found = analyse(x, o)
+    if not found or not found[1]:
+        return None
+    return found[1]
+
+
+if __name__ == '__main__':
+    print('Wrote {} bytes to {}'.format(write_table(), TABLE_PATH))
@@ -1,6 +1,20 @@
-from django.test import TestCase
-from .factories import GameFactory
-from .models import Game
+import importlib
+import io
+import json
+import threading
+import unittest
+from unittest import mock
+
+from django.apps import apps
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import IntegrityError, connection
+from django.db.models import F
+from django.test import TestCase, TransactionTestCase
+from .factories import GameFactory, PlayerFactory
+from .migrations import _indexes
+from .models import ArchivedGame, Game, Move, Player
+from . import archive, engines, moves, rendering, services, snapshots, solver, tictactoe
 
 
 class GameModelTests(TestCase):
@@ -9,10 +23,14 @@ class GameModelTests(TestCase):
         for i in range(1, 10):
             game = Game.objects.start_game(kind=Game.TICTACTOE, channel='test')
             self.assertTrue(game.make_move_if_valid(str(i)))
+            game.is_active = False
+            game.save()
             for move in Game.MOVE_OPTIONS[i]:
                 game = Game.objects.start_game(
                     kind=Game.TICTACTOE, channel='test',
                 )
+                game.is_active = False
+                game.save()
                 self.assertTrue(game.make_move_if_valid(move))
             for move in Game.MOVE_OPTIONS[i]:
                 game = Game.objects.create(
@@ -110,4 +128,949 @@ class GameModelTests(TestCase):
         )
         self.assertEqual(game.is_won(), 'tie')
 
+    def test_active_for_channel(self):
+        self.assertIsNone(Game.objects.active_for_channel('C1'))
+        GameFactory.create(channel='C1', is_active=False)
+        self.assertIsNone(Game.objects.active_for_channel('C1'))
+        game = Game.objects.start_game(kind=Game.TICTACTOE, channel='C1')
+        with self.assertNumQueries(1):
+            self.assertEqual(Game.objects.active_for_channel('C1'), game)
+        self.assertIsNone(Game.objects.active_for_channel('C2'))
+
+    def test_one_active_game_per_channel(self):
+        game = Game.objects.start_game(kind=Game.TICTACTOE, channel='C1')
+        self.assertIsNone(
+            Game.objects.start_game(kind=Game.TICTACTOE, channel='C1'),
+        )
+        game.is_active = False
+        game.save()
+        self.assertIsNotNone(
+            Game.objects.start_game(kind=Game.TICTACTOE, channel='C1'),
+        )
+
+    def test_legacy_board_converted_on_save(self):
+        game = Game.objects.create(
+            kind=Game.TICTACTOE,
+            channel='test',
+            state={
+                'last_move': 'O',
+                'board': [['X',0,0],[0,'O',0],[0,0,0]],
+            },
+        )
+        self.assertTrue(game.make_move_if_valid('3'))
+        game = Game.objects.get(id=game.id)
+        self.assertNotIn('board', game.state)
+        self.assertEqual(game.state['x'], 0b000000101)
+        self.assertEqual(game.state['o'], 0b000010000)
+        self.assertEqual(game.state['last_move'], 'X')
+
+
+class TicTacToeEngineTests(TestCase):
+
+    def test_play(self):
+        x, o = tictactoe.play(0, 0, 5, tictactoe.X)
+        self.assertEqual((x, o), (0b000010000, 0))
+        x, o = tictactoe.play(x, o, 1, tictactoe.O)
+        self.assertEqual((x, o), (0b000010000, 0b000000001))
+        self.assertIsNone(tictactoe.play(x, o, 5, tictactoe.O))
+        self.assertIsNone(tictactoe.play(x, o, 1, tictactoe.X))
+
+    def test_outcome(self):
+        for win in tictactoe.WIN_MASKS:
+            self.assertEqual(tictactoe.outcome(win, 0), tictactoe.X)
+            self.assertEqual(tictactoe.outcome(0, win), tictactoe.O)
+        self.assertIsNone(tictactoe.outcome(0, 0))
+        x, o = tictactoe.from_rows(
+            [['X','O','X'],['X','O','O'],['O','X','X']],
+        )
+        self.assertEqual(tictactoe.outcome(x, o), tictactoe.TIE)
+
+    def test_rows_round_trip(self):
+        board = [['X',0,'O'],[0,'X',0],['O',0,0]]
+        x, o = tictactoe.from_rows(board)
+        self.assertEqual(tictactoe.to_rows(x, o), board)
+
+
+class SolverTests(TestCase):
+
+    def test_table_is_current(self):
+        with open(solver.TABLE_PATH, 'rb') as table:
+            self.assertEqual(table.read(), solver.encode(solver.solve()))
+        self.assertEqual(len(solver.table()), 765)
+
+    def test_empty_board_is_a_draw(self):
+        self.assertEqual(solver.analyse(0, 0)[0], solver.DRAW)
+
+    def test_takes_a_win(self):
+        x, o = tictactoe.from_rows([['X','X',0],['O','O',0],[0,0,0]])
+        self.assertEqual(solver.analyse(x, o), (solver.WIN, 3))
+        x, o = tictactoe.from_rows([['X','X',0],['O','O',0],['X',0,0]])
+        self.assertEqual(solver.analyse(x, o), (solver.WIN, 6))
+
+    def test_blocks_a_win(self):
+        x, o = tictactoe.from_rows([['X',0,0],[0,'O',0],[0,0,'X']])
+        self.assertEqual(solver.analyse(x, o)[0], solver.DRAW)
+        x, o = tictactoe.from_rows([['X','X',0],[0,'O',0],[0,0,0]])
+        self.assertEqual(solver.best_move(x, o), 3)
+
+    def test_symmetric_positions_agree(self):
+        for images in solver._MASK_IMAGES:
+            x, o = images[0b000000011], images[0b000010000]
+            result, cell = solver.analyse(x, o)
+            self.assertEqual(result, solver.DRAW)
+            self.assertEqual(
+                cell, images[tictactoe.cell_bit(3)].bit_length(),
+            )
+
+    def assertBotNeverLoses(self, x, o, bot):
+        winner = tictactoe.outcome(x, o)
+        if winner is not None:
+            self.assertIn(winner, (bot, tictactoe.TIE))
+            return
+        piece = solver.to_move(x, o)
+        if piece == bot:
+            cell = solver.best_move(x, o)
+            self.assertIsNotNone(cell)
+            self.assertBotNeverLoses(*tictactoe.play(x, o, cell, piece), bot=bot)
+            return
+        for cell in tictactoe.CELLS:
+            child = tictactoe.play(x, o, cell, piece)
+            if child is not None:
+                self.assertBotNeverLoses(*child, bot=bot)
+
+    def test_bot_never_loses(self):
+        self.assertBotNeverLoses(0, 0, bot=tictactoe.X)
+        self.assertBotNeverLoses(0, 0, bot=tictactoe.O)
+
+    def test_bot_game(self):
+        cache.clear()
+        game = Game.objects.start_game(kind=Game.TICTACTOE, channel='C1')
+        PlayerFactory.create(game=game, name='Stewart', is_current=True)
+        PlayerFactory.create(
+            game=game,
+            name=Player.BOT_NAME,
+            remote_user_id=Player.BOT_USER_ID,
+        )
+        result = services.play_move('C1', 'Stewart', 'U12345', 'top left')
+        self.assertEqual(result.status, services.BOT_PLAYED)
+        self.assertEqual(result.reply, 5)
+        game = Game.objects.get(id=game.id)
+        self.assertEqual(game.get_board(), (0b000000001, 0b000010000))
+        self.assertEqual(game.state['last_move'], 'O')
+        self.assertTrue(Player.objects.get(game=game, name='Stewart').is_current)
+        statuses = []
+        for cell in (9, 3, 4, 8, 7, 6, 2):
+            statuses.append(
+                services.play_move('C1', 'Stewart', 'U12345', str(cell)).status,
+            )
+            if statuses[-1] not in (services.BOT_PLAYED, services.INVALID_MOVE):
+                break
+        self.assertIn(statuses[-1], (services.TIE, services.BOT_WON))
+
+
+class ForcedOutcomeTests(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super(ForcedOutcomeTests, cls).setUpClass()
+        # Every reachable position, each solved by brute force over the
+        # whole game tree, with no symmetries or tables: (value for X,
+        # whether X can still complete a line, whether O can).
+        cls.positions = {}
+
+        def search(x, o, piece):
+            if (x, o) in cls.positions:
+                return cls.positions[x, o]
+            if tictactoe.has_line(x) or tictactoe.has_line(o):
+                value = 1 if tictactoe.has_line(x) else -1
+                result = (value, value == 1, value == -1)
+            elif x | o == tictactoe.FULL:
+                result = (0, False, False)
+            else:
+                children = [
+                    search(*tictactoe.play(x, o, cell, piece),
+                           piece=tictactoe.other(piece))
+                    for cell in tictactoe.CELLS
+                    if not (x | o) & tictactoe.cell_bit(cell)
+                ]
+                values = [child[0] for child in children]
+                result = (
+                    max(values) if piece == tictactoe.X else min(values),
+                    any(child[1] for child in children),
+                    any(child[2] for child in children),
+                )
+            cls.positions[x, o] = result
+            return result
+
+        search(0, 0, tictactoe.X)
+
+    def expected(self, x, o):
+        value, x_live, o_live = self.positions[x, o]
+        if value:
+            return tictactoe.X if value > 0 else tictactoe.O
+        if not x_live and not o_live:
+            return tictactoe.TIE
+        return None
+
+    def test_every_reachable_position(self):
+        self.assertEqual(len(self.positions), 5478)
+        wrong = [
+            (tictactoe.to_rows(x, o), solver.forced_outcome(x, o))
+            for x, o in self.positions
+            if solver.forced_outcome(x, o) != self.expected(x, o)
+        ]
+        self.assertEqual(wrong, [])
+
+    def test_agrees_with_finished_games(self):
+        for x, o in self.positions:
+            result = tictactoe.outcome(x, o)
+            if result is not None:
+                self.assertEqual(solver.forced_outcome(x, o), result)
+
+    def test_settled_results_stay_settled(self):
+        for x, o in self.positions:
+            result = solver.forced_outcome(x, o)
+            if result is None or tictactoe.outcome(x, o) is not None:
+                continue
+            piece = solver.to_move(x, o)
+            children = [
+                solver.forced_outcome(*child)
+                for child in (tictactoe.play(x, o, cell, piece)
+                              for cell in tictactoe.CELLS)
+                if child is not None
+            ]
+            if result == piece:
+                self.assertIn(result, children)
+            else:
+                self.assertEqual(set(children), {result})
+
+    def test_decided_early(self):
+        self.assertIsNone(solver.forced_outcome(0, 0))
+        # Centre, then an edge: X forks whatever O does.
+        x, o = tictactoe.from_rows([[0,'O',0],[0,'X',0],[0,0,0]])
+        self.assertEqual(solver.forced_outcome(x, o), tictactoe.X)
+        # Three spaces left, but no line can be completed.
+        x, o = tictactoe.from_rows([['X','O','X'],[0,0,0],['O','X','O']])
+        self.assertIsNone(tictactoe.outcome(x, o))
+        self.assertEqual(solver.forced_outcome(x, o), tictactoe.TIE)
+
+    def test_unreachable_positions(self):
+        x, o = tictactoe.from_rows([['O','O',0],[0,0,0],[0,0,0]])
+        self.assertIsNone(solver.forced_outcome(x, o))
+        engine = engines.get('tictactoe')
+        self.assertIsNone(engine.forced_outcome({'x': x, 'o': o}))
+
+    def test_engines(self):
+        engine = engines.get('tictactoe')
+        self.assertEqual(engine.forced_outcome({
+            'last_move': 'X',
+            'board': [[0,'O',0],[0,'X',0],[0,0,0]],
+        }), tictactoe.X)
+        engine = engines.get('connectfour')
+        state = engine.initial_state()
+        self.assertIsNone(engine.forced_outcome(state))
+        state.update(x=0b1111)
+        self.assertEqual(
+            engine.forced_outcome(state), engine.outcome(state),
+        )
+
+
+class EngineTests(TestCase):
+
+    def play(self, engine, moves):
+        state = engine.initial_state()
+        for move in moves:
+            state = engine.play(state, move)
+            self.assertIsNotNone(state, move)
+        return state
+
+    def test_registry(self):
+        self.assertIs(engines.for_command('tictac'), engines.get(Game.TICTACTOE))
+        self.assertIs(
+            engines.for_command('connect4'), engines.get(Game.CONNECT_FOUR),
+        )
+        self.assertIs(engines.for_command('gomoku'), engines.get(Game.GOMOKU))
+        self.assertIsNone(engines.for_command('chess'))
+
+    def test_registered_engines_are_choices(self):
+        class ChessEngine(engines.Engine):
+            kind = 'chess'
+            label = "Chess"
+            command = 'chess'
+
+        engines.register(ChessEngine)
+        try:
+            field = Game._meta.get_field('kind')
+            self.assertIn(('chess', "Chess"), field.choices)
+            field.clean('chess', None)
+        finally:
+            del engines.ENGINES['chess']
+            del engines.COMMANDS['chess']
+        self.assertNotIn(('chess', "Chess"), list(field.choices))
+
+    def test_start_each_kind(self):
+        for kind, label in Game.GAME_TYPES:
+            game = Game.objects.start_game(kind=kind, channel=kind)
+            self.assertEqual(game.state, engines.get(kind).initial_state())
+            self.assertFalse(game.is_won())
+            self.assertTrue(game.board_state_to_slack())
+
+    def test_connect_four(self):
+        engine = engines.get(Game.CONNECT_FOUR)
+        state = self.play(engine, ['1', '2', '1', '2', '1', '2'])
+        self.assertIsNone(engine.outcome(state))
+        state = engine.play(state, '1')
+        self.assertEqual(engine.outcome(state), tictactoe.X)
+        # Diagonal, built up from the bottom row.
+        state = self.play(engine, [
+            '1', '2', '2', '3', '3', '4', '3', '4', '4', '7', '4',
+        ])
+        self.assertEqual(engine.outcome(state), tictactoe.X)
+        self.assertIsNone(engine.parse_move('8'))
+        self.assertIsNone(engine.parse_move('top left'))
+
+    def test_connect_four_full_column(self):
+        engine = engines.get(Game.CONNECT_FOUR)
+        state = self.play(engine, ['5'] * 6)
+        self.assertIsNone(engine.play(state, '5'))
+        self.assertEqual(
+            engine.render(state, 'ascii').split('\n')[0], '. . . . O . . ',
+        )
+
+    def test_connect_four_tie(self):
+        engine = engines.get(Game.CONNECT_FOUR)
+        columns = ['1', '2', '3', '4', '5', '6', '7']
+        order = []
+        for group in (columns[:2], columns[2:4], columns[4:6]):
+            for _ in range(3):
+                order += group + group
+        order += ['7'] * 6
+        state = self.play(engine, order)
+        self.assertEqual(engine.outcome(state), tictactoe.TIE)
+
+    def test_gomoku(self):
+        engine = engines.get(Game.GOMOKU)
+        self.assertEqual(engine.parse_move('a1'), 0)
+        self.assertEqual(engine.parse_move('8 H'), 7 * 15 + 7)
+        self.assertEqual(engine.parse_move('o15'), 224)
+        self.assertIsNone(engine.parse_move('p1'))
+        self.assertIsNone(engine.parse_move('a16'))
+        state = self.play(engine, [
+            'h8', 'a1', 'i9', 'a2', 'j10', 'a3', 'k11', 'a4',
+        ])
+        self.assertIsNone(engine.outcome(state))
+        self.assertIsNone(engine.play(state, 'h8'))
+        state = engine.play(state, 'g7')
+        self.assertEqual(engine.outcome(state), tictactoe.X)
+
+    def test_gomoku_render_has_coordinates(self):
+        engine = engines.get(Game.GOMOKU)
+        state = self.play(engine, ['h8', 'a1'])
+        lines = engine.render(state, 'ascii').split('\n')
+        self.assertEqual(len(lines), 16)
+        self.assertEqual(lines[0], 'a b c d e f g h i j k l m n o ')
+        self.assertEqual(lines[1], 'O ' + '. ' * 14 + '1')
+        self.assertEqual(lines[8], '. ' * 7 + 'X ' + '. ' * 7 + '8')
+        self.assertEqual(lines[15], '. ' * 15 + '15')
+        self.assertTrue(engine.render(state, 'slack').startswith(
+            ':regional_indicator_a: :regional_indicator_b: ',
+        ))
+
+    def test_gomoku_needs_five(self):
+        engine = engines.get(Game.GOMOKU)
+        state = self.play(engine, ['a1', 'o15', 'b1', 'o14', 'c1', 'o13', 'd1'])
+        self.assertIsNone(engine.outcome(state))
+
+
+class RenderingTests(TestCase):
+
+    def test_themes(self):
+        x, o = tictactoe.from_rows([['X',0,0],[0,'O',0],[0,0,0]])
+        self.assertEqual(
+            rendering.render(x, o, 'ascii'),
+            "X . . \n. O . \n. . . ",
+        )
+        self.assertEqual(
+            Game.render_board(x, o),
+            ":x: :white_medium_square: :white_medium_square: \n"
+            ":white_medium_square: :o: :white_medium_square: \n"
+            ":white_medium_square: :white_medium_square: :white_medium_square: ",
+        )
+
+    def test_memoized(self):
+        rendering.render.cache_clear()
+        rendering.render(0b1, 0b10, 'slack')
+        rendering.render(0b1, 0b10, 'slack')
+        rendering.render(0b1, 0b10, 'ascii')
+        info = rendering.render.cache_info()
+        self.assertEqual((info.hits, info.misses), (1, 2))
+
+
+class MoveParserTests(TestCase):
+
+    def test_every_alias(self):
+        for cell, aliases in moves.MOVE_OPTIONS.items():
+            self.assertEqual(moves.parse_move(str(cell)), cell)
+            for alias in aliases:
+                self.assertEqual(moves.parse_move(alias), cell)
+                self.assertEqual(moves.parse_move(alias.upper()), cell)
+
+    def test_noise(self):
+        self.assertEqual(moves.parse_move('  Top-Left!  '), 1)
+        self.assertEqual(moves.parse_move('@bottom   right'), 9)
+        self.assertEqual(moves.parse_move('5.'), 5)
+
+    def test_fuzzy(self):
+        self.assertEqual(moves.parse_move('top lfet'), 1)
+        self.assertEqual(moves.parse_move('centre'), 5)
+        self.assertEqual(moves.parse_move('bottm right'), 9)
+        self.assertIsNone(moves.parse_move('top lfet', fuzzy=False))
+
+    def test_unknown(self):
+        self.assertIsNone(moves.parse_move(''))
+        self.assertIsNone(moves.parse_move('0'))
+        self.assertIsNone(moves.parse_move('somewhere'))
+        self.assertNotIn('7', moves.tictactoe_moves.fuzzy_aliases)
+
+
+class MoveServiceTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.game = Game.objects.start_game(kind=Game.TICTACTOE, channel='C1')
+        self.stewart = PlayerFactory.create(
+            game=self.game,
+            name='Stewart',
+            is_current=True,
+        )
+        self.cal = PlayerFactory.create(game=self.game, name='cal')
+
+    def test_move_queries(self):
+        with self.assertNumQueries(6):
+            result = services.play_move('C1', 'Stewart', 'U12345', '5')
+        self.assertEqual(result.status, services.PLAYED)
+        self.assertEqual(result.player, self.stewart)
+        self.assertEqual(result.opponent, self.cal)
+        game = Game.objects.get(id=self.game.id)
+        self.assertEqual(game.get_board(), (0b000010000, 0))
+        self.assertFalse(Player.objects.get(id=self.stewart.id).is_current)
+        self.assertTrue(Player.objects.get(id=self.cal.id).is_current)
+
+    def test_snapshot_write_through(self):
+        snapshot = services.active_snapshot('C1')
+        self.assertEqual(snapshot['current'], 'Stewart')
+        self.assertEqual(snapshot['players'], ['Stewart', 'cal'])
+        services.play_move('C1', 'Stewart', 'U12345', '5')
+        with self.settings(TINTG_GAME_CACHE_SHARED=True):
+            with self.assertNumQueries(0):
+                snapshot = services.active_snapshot('C1')
+        self.assertEqual(snapshot['current'], 'cal')
+        self.assertEqual(snapshot['state']['x'], 0b000010000)
+        self.game.refresh_from_db()
+        self.game.save()
+        self.assertIsNone(snapshots.get('C1'))
+
+    def test_local_snapshots_are_checked(self):
+        self.assertFalse(snapshots.is_shared())
+        services.play_move('C1', 'Stewart', 'U12345', '5')
+        with self.assertNumQueries(1):
+            self.assertEqual(services.active_snapshot('C1')['current'], 'cal')
+        # A move made in another worker, which can't reach this cache.
+        other = snapshots.get('C1')
+        Game.objects.filter(id=self.game.id).update(
+            version=F('version') + 1, ply=2, checkpoint_ply=2,
+            state={'last_move': 'O', 'x': 0b000010000, 'o': 0b000000001},
+        )
+        snapshot = services.active_snapshot('C1')
+        self.assertNotEqual(snapshot['version'], other['version'])
+        self.assertEqual(snapshot['state']['o'], 1)
+        # ...or a game that ended there.
+        Game.objects.filter(id=self.game.id).update(
+            version=F('version') + 1, is_active=False,
+        )
+        self.assertIsNone(services.active_snapshot('C1'))
+        self.assertIsNone(snapshots.get('C1'))
+
+    def test_wrong_turn_queries(self):
+        with self.assertNumQueries(1):
+            result = services.play_move('C1', 'cal', 'U12345', '5')
+        self.assertEqual(result.status, services.WRONG_TURN)
+
+    def test_remembers_user_id(self):
+        services.play_move('C1', '@Stewart', 'U999', 'center')
+        self.assertEqual(
+            Player.objects.get(id=self.stewart.id).remote_user_id, 'U999',
+        )
+        self.assertEqual(
+            Player.objects.get(id=self.cal.id).remote_user_id, 'U12345',
+        )
+
+    def test_win(self):
+        self.game.state.update(x=0b000000011, o=0b000011000)
+        self.game.save()
+        with self.assertNumQueries(5):
+            result = services.play_move('C1', 'Stewart', 'U12345', '3')
+        self.assertEqual(result.status, services.WON)
+        game = Game.objects.get(id=self.game.id)
+        self.assertFalse(game.is_active)
+        self.assertEqual(game.outcome, tictactoe.X)
+
+    def test_forced_win(self):
+        # X on 1, O on 2: X takes the centre and can't be stopped.
+        self.game.state.update(x=0b000000001, o=0b000000010)
+        self.game.save()
+        result = services.play_move('C1', 'Stewart', 'U12345', '5')
+        self.assertEqual(result.status, services.WON)
+        self.assertTrue(result.forced)
+        game = Game.objects.get(id=self.game.id)
+        self.assertFalse(game.is_active)
+        self.assertEqual(game.outcome, tictactoe.X)
+        self.assertEqual(game.is_decided(), tictactoe.X)
+        self.assertIsNone(snapshots.get('C1'))
+
+    def test_forced_loss(self):
+        # An edge against the centre leaves X a fork.
+        self.game.state.update(last_move='X', x=0b000010000)
+        self.game.save()
+        result = services.play_move('C1', 'Stewart', 'U12345', '2')
+        self.assertEqual(result.status, services.LOST)
+        self.assertTrue(result.forced)
+        self.assertEqual(result.opponent, self.cal)
+        game = Game.objects.get(id=self.game.id)
+        self.assertFalse(game.is_active)
+        self.assertEqual(game.outcome, tictactoe.X)
+
+    def test_forced_tie(self):
+        self.game.state.update(
+            last_move='X', x=0b010000101, o=0b001000010,
+        )
+        self.game.save()
+        result = services.play_move('C1', 'Stewart', 'U12345', '9')
+        self.assertEqual(result.status, services.TIE)
+        self.assertTrue(result.forced)
+        game = Game.objects.get(id=self.game.id)
+        self.assertFalse(game.is_active)
+        self.assertEqual(game.outcome, tictactoe.TIE)
+
+    def test_forced_loss_to_the_bot(self):
+        self.cal.remote_user_id = Player.BOT_USER_ID
+        self.cal.save()
+        self.game.state.update(last_move='X', x=0b000010000)
+        self.game.save()
+        result = services.play_move('C1', 'Stewart', 'U12345', '2')
+        self.assertEqual(result.status, services.BOT_WON)
+        self.assertTrue(result.forced)
+        self.assertIsNone(result.reply)
+        self.assertEqual(
+            Game.objects.get(id=self.game.id).outcome, tictactoe.X,
+        )
+
+    def test_forced_games_can_play_on(self):
+        self.game.state.update(last_move='X', x=0b000010000)
+        self.game.save()
+        with self.settings(TINTG_END_FORCED_GAMES=False):
+            result = services.play_move('C1', 'Stewart', 'U12345', '2')
+        self.assertEqual(result.status, services.PLAYED)
+        self.assertFalse(result.forced)
+        self.assertTrue(Game.objects.get(id=self.game.id).is_active)
+
+    def test_no_game(self):
+        result = services.play_move('C2', 'Stewart', 'U12345', '5')
+        self.assertEqual(result.status, services.NO_GAME)
+        self.assertIsNone(result.game)
+
+    def test_retries_after_concurrent_move(self):
+        load_game = services.load_game
+        calls = []
+
+        def load_game_then_race(*args):
+            loaded = load_game(*args)
+            if not calls:
+                Game.objects.get(id=self.game.id).save()
+            calls.append(args)
+            return loaded
+
+        with mock.patch.object(services, 'load_game', load_game_then_race):
+            result = services.play_move('C1', 'Stewart', 'U12345', '5')
+        self.assertEqual(result.status, services.PLAYED)
+        self.assertEqual(len(calls), 2)
+
+    def test_gives_up_after_repeated_conflicts(self):
+        load_game = services.load_game
+
+        def load_game_then_race(*args):
+            loaded = load_game(*args)
+            Game.objects.get(id=self.game.id).save()
+            return loaded
+
+        with mock.patch.object(services, 'load_game', load_game_then_race):
+            result = services.play_move('C1', 'Stewart', 'U12345', '5')
+        self.assertEqual(result.status, services.CONFLICT)
+        game = Game.objects.get(id=self.game.id)
+        self.assertEqual(game.get_board(), (0, 0))
+
+
+@unittest.skipIf(
+    connection.vendor == 'sqlite' and
+    not connection.settings_dict['TEST'].get('NAME'),
+    "Worker threads can't share an in-memory SQLite database; run against "
+    "Postgres or set a TEST NAME for SQLite.",
+)
+class ConcurrentMoveTests(TransactionTestCase):
+
+    THREADS = 8
+    ROUNDS = 5
+
+    def play_concurrently(self, moves):
+        barrier = threading.Barrier(len(moves))
+        results = []
+
+        def play(user_name, cell):
+            try:
+                barrier.wait()
+                results.append(
+                    services.play_move('C1', user_name, 'U12345', str(cell)),
+                )
+            finally:
+                connection.close()
+
+        threads = [
+            threading.Thread(target=play, args=move) for move in moves
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_simultaneous_moves(self):
+        for round in range(self.ROUNDS):
+            game = Game.objects.start_game(kind=Game.TICTACTOE, channel='C1')
+            PlayerFactory.create(game=game, name='Stewart', is_current=True)
+            PlayerFactory.create(game=game, name='cal')
+            results = self.play_concurrently([
+                ('Stewart', cell) for cell in range(1, self.THREADS + 1)
+            ])
+            played = [r for r in results if r.status == services.PLAYED]
+            self.assertEqual(len(played), 1)
+            for result in results:
+                self.assertIn(result.status, (
+                    services.PLAYED, services.WRONG_TURN, services.CONFLICT,
+                ))
+            game = Game.objects.get(id=game.id)
+            x, o = game.get_board()
+            self.assertEqual(bin(x).count('1') + bin(o).count('1'), 1)
+            self.assertEqual(
+                Player.objects.get(game=game, is_current=True).name, 'cal',
+            )
+            game.is_active = False
+            game.save()
+
+    def test_both_players_race_through_a_game(self):
+        game = Game.objects.start_game(kind=Game.TICTACTOE, channel='C1')
+        PlayerFactory.create(game=game, name='Stewart', is_current=True)
+        PlayerFactory.create(game=game, name='cal')
+        for cell in range(1, 8):
+            self.play_concurrently([
+                ('Stewart', cell), ('cal', cell),
+                ('Stewart', cell), ('cal', cell),
+            ])
+        game = Game.objects.get(id=game.id)
+        x, o = game.get_board()
+        self.assertEqual(x & o, 0)
+        self.assertIn(bin(x).count('1') - bin(o).count('1'), (0, 1))
+
+
+class ArchiveTests(TestCase):
+
+    def setUp(self):
+        self.live = GameFactory.create(channel='C1')
+        PlayerFactory.create(game=self.live, name='Stewart')
+        self.finished = []
+        for channel in ('C2', 'C3', 'C4'):
+            game = GameFactory.create(channel=channel, is_active=False)
+            game.state = {'last_move': 'X', 'x': 0b111, 'o': 0b11000}
+            game.outcome = tictactoe.X
+            game.save()
+            PlayerFactory.create(game=game, name='Stewart', is_current=True)
+            PlayerFactory.create(game=game, name='cal', remote_user_id='U2')
+            self.finished.append(game)
+
+    def test_archive_to_table(self):
+        self.assertEqual(archive.archive_finished(size=2, delay=0), 3)
+        self.assertEqual(list(Game.objects.all()), [self.live])
+        self.assertEqual(Player.objects.count(), 1)
+        archived = ArchivedGame.objects.get(game_id=self.finished[0].id)
+        self.assertEqual(archived.channel, 'C2')
+        self.assertEqual(archived.outcome, tictactoe.X)
+        self.assertEqual(json.loads(archived.state)['x'], 0b111)
+        self.assertEqual(json.loads(archived.players), [
+            ['Stewart', 'U12345', True], ['cal', 'U2', False],
+        ])
+
+    def test_archives_recorded_outcome(self):
+        # Forfeited by X, who could still force a win from this board.
+        game = GameFactory.create(channel='C5', is_active=False, outcome='O')
+        game.state = {'last_move': 'O', 'x': 0b000010001, 'o': 0b100000000}
+        game.save()
+        archive.archive_finished(delay=0)
+        self.assertEqual(
+            ArchivedGame.objects.get(game_id=game.id).outcome, tictactoe.O,
+        )
+
+    def test_finished_outcomes_are_backfilled(self):
+        migration = importlib.import_module('games.migrations.0009_game_outcome')
+        Game.objects.filter(channel='C3').update(outcome='')
+        forfeited = GameFactory.create(channel='C5', is_active=False)
+        forfeited.state = {'last_move': 'X', 'x': 0b1, 'o': 0b10}
+        forfeited.save()
+        migration.backfill_outcomes(apps, None)
+        self.assertEqual(
+            Game.objects.get(channel='C3').outcome, tictactoe.X,
+        )
+        self.assertEqual(Game.objects.get(id=forfeited.id).outcome, '')
+        self.assertEqual(Game.objects.get(id=self.live.id).outcome, '')
+
+    def test_limit_and_batches(self):
+        with mock.patch('games.archive.archive_batch',
+                        wraps=archive.archive_batch) as batch:
+            self.assertEqual(archive.archive_finished(
+                size=1, delay=0, limit=2,
+            ), 2)
+        self.assertEqual(batch.call_count, 2)
+        self.assertEqual(Game.objects.filter(is_active=False).count(), 1)
+
+    def test_archive_to_jsonl(self):
+        output = io.StringIO()
+        archive.archive_finished(delay=0, output=output)
+        lines = output.getvalue().splitlines()
+        self.assertEqual(
+            [json.loads(line)['game_id'] for line in lines],
+            [game.id for game in self.finished],
+        )
+        self.assertFalse(ArchivedGame.objects.exists())
+        self.assertEqual(Game.objects.count(), 1)
+
+    def test_archives_move_log(self):
+        game = Game.objects.start_game(kind=Game.TICTACTOE, channel='C5')
+        stewart = PlayerFactory.create(game=game, name='Stewart')
+        cal = PlayerFactory.create(game=game, name='cal')
+        game.apply_move('1', stewart)
+        game.apply_move('5', cal)
+        game.is_active = False
+        game.save()
+        archive.archive_finished(delay=0)
+        archived = ArchivedGame.objects.get(game_id=game.id)
+        self.assertEqual(json.loads(archived.moves), [[1, 0], [5, 1]])
+        self.assertFalse(Move.objects.exists())
+
+    def test_command(self):
+        stdout = io.StringIO()
+        call_command('archive_games', pause=0, stdout=stdout)
+        self.assertEqual(stdout.getvalue(), "Archived 3 finished games.\n")
+        self.assertEqual(ArchivedGame.objects.count(), 3)
+
+
+class MoveLogTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.game = Game.objects.start_game(kind=Game.TICTACTOE, channel='C1')
+        self.stewart = PlayerFactory.create(
+            game=self.game, name='Stewart', is_current=True,
+        )
+        self.cal = PlayerFactory.create(game=self.game, name='cal')
+
+    def play(self, *cells):
+        players = ('Stewart', 'cal')
+        for n, cell in enumerate(cells):
+            result = services.play_move('C1', players[n % 2], 'U1', str(cell))
+        return result
+
+    def stored_state(self):
+        return Game.objects.filter(id=self.game.id).values_list(
+            'state', flat=True,
+        )[0]
+
+    def test_moves_are_logged(self):
+        self.play(5, 1, 9)
+        self.assertEqual(
+            list(Move.objects.filter(game=self.game).values_list(
+                'ply', 'move', 'player__name',
+            )),
+            [(1, 5, 'Stewart'), (2, 1, 'cal'), (3, 9, 'Stewart')],
+        )
+
+    def test_state_is_checkpointed(self):
+        with self.settings(TINTG_CHECKPOINT_INTERVAL=4):
+            self.play(5, 1, 9)
+            # The stored state is still the empty board...
+            self.assertEqual(self.game.engine.masks(self.stored_state()), (0, 0))
+            # ...but loading the game replays the log.
+            game = Game.objects.get(id=self.game.id)
+            self.assertEqual((game.ply, game.checkpoint_ply), (3, 0))
+            self.assertEqual(game.get_board(), (0b100010000, 0b000000001))
+            services.play_move('C1', 'cal', 'U1', '3')
+            game = Game.objects.get(id=self.game.id)
+            self.assertEqual((game.ply, game.checkpoint_ply), (4, 4))
+            self.assertEqual(
+                game.engine.masks(self.stored_state()), game.get_board(),
+            )
+
+    def test_move_queries_between_checkpoints(self):
+        with self.settings(TINTG_CHECKPOINT_INTERVAL=4):
+            self.play(5, 1)
+            # As many as right after a checkpoint: the two moves to replay
+            # are read in the same query as the game.
+            with self.assertNumQueries(6):
+                result = services.play_move('C1', 'Stewart', 'U1', '9')
+        self.assertEqual(result.status, services.PLAYED)
+        self.assertEqual(result.game.get_board(), (0b100010000, 0b000000001))
+        game, players = services.load_players('C1')
+        self.assertEqual((game.ply, game.checkpoint_ply), (3, 0))
+        self.assertEqual(game.get_board(), (0b100010000, 0b000000001))
+        self.assertEqual(players, [self.stewart, self.cal])
+        self.assertIs(players[1].game, game)
+
+    def test_pending_moves_in_ply_order(self):
+        # Logged out of order, and aggregated in whatever order the
+        # database likes: the moves are still replayed by ply.
+        for ply, move in ((3, 9), (1, 5), (2, 1)):
+            Move.objects.create(game=self.game, ply=ply, move=move)
+        Game.objects.filter(id=self.game.id).update(ply=3)
+        game, players = services.load_players('C1')
+        self.assertEqual(game.get_board(), (0b100010000, 0b000000001))
+        self.assertEqual(Game.parse_moves('3:9,1:5,2:1'), [5, 1, 9])
+        self.assertEqual(Game.parse_moves('10:4,9:2'), [2, 4])
+        self.assertEqual(Game.parse_moves(None), [])
+
+    def test_finished_games_are_checkpointed(self):
+        with self.settings(TINTG_CHECKPOINT_INTERVAL=100,
+                           TINTG_END_FORCED_GAMES=False):
+            result = self.play(1, 4, 2, 5, 3)
+        self.assertEqual(result.status, services.WON)
+        game = Game.objects.get(id=self.game.id)
+        self.assertEqual(game.checkpoint_ply, 5)
+        self.assertEqual(
+            game.engine.outcome(self.stored_state()), tictactoe.X,
+        )
+
+    def test_rebuild(self):
+        self.play(5, 1, 9, 2)
+        game = Game.objects.get(id=self.game.id)
+        self.assertEqual(game.engine.masks(game.rebuild()), game.get_board())
+
+    def test_bot_moves_are_logged(self):
+        self.cal.remote_user_id = Player.BOT_USER_ID
+        self.cal.save()
+        result = self.play(5)
+        self.assertEqual(result.status, services.BOT_PLAYED)
+        self.assertEqual(
+            list(Move.objects.values_list('ply', 'move', 'player')),
+            [(1, 5, self.stewart.id), (2, result.reply, self.cal.id)],
+        )
+
+    def test_one_move_per_ply(self):
+        self.play(5)
+        with self.assertRaises(IntegrityError):
+            Move.objects.create(game=self.game, ply=1, move=1)
+
+
+class StateFieldTests(TestCase):
+
+    def setUp(self):
+        self.x_to_move = GameFactory.create(channel='C1', state={
+            'last_move': 'O', 'x': 0b1, 'o': 0b10,
+        })
+        self.o_to_move = GameFactory.create(channel='C2', state={
+            'last_move': 'X', 'x': 0b101, 'o': 0b10,
+        })
+
+    def test_round_trip(self):
+        game = Game.objects.get(id=self.x_to_move.id)
+        self.assertEqual(game.state, {'last_move': 'O', 'x': 1, 'o': 2})
+        self.assertIs(type(game.state), dict)
+
+    def test_contains(self):
+        self.assertEqual(
+            list(Game.objects.filter(state__contains={'last_move': 'X'})),
+            [self.o_to_move],
+        )
+        self.assertEqual(
+            list(Game.objects.filter(state__contains={
+                'last_move': 'O', 'x': 1,
+            })),
+            [self.x_to_move],
+        )
+
+    def test_full_boards(self):
+        full = GameFactory.create(channel='C3', state={
+            'last_move': 'X', 'x': 0b110001101, 'o': 0b001110010,
+        })
+        c4 = engines.get(Game.CONNECT_FOUR)
+        full_c4 = GameFactory.create(
+            channel='C4', kind=Game.CONNECT_FOUR,
+            state={'last_move': 'O', 'x': c4.full & 0x5555555555,
+                   'o': c4.full & ~0x5555555555, 'last': 0},
+        )
+        GameFactory.create(
+            channel='C5', kind=Game.CONNECT_FOUR, state=c4.initial_state(),
+        )
+        self.assertEqual(
+            set(Game.objects.full_boards()), {full, full_c4},
+        )
+
+    @unittest.skipUnless(connection.vendor == 'sqlite', "SQLite query plans")
+    def test_full_boards_use_index(self):
+        sql, params = Game.objects.full_boards().query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            plan = ' '.join(str(row[-1]) for row in cursor.fetchall())
+        self.assertIn('games_game_filled', plan)
+        self.assertNotIn('SCAN games_game', plan.replace('USING INDEX', ''))
+
+    def test_legacy_boards_are_converted(self):
+        migration = importlib.import_module(
+            'games.migrations.0008_native_json_state',
+        )
+        legacy = GameFactory.create(channel='C3', state={
+            'last_move': 'X', 'board': [['X', 0, 0], [0, 'O', 0], [0, 0, 'X']],
+        })
+        migration.convert_legacy_boards(apps, None)
+        legacy.refresh_from_db()
+        self.assertEqual(legacy.state, {
+            'last_move': 'X', 'x': 0b100000001, 'o': 0b000010000,
+        })
+
+
+class IndexTests(TestCase):
+    """
+    The indexes the models can't declare, which a table rebuild on SQLite
+    drops silently; see games/migrations/_indexes.py.
+    """
+
+    def index_names(self):
+        with connection.cursor() as cursor:
+            if connection.vendor == 'sqlite':
+                cursor.execute(
+                    "SELECT name FROM sqlite_master WHERE type = 'index' "
+                    "AND tbl_name = 'games_game'"
+                )
+            elif connection.vendor == 'postgresql':
+                cursor.execute(
+                    "SELECT indexname FROM pg_indexes "
+                    "WHERE tablename = 'games_game'"
+                )
+            else:
+                self.skipTest("Only created on Postgres and SQLite")
+            return {row[0] for row in cursor.fetchall()}
+
+    def test_indexes_survive_migrations(self):
+        names = self.index_names()
+        self.assertIn(_indexes.ACTIVE_INDEX, names)
+        self.assertIn(_indexes.FILLED_INDEX, names)
 
+    def test_one_active_game_per_channel(self):
+        GameFactory.create(channel='C1', is_active=True)
+        with self.assertRaises(IntegrityError):
+            GameFactory.create(channel='C1', is_active=True)
@@ -0,0 +1,105 @@
+"""
+Bitboard tic-tac-toe engine.
+
+Each side is stored as a 9-bit integer mask. Cells are numbered 1-9, left to
+right and top to bottom, and cell ``n`` is bit ``n - 1`` of a mask.
+"""
+
+X = 'X'
+O = 'O'
+TIE = 'tie'
+
+CELLS = tuple(range(1, 10))
+FULL = 0b111111111
+
+WIN_MASKS = (
+    # rows
+    0b000000111,
+    0b000111000,
+    0b111000000,
+    # columns
+    0b001001001,
+    0b010010010,
+    0b100100100,
+    # diagonals
+    0b100010001,
+    0b001010100,
+)
+
+# Lookup tables indexed by a single side's mask, so that the checks below
+# are a tuple index instead of a scan over WIN_MASKS.
+_HAS_LINE = tuple(
+    any(mask & win == win for win in WIN_MASKS) for mask in range(FULL + 1)
+)
+_BLOCKS_ALL = tuple(
+    all(mask & win for win in WIN_MASKS) for mask in range(FULL + 1)
+)
+
+
+def cell_bit(cell):
+    return 1 << (cell - 1)
+
+
+def other(piece):
+    if piece == X:
+        return O
+    return X
+
+
+def play(x, o, cell, piece):
+    """Return the (x, o) masks after `piece` takes `cell`, or None if taken."""
+    bit = cell_bit(cell)
+    if (x | o) & bit:
+        return None
+    if piece == X:
+        return x | bit, o
+    return x, o | bit
+
+
+def has_line(mask):
+    return _HAS_LINE[mask]
+
+
+def is_blocked(x, o):
+    """True when no row, column or diagonal can still be completed."""
+    return _BLOCKS_ALL[x] and _BLOCKS_ALL[o]
+
+
+def outcome(x, o):
+    """Return X or O for a win, TIE when every line is blocked, else None."""
+    if _HAS_LINE[x]:
+        return X
+    if _HAS_LINE[o]:
+        return O
+    if _BLOCKS_ALL[x] and _BLOCKS_ALL[o]:
+        return TIE
+    return None
+
+
+def piece_at(x, o, cell):
+    bit = cell_bit(cell)
+    if x & bit:
+        return X
+    if o & bit:
+        return O
+    return 0
+
+
+def from_rows(board):
+    """Convert a legacy ``[[0, 'X', 0], ...]`` board into (x, o) masks."""
+    x = o = 0
+    for index, space in enumerate(
+        space for row in board for space in row
+    ):
+        if space == X:
+            x |= 1 << index
+        elif space == O:
+            o |= 1 << index
+    return x, o
+
+
+def to_rows(x, o):
+    return [
+        [piece_at(x, o, cell) for cell in CELLS[start:start + 3]]
+        for start in (0, 3, 6)
+    ]
@@ -1,5 +1,18 @@
 from django.apps import AppConfig
+from django.core.signals import request_started
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
 
 
 class SlackConfig(AppConfig):
     name = 'slack'
+
+    def ready(self):
+        from tintg import db, metrics
+        from . import teams
+        team = self.get_model('Team')
+        post_save.connect(teams.team_changed, sender=team)
+        post_delete.connect(teams.team_changed, sender=team)
+        # Runs after Django's own close_old_connections handler.
+        request_started.connect(db.check_connections)
+        connection_created.connect(metrics.install)
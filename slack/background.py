@@ -0,0 +1,111 @@
+"""
+Background processing of slash commands.
+
+With TINTG_ASYNC_COMMANDS on, the webhook acknowledges commands that need
+the database straight away and hands them to a thread pool in the worker
+process. The result is posted to the command's response_url through the
+HTTP client named by TINTG_SLACK_HTTP_CLIENT, so a slow database never
+holds up the reply Slack is waiting for. Only response_urls at one of
+TINTG_RESPONSE_URL_ORIGINS are posted to; commands with any other are
+answered inline.
+"""
+import json
+import logging
+import os
+import threading
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils.module_loading import import_string
+
+from tintg import db
+
+
+logger = logging.getLogger(__name__)
+
+
+class UrllibClient(object):
+    """Posts JSON payloads to Slack with the standard library."""
+
+    def __init__(self, timeout=5):
+        self.timeout = timeout
+
+    def post_json(self, url, payload):
+        # Imported here: urllib.request pulls in ssl and http.client, which
+        # workers only need when commands are deferred.
+        from urllib.request import Request, urlopen
+        request = Request(
+            url,
+            data=json.dumps(payload).encode('utf8'),
+            headers={'Content-Type': 'application/json'},
+        )
+        with urlopen(request, timeout=self.timeout) as response:
+            return response.status
+
+
+def enabled():
+    return getattr(settings, 'TINTG_ASYNC_COMMANDS', False)
+
+
+def response_url_allowed(url):
+    """Whether `url` is at one of TINTG_RESPONSE_URL_ORIGINS."""
+    try:
+        parts = urlsplit(url or '')
+    except ValueError:
+        return False
+    origin = '{}://{}'.format(parts.scheme, parts.netloc).lower()
+    return origin in getattr(
+        settings, 'TINTG_RESPONSE_URL_ORIGINS', ('https://hooks.slack.com',),
+    )
+
+
+def http_client():
+    return import_string(getattr(
+        settings, 'TINTG_SLACK_HTTP_CLIENT', 'slack.background.UrllibClient',
+    ))()
+
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+
+def executor():
+    """The thread pool for this process, recreated after a fork."""
+    global _executor, _executor_pid
+    with _executor_lock:
+        if _executor is None or _executor_pid != os.getpid():
+            from concurrent.futures import ThreadPoolExecutor
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'TINTG_COMMAND_WORKERS', 4),
+            )
+            _executor_pid = os.getpid()
+    return _executor
+
+
+def submit(handler, data, fallback):
+    """
+    Run `handler(data)` on the pool and post the payload it returns to
+    data['response_url']. If the handler fails, `fallback` is posted instead.
+    """
+    return executor().submit(run, handler, data, fallback)
+
+
+def run(handler, data, fallback):
+    # Pool threads are long-lived, so treat each command like a request:
+    # drop expired or broken connections, keep the rest for the next one.
+    close_old_connections()
+    db.check_connections()
+    try:
+        payload = handler(data)
+    except Exception:
+        logger.exception("Slash command failed: %r", data.get('text'))
+        payload = fallback
+    finally:
+        close_old_connections()
+    try:
+        http_client().post_json(data['response_url'], payload)
+    except Exception:
+        logger.exception("Couldn't post to %s", data['response_url'])
+    return payload
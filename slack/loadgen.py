@@ -0,0 +1,331 @@
+"""
+Synthetic slash command traffic, for sizing dynos.
+
+generate() builds tic-tac-toe sessions for many teams and channels: a
+challenge, alternating moves weighted towards the centre and corners and
+typed as numbers or words, the odd `show` between moves, a forfeit now and
+then, and a little noise (taken cells, moves out of turn). fire() sends the
+requests to a running server, each channel's in order and channels
+concurrently, and summarize() reports throughput, latency percentiles and
+error rates per subcommand.
+
+A request is a dict of the form fields Slack posts; recordings are one JSON
+object per line, so captured traffic in the same shape replays too.
+
+Run it with `manage.py loadtest`.
+"""
+import asyncio
+import collections
+import json
+import random
+import ssl
+import time
+from urllib.parse import urlencode, urlsplit
+
+from games import moves, solver, tictactoe
+
+
+# The schemes post() speaks, and their default ports.
+PORTS = {'http': 80, 'https': 443}
+
+# How likely each cell is to be picked, among the free ones.
+MOVE_WEIGHTS = {5: 4, 1: 3, 3: 3, 7: 3, 9: 3, 2: 2, 4: 2, 6: 2, 8: 2}
+
+Result = collections.namedtuple('Result', 'kind status seconds failed')
+
+
+def team_id(n):
+    return 'TLOAD{}'.format(n)
+
+
+def team_token(n):
+    return 'loadtest-{}'.format(n)
+
+
+def seed(teams, history=0, random_seed=0):
+    """
+    Create the load test teams that don't exist yet, and `history` finished
+    games in other channels so the tables aren't empty.
+    """
+    from games.factories import GameFactory, PlayerFactory
+    from games.models import Game
+    from slack.factories import TeamFactory
+    from slack.models import Team
+
+    existing = set(Team.objects.filter(
+        slack_id__in=[team_id(n) for n in range(teams)],
+    ).values_list('slack_id', flat=True))
+    for n in range(teams):
+        if team_id(n) not in existing:
+            TeamFactory.create(
+                slack_id=team_id(n), token=team_token(n),
+                name='Load test {}'.format(n), domain='loadtest{}'.format(n),
+            )
+    rng = random.Random(random_seed)
+    for n in range(history):
+        x, o = finished_board(rng)
+        game = GameFactory.create(
+            kind=Game.TICTACTOE, channel='CHIST{}'.format(n % 1000),
+            is_active=False,
+            state={'last_move': tictactoe.X if n % 2 else tictactoe.O,
+                   'x': x, 'o': o},
+        )
+        PlayerFactory.create(game=game, name='user1', remote_user_id='U1')
+        PlayerFactory.create(game=game, name='user2', remote_user_id='U2')
+
+
+def weighted(rng, free):
+    """Pick one of the `free` cells, by MOVE_WEIGHTS."""
+    total = sum(MOVE_WEIGHTS[cell] for cell in free)
+    point = rng.uniform(0, total)
+    for cell in free:
+        point -= MOVE_WEIGHTS[cell]
+        if point <= 0:
+            return cell
+    return free[-1]
+
+
+def finished_board(rng):
+    x = o = 0
+    piece = tictactoe.X
+    while tictactoe.outcome(x, o) is None:
+        cell = weighted(rng, free_cells(x, o))
+        x, o = tictactoe.play(x, o, cell, piece)
+        piece = tictactoe.other(piece)
+    return x, o
+
+
+def free_cells(x, o):
+    return [cell for cell in tictactoe.CELLS
+            if tictactoe.piece_at(x, o, cell) == 0]
+
+
+def move_text(rng, cell):
+    """How a player might type `cell`: usually the number, sometimes words."""
+    if rng.random() < 0.7:
+        return str(cell)
+    return rng.choice(moves.MOVE_OPTIONS[cell])
+
+
+def form(team, channel, user, text):
+    return {
+        'token': team_token(team),
+        'team_id': team_id(team),
+        'team_domain': 'loadtest{}'.format(team),
+        'channel_id': channel,
+        'channel_name': channel.lower(),
+        'user_id': user[1],
+        'user_name': user[0],
+        'command': '/tintg',
+        'text': text,
+    }
+
+
+def session(rng, team, channel, users, games, noise=0.05, show_rate=0.3,
+            forfeit_rate=0.03):
+    """The requests for `games` games, one after another, in `channel`."""
+    requests = []
+    for _ in range(games):
+        players = rng.sample(users, 2)
+        requests.append(form(
+            team, channel, players[0], 'tictac @{}'.format(players[1][0]),
+        ))
+        x = o = 0
+        turn = 0
+        piece = tictactoe.X
+        # The server ends games once their result is settled.
+        while solver.forced_outcome(x, o) is None:
+            if rng.random() < show_rate:
+                requests.append(form(
+                    team, channel, rng.choice(players), 'tictac show',
+                ))
+            if rng.random() < forfeit_rate:
+                requests.append(form(
+                    team, channel, players[turn], 'tictac forfeit',
+                ))
+                break
+            free = free_cells(x, o)
+            if rng.random() < noise:
+                # Rejected by the server, so the board doesn't change.
+                if x | o and rng.random() < 0.5:
+                    taken = [cell for cell in tictactoe.CELLS
+                             if cell not in free]
+                    player, cell = players[turn], rng.choice(taken)
+                else:
+                    player, cell = players[1 - turn], rng.choice(free)
+                requests.append(form(
+                    team, channel, player,
+                    'tictac move {}'.format(move_text(rng, cell)),
+                ))
+                continue
+            cell = weighted(rng, free)
+            requests.append(form(
+                team, channel, players[turn],
+                'tictac move {}'.format(move_text(rng, cell)),
+            ))
+            x, o = tictactoe.play(x, o, cell, piece)
+            piece = tictactoe.other(piece)
+            turn = 1 - turn
+    return requests
+
+
+def generate(teams=10, channels=5, games=3, users=20, random_seed=0,
+             run_id=None, **options):
+    """
+    Sessions for `channels` channels in each of `teams` teams, interleaved
+    at random. Channel ids include `run_id`, so runs against the same
+    database don't find each other's games.
+    """
+    rng = random.Random(random_seed)
+    if run_id is None:
+        run_id = '{:x}'.format(int(time.time()))
+    sessions = []
+    for team in range(teams):
+        people = [('user{}'.format(n), 'U{}X{}'.format(team, n))
+                  for n in range(users)]
+        for channel in range(channels):
+            sessions.append(collections.deque(session(
+                rng, team, 'CL{}T{}C{}'.format(run_id, team, channel),
+                people, games, **options
+            )))
+    requests = []
+    while sessions:
+        index = rng.randrange(len(sessions))
+        requests.append(sessions[index].popleft())
+        if not sessions[index]:
+            sessions[index] = sessions[-1]
+            sessions.pop()
+    return requests
+
+
+def write(requests, output):
+    for request in requests:
+        output.write(json.dumps(request, sort_keys=True) + '\n')
+
+
+def read(lines):
+    return [json.loads(line) for line in lines if line.strip()]
+
+
+def kind_of(text):
+    """The subcommand `text` runs, as named in the metrics."""
+    from slack import views
+    return views.router.resolve(views.split_command(text))[0].name
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def check_url(url):
+    """Raise ValueError unless post() can send to `url`."""
+    parts = urlsplit(url)
+    if parts.scheme not in PORTS or not parts.hostname:
+        raise ValueError('expected an http:// or https:// URL, got {!r}'.format(
+            url,
+        ))
+    return parts
+
+
+async def post(url, fields):
+    """POST form `fields` to `url`; return (status, body, seconds taken)."""
+    parts = check_url(url)
+    path = parts.path or '/'
+    if parts.query:
+        path += '?' + parts.query
+    body = urlencode(fields).encode('utf8')
+    started = time.perf_counter()
+    reader, writer = await asyncio.open_connection(
+        parts.hostname, parts.port or PORTS[parts.scheme],
+        ssl=ssl.create_default_context() if parts.scheme == 'https' else None,
+    )
+    # Timeouts cancel the exchange midway; close the socket all the same.
+    try:
+        writer.write((
+            'POST {} HTTP/1.0\r\n'
+            'Host: {}\r\n'
+            'Content-Type: application/x-www-form-urlencoded\r\n'
+            'Content-Length: {}\r\n\r\n'
+        ).format(path, parts.netloc, len(body)).encode('ascii') + body)
+        status_line = await reader.readline()
+        response = await reader.read()
+    finally:
+        writer.close()
+    status = int(status_line.split()[1]) if status_line else 0
+    content = response.partition(b'\r\n\r\n')[2]
+    return status, content, time.perf_counter() - started
+
+
+def failed(content):
+    """Whether a 200 response is the generic error reply."""
+    from slack import views
+    try:
+        return json.loads(content.decode('utf8')).get('text') == views.ERROR
+    except ValueError:
+        return False
+
+
+async def fire(url, requests, concurrency=20, timeout=10, extra=None):
+    """
+    Send `requests` to `url`, each channel's in order, with at most
+    `concurrency` in flight. `extra` fields are added to every request.
+    Returns (results, elapsed seconds).
+    """
+    channels = collections.OrderedDict()
+    for request in requests:
+        channels.setdefault(
+            (request.get('token'), request.get('channel_id')), [],
+        ).append(request)
+    semaphore = asyncio.Semaphore(concurrency)
+    results = []
+
+    async def one(request):
+        kind = kind_of(request.get('text', ''))
+        async with semaphore:
+            try:
+                status, content, seconds = await asyncio.wait_for(
+                    post(url, dict(request, **(extra or {}))), timeout,
+                )
+            except (OSError, asyncio.TimeoutError):
+                results.append(Result(kind, 0, timeout, True))
+                return
+        results.append(Result(kind, status, seconds, failed(content)))
+
+    async def run(channel):
+        for request in channel:
+            await one(request)
+
+    started = time.perf_counter()
+    await asyncio.gather(*[run(channel) for channel in channels.values()])
+    return results, time.perf_counter() - started
+
+
+def summarize(results, elapsed):
+    """
+    Rows of (subcommand, requests, req/s, p50, p90, p99, max, error rate,
+    failed replies), with times in seconds; the last row is the total.
+    """
+    groups = collections.OrderedDict()
+    for result in sorted(results, key=lambda result: result.kind):
+        groups.setdefault(result.kind, []).append(result)
+    groups['all'] = results
+    rows = []
+    for kind, group in groups.items():
+        latencies = [result.seconds for result in group if result.status]
+        errors = sum(1 for result in group if result.status != 200)
+        rows.append((
+            kind,
+            len(group),
+            len(group) / elapsed if elapsed else 0,
+            percentile(latencies, 0.50),
+            percentile(latencies, 0.90),
+            percentile(latencies, 0.99),
+            max(latencies) if latencies else 0,
+            errors / len(group) if group else 0,
+            sum(1 for result in group if result.status == 200 and
+                result.failed),
+        ))
+    return rows
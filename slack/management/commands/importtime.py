@@ -0,0 +1,75 @@
+import json
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = (
+        "Boot a worker in a fresh interpreter and report import time and RSS "
+        "per module, failing if startup is over budget."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--limit', type=int, default=20,
+            help="How many of the slowest modules to list.",
+        )
+        parser.add_argument(
+            '--sort', choices=('self', 'cumulative', 'rss'), default='self',
+        )
+        parser.add_argument(
+            '--budget', type=float,
+            default=getattr(settings, 'TINTG_STARTUP_BUDGET', None),
+            help="Seconds allowed for booting a worker.",
+        )
+        parser.add_argument(
+            '--rss-budget', type=int,
+            default=getattr(settings, 'TINTG_STARTUP_RSS_BUDGET', None),
+            help="KiB of RSS allowed after booting a worker.",
+        )
+
+    def handle(self, *args, **options):
+        # A fresh interpreter, since this one has already imported Django.
+        process = subprocess.Popen(
+            [sys.executable, '-m', 'tintg.startup'],
+            stdout=subprocess.PIPE,
+        )
+        output, _ = process.communicate()
+        if process.returncode:
+            raise CommandError("Booting a worker failed")
+        report = json.loads(output.decode('utf8'))
+
+        modules = sorted(
+            report['modules'], key=lambda record: record[options['sort']],
+            reverse=True,
+        )
+        self.stdout.write('{:>10} {:>10} {:>9}  {}'.format(
+            'self ms', 'cumul. ms', 'RSS KiB', 'module',
+        ))
+        for record in modules[:options['limit']]:
+            self.stdout.write('{:>10.1f} {:>10.1f} {:>9}  {}'.format(
+                record['self'] * 1000,
+                record['cumulative'] * 1000,
+                record['rss'],
+                record['module'],
+            ))
+        self.stdout.write('{} modules imported in {:.0f} ms; RSS {} KiB'.format(
+            len(report['modules']), report['seconds'] * 1000, report['rss'],
+        ))
+
+        over = []
+        if options['budget'] is not None and \
+                report['seconds'] > options['budget']:
+            over.append('{:.0f} ms boot > {:.0f} ms budget'.format(
+                report['seconds'] * 1000, options['budget'] * 1000,
+            ))
+        if options['rss_budget'] is not None and \
+                report['rss'] > options['rss_budget']:
+            over.append('{} KiB RSS > {} KiB budget'.format(
+                report['rss'], options['rss_budget'],
+            ))
+        if over:
+            raise CommandError('Over the startup budget: ' + '; '.join(over))
@@ -0,0 +1,124 @@
+import asyncio
+
+from django.core.management.base import BaseCommand, CommandError
+
+from slack import loadgen
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate or replay slash command traffic, fire it at a running "
+        "server and report throughput, latency percentiles and error rates."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'url', nargs='?',
+            help="The server's slash command URL, e.g. "
+                 "http://127.0.0.1:8000/slack/; http and https work. Without "
+                 "it, traffic is only generated or recorded.",
+        )
+        parser.add_argument('--teams', type=int, default=10)
+        parser.add_argument(
+            '--channels', type=int, default=5, help="Channels per team.",
+        )
+        parser.add_argument(
+            '--games', type=int, default=3, help="Games per channel.",
+        )
+        parser.add_argument(
+            '--users', type=int, default=20, help="Users per team.",
+        )
+        parser.add_argument('--random-seed', type=int, default=0)
+        parser.add_argument(
+            '--concurrency', type=int, default=20,
+            help="Requests in flight at once.",
+        )
+        parser.add_argument(
+            '--timeout', type=float, default=10,
+            help="Seconds before a request counts as failed.",
+        )
+        parser.add_argument(
+            '--seed', action='store_true',
+            help="Create the load test teams in this database first.",
+        )
+        parser.add_argument(
+            '--history', type=int, default=0,
+            help="With --seed, also create this many finished games.",
+        )
+        parser.add_argument(
+            '--record', metavar='PATH',
+            help="Write the requests to PATH, one JSON object per line.",
+        )
+        parser.add_argument(
+            '--replay', metavar='PATH',
+            help="Send the requests recorded in PATH instead of new ones.",
+        )
+        parser.add_argument(
+            '--response-url',
+            help="Send this response_url, so the server may defer commands.",
+        )
+
+    def handle(self, *args, **options):
+        if options['url']:
+            try:
+                loadgen.check_url(options['url'])
+            except ValueError as error:
+                raise CommandError(str(error))
+
+        if options['seed']:
+            loadgen.seed(
+                options['teams'], options['history'], options['random_seed'],
+            )
+            self.stdout.write("Seeded {} teams and {} finished games.".format(
+                options['teams'], options['history'],
+            ))
+
+        if options['replay']:
+            try:
+                with open(options['replay']) as recording:
+                    requests = loadgen.read(recording)
+            except (OSError, ValueError) as error:
+                raise CommandError("Can't replay {}: {}".format(
+                    options['replay'], error,
+                ))
+        else:
+            requests = loadgen.generate(
+                teams=options['teams'],
+                channels=options['channels'],
+                games=options['games'],
+                users=options['users'],
+                random_seed=options['random_seed'],
+            )
+        if options['record']:
+            with open(options['record'], 'w') as recording:
+                loadgen.write(requests, recording)
+        self.stdout.write("{} requests in {} channels.".format(
+            len(requests),
+            len({(r.get('token'), r.get('channel_id')) for r in requests}),
+        ))
+        if not options['url']:
+            return
+
+        extra = {}
+        if options['response_url']:
+            extra['response_url'] = options['response_url']
+        loop = asyncio.get_event_loop()
+        results, elapsed = loop.run_until_complete(loadgen.fire(
+            options['url'], requests, options['concurrency'],
+            options['timeout'], extra,
+        ))
+        self.stdout.write('{:<10} {:>8} {:>8} {:>8} {:>8} {:>8} {:>8} '
+                          '{:>7} {:>6}'.format(
+                              'command', 'requests', 'req/s', 'p50 ms',
+                              'p90 ms', 'p99 ms', 'max ms', 'errors',
+                              'failed'))
+        for row in loadgen.summarize(results, elapsed):
+            kind, count, rate, p50, p90, p99, slowest, errors, failed = row
+            self.stdout.write('{:<10} {:>8} {:>8.1f} {:>8.1f} {:>8.1f} '
+                              '{:>8.1f} {:>8.1f} {:>6.1%} {:>6}'.format(
+                                  kind, count, rate, p50 * 1000, p90 * 1000,
+                                  p99 * 1000, slowest * 1000, errors,
+                                  failed))
+        self.stdout.write("{} requests in {:.1f} s.".format(
+            len(results), elapsed,
+        ))
@@ -0,0 +1,89 @@
+import os
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from slack import provisioning, teams
+
+
+class Command(BaseCommand):
+    help = (
+        "Create or update teams in bulk from a CSV, JSON or JSON Lines file "
+        "of slack_id, name, domain and token, or rotate their tokens, then "
+        "warm the team caches."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', help="The file to read, or - for standard input.",
+        )
+        parser.add_argument(
+            '--format', choices=('csv', 'json', 'jsonl'),
+            help="Defaults to the file's extension.",
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=provisioning.DEFAULT_BATCH_SIZE,
+            help="Teams per transaction.",
+        )
+        parser.add_argument(
+            '--rotate', action='store_true',
+            help="Only change the tokens of existing teams.",
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help="Check the file and stop.",
+        )
+        parser.add_argument(
+            '--no-warm', action='store_false', dest='warm',
+            help="Don't fill the team caches afterwards.",
+        )
+
+    def handle(self, *args, **options):
+        format = options['format']
+        if format is None:
+            format = os.path.splitext(options['path'])[1].lstrip('.').lower()
+            if format not in ('csv', 'json', 'jsonl'):
+                raise CommandError("Give --format for {}".format(
+                    options['path'],
+                ))
+        try:
+            if options['path'] == '-':
+                rows = provisioning.read(sys.stdin, format)
+            else:
+                with open(options['path'], newline='') as source:
+                    rows = provisioning.read(source, format)
+        except (OSError, ValueError, AttributeError, TypeError) as error:
+            raise CommandError("Can't read {}: {}".format(
+                options['path'], error,
+            ))
+
+        if options['dry_run']:
+            errors = provisioning.validate(
+                rows, options['rotate'], options['batch_size'],
+            )
+            if errors:
+                raise CommandError(self.describe(errors))
+            self.stdout.write("{} teams OK.".format(len(rows)))
+            return
+        try:
+            counts = provisioning.upsert_teams(
+                rows, options['batch_size'], options['rotate'],
+                options['warm'],
+            )
+        except provisioning.ProvisioningError as error:
+            raise CommandError(self.describe(error.errors))
+        self.stdout.write(
+            "{created} created, {updated} updated, {unchanged} unchanged."
+            .format(**counts)
+        )
+        if options['warm'] and teams.shared_cache() is None:
+            self.stdout.write(
+                "TINTG_TEAM_CACHE isn't set, so web workers will load the "
+                "teams from the database on first use."
+            )
+
+    def describe(self, errors, limit=20):
+        lines = errors[:limit]
+        if len(errors) > limit:
+            lines.append('... and {} more'.format(len(errors) - limit))
+        return "{} problem(s):\n{}".format(len(errors), '\n'.join(lines))
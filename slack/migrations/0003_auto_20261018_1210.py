@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.5 on 2026-10-18 12:10
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('slack', '0002_auto_20160416_1855'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='team',
+            name='token',
+            field=models.CharField(db_index=True, max_length=255),
+        ),
+    ]
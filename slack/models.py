@@ -5,7 +5,7 @@ class Team(models.Model):
 
     created = models.DateTimeField(auto_now_add=True)
     changed = models.DateTimeField(auto_now=True)
-    token = models.CharField(max_length=255)
+    token = models.CharField(max_length=255, db_index=True)
     name = models.CharField(max_length=255)
     slack_id = models.CharField(max_length=255, unique=True)
     domain = models.CharField(max_length=255)
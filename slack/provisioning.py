@@ -0,0 +1,174 @@
+"""
+Bulk team provisioning.
+
+upsert_teams() creates and updates teams from rows of slack_id, name,
+domain and token, a chunk at a time: one query to find a chunk's existing
+teams, one bulk INSERT for the new ones and CASE-based UPDATEs for the
+changed ones, in one transaction per chunk. Only the columns a row gives
+are written, and with `rotate`, only the tokens of existing teams change. Bulk writes skip the post_save signal, so the
+team caches are invalidated and then warmed here, a chunk at a time.
+
+Run it with `manage.py provision_teams`.
+"""
+import collections
+import csv
+import json
+
+from django.db import connection, transaction
+from django.db.models import Case, CharField, Value, When
+from django.utils import timezone
+
+from . import teams
+from .models import Team
+
+
+FIELDS = ('slack_id', 'name', 'domain', 'token')
+
+UPDATE_FIELDS = ('name', 'domain', 'token')
+
+DEFAULT_BATCH_SIZE = 500
+
+
+class ProvisioningError(Exception):
+    """The rows can't be applied; `errors` says why."""
+
+    def __init__(self, errors):
+        super(ProvisioningError, self).__init__('; '.join(errors))
+        self.errors = errors
+
+
+def read(source, format):
+    """
+    Rows from `source`, a file of CSV with a header, JSON or JSON Lines.
+    Each row has only the FIELDS the file gives for it.
+    """
+    if format == 'csv':
+        rows = list(csv.DictReader(source))
+    elif format == 'jsonl':
+        rows = [json.loads(line) for line in source if line.strip()]
+    else:
+        rows = json.load(source)
+    return [
+        {field: str(row[field] or '').strip()
+         for field in FIELDS if row.get(field) is not None}
+        for row in rows
+    ]
+
+
+def chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def validate(rows, rotate=False, batch_size=DEFAULT_BATCH_SIZE):
+    """Return a list of problems with `rows`; empty if they can be applied."""
+    errors = []
+    slack_ids = set()
+    tokens = {}
+    for number, row in enumerate(rows, 1):
+        if not row.get('slack_id') or not row.get('token'):
+            errors.append('row {}: slack_id and token are required'.format(
+                number,
+            ))
+            continue
+        if row['slack_id'] in slack_ids:
+            errors.append('row {}: {} appears twice'.format(
+                number, row['slack_id'],
+            ))
+        slack_ids.add(row['slack_id'])
+        if row['token'] in tokens:
+            errors.append('row {}: {} has the same token as {}'.format(
+                number, row['slack_id'], tokens[row['token']],
+            ))
+        tokens[row['token']] = row['slack_id']
+
+    # Tokens identify teams, so none may stay with a team not in the rows.
+    for chunk in chunks(sorted(tokens), batch_size):
+        for slack_id, token in Team.objects.filter(
+            token__in=chunk,
+        ).values_list('slack_id', 'token'):
+            if slack_id != tokens[token] and slack_id not in slack_ids:
+                errors.append('{} has the token given for {}'.format(
+                    slack_id, tokens[token],
+                ))
+    # Rotating only changes tokens, so every team must exist already.
+    if rotate:
+        id_list = sorted(slack_ids)
+        for chunk in chunks(id_list, batch_size):
+            known = set(Team.objects.filter(
+                slack_id__in=chunk,
+            ).values_list('slack_id', flat=True))
+            errors.extend(
+                '{} is not a registered team'.format(slack_id)
+                for slack_id in chunk if slack_id not in known
+            )
+    return errors
+
+
+def bulk_update(changes, fields):
+    """
+    Set `fields` on each team in `changes`, a list of (team, row) pairs,
+    with one UPDATE ... CASE statement per batch the database allows.
+    """
+    # Two parameters per field per team for the CASE, one for the IN list.
+    params = ['pk'] + ['value'] * 2 * len(fields)
+    size = max(1, connection.ops.bulk_batch_size(params, changes))
+    now = timezone.now()
+    for batch in chunks(changes, size):
+        Team.objects.filter(pk__in=[team.pk for team, row in batch]).update(
+            changed=now,
+            **{
+                field: Case(
+                    *[When(pk=team.pk, then=Value(row[field]))
+                      for team, row in batch],
+                    output_field=CharField()
+                )
+                for field in fields
+            }
+        )
+
+
+def upsert_teams(rows, batch_size=DEFAULT_BATCH_SIZE, rotate=False,
+                 warm=True):
+    """
+    Apply `rows`, a chunk of `batch_size` per transaction. Returns counts
+    of created, updated and unchanged teams. Raises ProvisioningError,
+    before writing anything, if the rows don't validate.
+    """
+    errors = validate(rows, rotate, batch_size)
+    if errors:
+        raise ProvisioningError(errors)
+    allowed = ('token',) if rotate else UPDATE_FIELDS
+    counts = {'created': 0, 'updated': 0, 'unchanged': 0}
+    for chunk in chunks(rows, batch_size):
+        slack_ids = [row['slack_id'] for row in chunk]
+        with transaction.atomic():
+            existing = {
+                team.slack_id: team
+                for team in Team.objects.filter(slack_id__in=slack_ids)
+            }
+            new = []
+            # Teams to update, grouped by the fields their rows give.
+            changes = collections.OrderedDict()
+            for row in chunk:
+                team = existing.get(row['slack_id'])
+                fields = tuple(field for field in allowed if field in row)
+                if team is None:
+                    new.append(Team(**row))
+                elif any(getattr(team, field) != row[field]
+                         for field in fields):
+                    changes.setdefault(fields, []).append((team, row))
+                else:
+                    counts['unchanged'] += 1
+            Team.objects.bulk_create(new, batch_size=batch_size)
+            for fields, group in changes.items():
+                bulk_update(group, fields)
+        changed = [team for group in changes.values() for team, row in group]
+        counts['created'] += len(new)
+        counts['updated'] += len(changed)
+        # The old tokens must stop resolving; the teams as they are now
+        # are what the webhook will look up next.
+        teams.invalidate_many(changed)
+        if warm:
+            teams.warm(Team.objects.filter(slack_id__in=slack_ids))
+    return counts
@@ -0,0 +1,59 @@
+"""
+JSON responses for slash commands.
+
+Most replies are constant: help, errors, how to start. Those are built with
+static(), which encodes the payload once at import time, so serving one
+costs an HttpResponse and nothing else. Dynamic payloads (boards, turns) are
+encoded per request with ujson when it is installed, and the standard
+library otherwise.
+"""
+import json
+import time
+
+from django.http import HttpResponse
+from tintg import metrics
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+
+CONTENT_TYPE = 'application/json'
+
+
+def dumps(payload):
+    """Encode `payload` as compact JSON bytes."""
+    if ujson is not None:
+        return ujson.dumps(
+            payload, ensure_ascii=False, escape_forward_slashes=False,
+        ).encode('utf8')
+    return stdlib_dumps(payload)
+
+
+def stdlib_dumps(payload):
+    return json.dumps(
+        payload, ensure_ascii=False, separators=(',', ':'),
+    ).encode('utf8')
+
+
+class Static(dict):
+    """A payload whose JSON encoding is computed once, in `content`."""
+
+    def __init__(self, *args, **kwargs):
+        super(Static, self).__init__(*args, **kwargs)
+        self.content = dumps(self)
+
+
+def static(payload):
+    return Static(payload)
+
+
+def render(payload):
+    """An HttpResponse for `payload`, reusing a static payload's bytes."""
+    content = getattr(payload, 'content', None)
+    if content is None:
+        started = time.perf_counter()
+        content = dumps(payload)
+        metrics.serialized(time.perf_counter() - started)
+    return HttpResponse(content, content_type=CONTENT_TYPE)
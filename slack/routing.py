@@ -0,0 +1,151 @@
+"""
+Slash command routing.
+
+Commands live in a trie keyed on the words of the command text, so
+dispatching `/tintg tictac move 5` is one dict lookup per word however many
+games and subcommands are registered. A node can also capture a word it has
+no literal route for: the root captures the game command, binding its engine
+for everything below it. Each command declares the arguments it takes, and
+help is generated from the same declarations.
+"""
+import collections
+
+from tintg import metrics
+
+
+class Command(object):
+    """
+    A handler and the arguments it takes.
+
+    `arguments` names the words that follow the command; with `greedy`, the
+    last argument takes the rest of the text. If words are missing or left
+    over, the `missing` or `extra` payload is returned instead of calling
+    the handler; extra words are ignored when `extra` is None. `usage` and
+    `help` are formatted with the captured values for the help listing, and
+    `when`, given those values, says whether the command exists at all.
+    `name` tags the command's metrics; it defaults to the handler's name.
+    """
+
+    def __init__(self, handler, arguments=(), greedy=False, missing=None,
+                 extra=None, usage=None, help=None, when=None,
+                 uses_database=False, name=None):
+        self.handler = handler
+        self.name = name or handler.__name__
+        self.arguments = tuple(arguments)
+        self.greedy = greedy
+        self.missing = missing
+        self.extra = extra
+        self.usage = usage
+        self.help = help
+        self.when = when
+        self.uses_database = uses_database
+
+    def available(self, captured):
+        return self.when is None or self.when(**captured)
+
+    def bind(self, words):
+        """Return (kwargs, None) for `words`, or (None, error payload)."""
+        count = len(self.arguments)
+        if len(words) < count:
+            return None, self.missing
+        if len(words) > count and not self.greedy and self.extra is not None:
+            return None, self.extra
+        values = list(words[:count])
+        if self.greedy and count:
+            values[-1] = ' '.join(words[count - 1:])
+        return dict(zip(self.arguments, values)), None
+
+    def __call__(self, data, captured, words):
+        metrics.tag(subcommand=self.name)
+        kwargs, error = self.bind(words)
+        if kwargs is None:
+            metrics.tag(outcome='bad_arguments')
+            return error
+        kwargs.update(captured)
+        return self.handler(data, **kwargs)
+
+
+class Node(object):
+
+    def __init__(self, command=None):
+        self.command = command
+        self.children = collections.OrderedDict()
+        self.capture = None
+
+    def add(self, path, command):
+        """Route the words in `path`, e.g. ('move',), to `command`."""
+        node = self
+        for word in path:
+            node = node.children.setdefault(word, Node())
+        node.command = command
+        return command
+
+    def route(self, *path, **options):
+        """Decorator form of add(): @node.route('show', help=...)."""
+        options.setdefault('name', ' '.join(path))
+
+        def decorator(handler):
+            self.add(path, Command(handler, **options))
+            return handler
+        return decorator
+
+    def capture_with(self, name, convert, node=None):
+        """
+        Capture a word with no literal route: `convert(word)` gives the value
+        bound to `name`, or None if the word doesn't match.
+        """
+        self.capture = (name, convert, node or Node())
+        return self.capture[2]
+
+    def resolve(self, words):
+        """
+        Walk `words` as far as the routes go. Returns (command, captured
+        values, remaining words) for the deepest command on the way; the
+        command is None if there isn't one.
+        """
+        node = self
+        captured = {}
+        found = (self.command, captured, 0)
+        for index, word in enumerate(words):
+            child = node.children.get(word)
+            if child is not None and child.command is not None and \
+                    not child.command.available(captured):
+                child = None
+            if child is None and node.capture is not None:
+                name, convert, capture_node = node.capture
+                value = convert(word)
+                if value is not None:
+                    captured = dict(captured, **{name: value})
+                    child = capture_node
+            if child is None:
+                break
+            node = child
+            if node.command is not None:
+                found = (node.command, captured, index + 1)
+        command, captured, consumed = found
+        return command, captured, words[consumed:]
+
+    def dispatch(self, data, words):
+        command, captured, rest = self.resolve(words)
+        return command(data, captured, rest)
+
+    def help_lines(self, prefix, **captured):
+        """Usage lines for this node's command and its children's."""
+        lines = []
+        if self.command is not None and self.command.help and \
+                self.command.available(captured):
+            lines.append(self._help_line(prefix, self.command, captured))
+        for word, child in self.children.items():
+            command = child.command
+            if command is not None and command.help and \
+                    command.available(captured):
+                lines.append(self._help_line(
+                    '{} {}'.format(prefix, word), command, captured,
+                ))
+        return lines
+
+    def _help_line(self, prefix, command, captured):
+        usage = prefix
+        if command.usage:
+            usage = '{} {}'.format(prefix, command.usage.format(**captured))
+        return "`{}` - {}".format(usage, command.help.format(**captured))
@@ -0,0 +1,164 @@
+"""
+Team resolution for incoming slash commands.
+
+Every webhook request starts by turning its token into a Team, and teams
+almost never change, so lookups go through a small LRU cache in each worker
+process. Setting TINTG_TEAM_CACHE to the name of an entry in CACHES adds a
+second, shared layer in front of the database. Saving or deleting a Team
+invalidates the shared layer and this process's LRU; other processes pick
+the change up within TINTG_TEAM_CACHE_TIMEOUT seconds.
+"""
+import collections
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from tintg import metrics
+
+from .models import Team
+
+
+class TeamCache(object):
+    """A thread-safe, size-bounded LRU map from token to Team with a TTL."""
+
+    def __init__(self, size, timeout):
+        self.size = size
+        self.timeout = timeout
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, token):
+        with self.lock:
+            entry = self.entries.get(token)
+            if entry is None:
+                return None
+            team, expires = entry
+            if expires < time.monotonic():
+                del self.entries[token]
+                return None
+            self.entries.move_to_end(token)
+            return team
+
+    def set(self, token, team):
+        with self.lock:
+            self.entries[token] = (team, time.monotonic() + self.timeout)
+            self.entries.move_to_end(token)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def discard(self, team):
+        """Drop `team` under any token it was cached with."""
+        self.discard_many([team])
+
+    def discard_many(self, teams):
+        tokens = {team.token for team in teams}
+        pks = {team.pk for team in teams}
+        with self.lock:
+            stale = [
+                token for token, (cached, expires) in self.entries.items()
+                if token in tokens or cached.pk in pks
+            ]
+            for token in stale:
+                del self.entries[token]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+local_teams = TeamCache(
+    size=getattr(settings, 'TINTG_TEAM_CACHE_SIZE', 1024),
+    timeout=getattr(settings, 'TINTG_TEAM_CACHE_TIMEOUT', 300),
+)
+
+
+def shared_cache():
+    alias = getattr(settings, 'TINTG_TEAM_CACHE', None)
+    if alias:
+        return caches[alias]
+    return None
+
+
+def token_key(token):
+    return 'tintg:team-token:{}'.format(token)
+
+
+def team_key(pk):
+    return 'tintg:team-id:{}'.format(pk)
+
+
+def get_team(token):
+    """Return the Team registered with `token`, or None."""
+    if not token:
+        return None
+    team = local_teams.get(token)
+    metrics.cache_result('team', team is not None)
+    if team is None:
+        team = load_team(token)
+        if team is not None:
+            local_teams.set(token, team)
+    return team
+
+
+def load_team(token):
+    cache = shared_cache()
+    if cache is not None:
+        team = cache.get(token_key(token))
+        metrics.cache_result('team_shared', team is not None)
+        if team is not None:
+            return team
+    # Tokens aren't unique: while provisioning swaps tokens across chunks,
+    # two teams briefly share one, and the one changed last has it now.
+    team = Team.objects.filter(token=token).order_by('-changed', '-pk').first()
+    if team is None:
+        return None
+    if cache is not None:
+        cache.set_many({
+            token_key(token): team,
+            team_key(team.pk): token,
+        }, getattr(settings, 'TINTG_TEAM_CACHE_TIMEOUT', 300))
+    return team
+
+
+def invalidate(team):
+    invalidate_many([team])
+
+
+def invalidate_many(teams):
+    """Forget `teams`, under their current and any previous tokens."""
+    teams = list(teams)
+    local_teams.discard_many(teams)
+    cache = shared_cache()
+    if cache is not None:
+        team_keys = [team_key(team.pk) for team in teams]
+        keys = [token_key(team.token) for team in teams] + team_keys
+        keys.extend(
+            token_key(old_token)
+            for old_token in cache.get_many(team_keys).values() if old_token
+        )
+        cache.delete_many(keys)
+
+
+def warm(teams):
+    """Cache `teams` in this process, and in the shared cache in one write."""
+    teams = list(teams)
+    for team in teams[-local_teams.size:]:
+        local_teams.set(team.token, team)
+    cache = shared_cache()
+    if cache is not None:
+        entries = {}
+        for team in teams:
+            entries[token_key(team.token)] = team
+            entries[team_key(team.pk)] = team.token
+        cache.set_many(
+            entries, getattr(settings, 'TINTG_TEAM_CACHE_TIMEOUT', 300),
+        )
+
+
+def clear():
+    local_teams.clear()
+
+
+def team_changed(sender, instance, **kwargs):
+    invalidate(instance)
@@ -1,18 +1,47 @@
+import asyncio
+import datetime
+import importlib
+import io
 import json
-from django.test import TestCase
+import os
+import shutil
+import sys
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.test import (
+    LiveServerTestCase,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
 from django.test.client import RequestFactory
 from games.factories import (
     GameFactory,
     PlayerFactory,
 )
+from games import engines, services, snapshots
 from games.models import Game
+from . import background
+from . import loadgen
+from . import provisioning
+from . import responses
+from . import routing
 from . import factories
+from . import teams
 from . import views
+from tintg import db, metrics, startup, webhook
 
 
 class SlashCommandTests(TestCase):
 
     def setUp(self):
+        teams.clear()
+        cache.clear()
         self.request_factory = RequestFactory()
         self.team = factories.TeamFactory.create()
 
@@ -76,6 +105,19 @@ class SlashCommandTests(TestCase):
             'text': views.HOW_TO_START,
         })
 
+    def test_how_to_start(self):
+        request = self.make_command_request('', 'Stewart', 'C12345')
+        response = views.slash_command(request)
+        self.assertJSONEqual(str(response.content, encoding='utf8'), {
+            'text': views.HOW_TO_START,
+        })
+        request = self.make_command_request('chess e4', 'Stewart', 'C12345')
+        response = views.slash_command(request)
+        self.assertJSONEqual(str(response.content, encoding='utf8'), {
+            'text': views.HOW_TO_START,
+            'mrkdwn': True,
+        })
+
     def test_tictac_already_channel(self):
         game = GameFactory.create(channel='C98765')
         request = self.make_command_request('tictac @cal', 'Stewart', 'C98765')
@@ -164,6 +206,38 @@ class SlashCommandTests(TestCase):
             }]
         })
 
+    def test_tictac_forced_results(self):
+        game = GameFactory.create(channel='C98765')
+        game.state = {
+            'last_move': 'X',
+            'board': [[0,0,0],[0,'X',0],[0,0,0]]
+        }
+        game.save()
+        PlayerFactory.create(game=game, name='Stewart', is_current=True)
+        PlayerFactory.create(game=game, name='cal')
+        request = self.make_command_request('tictac move 2', 'Stewart', 'C98765')
+        response = json.loads(str(
+            views.slash_command(request).content, encoding='utf8',
+        ))
+        self.assertEqual(
+            response['text'],
+            "cal can't be stopped now, so cal has won the game!",
+        )
+
+        game = GameFactory.create(channel='C98766')
+        game.state = {
+            'last_move': 'X',
+            'board': [['X','O','X'],[0,0,0],['O','X',0]]
+        }
+        game.save()
+        PlayerFactory.create(game=game, name='Stewart', is_current=True)
+        PlayerFactory.create(game=game, name='cal')
+        request = self.make_command_request('tictac move 9', 'Stewart', 'C98766')
+        response = json.loads(str(
+            views.slash_command(request).content, encoding='utf8',
+        ))
+        self.assertEqual(response['text'], views.FORCED_TIE)
+
     def test_tictac_invalid_move(self):
         game = GameFactory.create(channel='C98765')
         game.state = {
@@ -255,6 +329,29 @@ class SlashCommandTests(TestCase):
         })
         game = Game.objects.get(id=game.id)
         self.assertFalse(game.is_active)
+        # cal wins, though Stewart could have forced a win from here.
+        self.assertEqual(game.outcome, 'O')
+
+    def test_tictac_forfeit_after_a_move(self):
+        self.test_tictac_new_game()
+        get_players = views.get_players
+
+        def move_first(game, data):
+            # The other player's move commits while the forfeit is running.
+            services.play_move('C12345', 'Stewart', 'U12345', 'center')
+            return get_players(game, data)
+
+        with mock.patch.object(views, 'get_players', move_first):
+            response = views.slash_command(
+                self.make_command_request('tictac forfeit', 'cal', 'C12345'),
+            )
+        self.assertJSONEqual(str(response.content, encoding='utf8'), {
+            'text': views.MOVE_CONFLICT.format('tictac'),
+        })
+        game = Game.objects.get(channel='C12345')
+        self.assertTrue(game.is_active)
+        self.assertEqual(game.outcome, '')
+        self.assertEqual(game.ply, 1)
 
     def test_tictac_forfeit_no_players(self):
         game = GameFactory.create(channel='C98765')
@@ -269,6 +366,112 @@ class SlashCommandTests(TestCase):
             'text': views.ERROR,
         })
 
+    @override_settings(TINTG_GAME_CACHE_SHARED=True)
+    def test_tictac_show_from_cache(self):
+        self.test_tictac_new_game()
+        views.slash_command(
+            self.make_command_request('tictac move center', 'Stewart', 'C12345'),
+        )
+        with self.assertNumQueries(0):
+            response = views.slash_command(
+                self.make_command_request('tictac show', 'cal', 'C12345'),
+            )
+        self.assertJSONEqual(str(response.content, encoding='utf8'), {
+            'response_type': 'in_channel',
+            'text': "It is cal's turn.",
+            'attachments': [
+                {
+                    'text': ":white_medium_square: :white_medium_square: :white_medium_square: \n:white_medium_square: :x: :white_medium_square: \n:white_medium_square: :white_medium_square: :white_medium_square: "
+                }
+            ]
+        })
+
+    def test_tictac_help_without_queries(self):
+        teams.get_team(self.team.token)
+        with self.assertNumQueries(0):
+            response = views.slash_command(
+                self.make_command_request('tictac help', 'Stewart', 'C12345'),
+            )
+        self.assertEqual(response.status_code, 200)
+
+    def test_tictac_forfeit_clears_cache(self):
+        self.test_tictac_new_game()
+        self.assertIsNotNone(snapshots.get('C12345'))
+        views.slash_command(
+            self.make_command_request('tictac forfeit', 'cal', 'C12345'),
+        )
+        self.assertIsNone(snapshots.get('C12345'))
+
+    def test_tictac_bot(self):
+        request = self.make_command_request('tictac bot', 'Stewart', 'C12345')
+        response = views.slash_command(request)
+        self.assertJSONEqual(str(response.content, encoding='utf8'), {
+            'response_type': 'in_channel',
+            'text': "Stewart has challenged tintg to TicTacToe! It is Stewart's turn.",
+            'attachments': [
+                {
+                    'text': ":white_medium_square: :white_medium_square: :white_medium_square: \n:white_medium_square: :white_medium_square: :white_medium_square: \n:white_medium_square: :white_medium_square: :white_medium_square: "
+                }
+            ]
+        })
+        request = self.make_command_request('tictac move 1', 'Stewart', 'C12345')
+        response = views.slash_command(request)
+        self.assertJSONEqual(str(response.content, encoding='utf8'), {
+            'response_type': 'in_channel',
+            'text': "Stewart has played and tintg answered. It's Stewart's turn now.",
+            'attachments': [
+                {
+                    'text': ":x: :white_medium_square: :white_medium_square: \n:white_medium_square: :o: :white_medium_square: \n:white_medium_square: :white_medium_square: :white_medium_square: "
+                }
+            ]
+        })
+
+    def test_connect_four(self):
+        request = self.make_command_request('connect4 @cal', 'Stewart', 'C12345')
+        response = views.slash_command(request)
+        content = json.loads(str(response.content, encoding='utf8'))
+        self.assertEqual(
+            content['text'],
+            "Stewart has challenged cal to Connect Four! It is Stewart's turn.",
+        )
+        request = self.make_command_request('connect4 move 4', 'Stewart', 'C12345')
+        response = views.slash_command(request)
+        content = json.loads(str(response.content, encoding='utf8'))
+        self.assertEqual(content['text'], "Stewart has played. It's cal's turn now.")
+        self.assertEqual(
+            content['attachments'][0]['text'].split('\n')[-1],
+            ':white_medium_square: ' * 3 + ':x: ' + ':white_medium_square: ' * 3,
+        )
+        request = self.make_command_request('connect4 help', 'cal', 'C12345')
+        response = views.slash_command(request)
+        content = json.loads(str(response.content, encoding='utf8'))
+        self.assertEqual(content['text'], "Help for connect four")
+
+    def test_commands_for_another_kind_of_game(self):
+        self.test_tictac_new_game()
+        wrong_game = {
+            'text': "The game going in this channel is TicTacToe. "
+                    "You can play it with `/tintg tictac`.",
+        }
+        for text in ('connect4 move 3', 'connect4 show', 'connect4 forfeit'):
+            request = self.make_command_request(text, 'Stewart', 'C12345')
+            response = views.slash_command(request)
+            self.assertJSONEqual(
+                str(response.content, encoding='utf8'), wrong_game,
+            )
+        game = Game.objects.get(channel='C12345')
+        self.assertTrue(game.is_active)
+        self.assertEqual(game.ply, 0)
+
+    def test_move_conflict_names_the_command(self):
+        self.assertEqual(
+            json.loads(views.move_conflict(
+                engines.get('connectfour'),
+            ).content.decode('utf8'))['text'],
+            "Whoa, someone else moved at the same time. Take a look with "
+            "`/tintg connect4 show` and try again.",
+        )
+
     def test_tictac_help(self):
         request = self.make_command_request('tictac help', 'Stewart', 'C98765')
         response = views.slash_command(request)
@@ -280,3 +483,956 @@ class SlashCommandTests(TestCase):
             }], 
         })
 
+    def test_tictac_help_text(self):
+        # Generated from the routes; pinned so changes to it are deliberate.
+        self.assertEqual(views.TICTAC_HELP, (
+            "`/tintg tictac [username]` - starts a new game\n"
+            "`/tintg tictac bot` - starts a new game against me\n"
+            "`/tintg tictac move [space]` - play in an empty space\n"
+            "`/tintg tictac show` - show current board state\n"
+            "`/tintg tictac forfeit` - leave a game you're playing\n"
+            "`/tintg tictac help` - display this help"
+        ))
+
+
+    def test_commands_without_a_game(self):
+        for text in ('tictac move 5', 'tictac show', 'tictac forfeit'):
+            request = self.make_command_request(text, 'Stewart', 'C12345')
+            response = views.slash_command(request)
+            self.assertJSONEqual(str(response.content, encoding='utf8'), {
+                'text': views.NO_GAME.format('tictac'),
+            })
+        self.assertFalse(Game.objects.filter(channel='C12345').exists())
+
+    def test_tictac_too_many_players(self):
+        request = self.make_command_request('tictac cal bob', 'Stewart', 'C12345')
+        response = views.slash_command(request)
+        self.assertJSONEqual(str(response.content, encoding='utf8'), {
+            'text': views.BAD_PLAYER_NAME,
+        })
+
+    def test_bot_is_a_player_name_without_a_bot(self):
+        request = self.make_command_request('connect4 bot', 'Stewart', 'C12345')
+        response = views.slash_command(request)
+        content = json.loads(str(response.content, encoding='utf8'))
+        self.assertEqual(
+            content['text'],
+            "Stewart has challenged bot to Connect Four! It is Stewart's turn.",
+        )
+
+
+class RoutingTests(TestCase):
+
+    def setUp(self):
+        self.root = routing.Node(routing.Command(lambda data: 'root'))
+        self.games = self.root.capture_with(
+            'game', lambda word: word.upper() if word.startswith('g') else None,
+        )
+        self.games.command = routing.Command(
+            lambda data, game, name: (game, name),
+            arguments=('name',),
+            missing='missing',
+            extra='extra',
+            usage='[name]',
+            help="start {game}",
+        )
+        self.games.route(
+            'say', arguments=('words',), greedy=True, help="say something",
+        )(lambda data, game, words: words)
+        self.games.route(
+            'secret', when=lambda game: game == 'GOLF', help="hidden",
+        )(lambda data, game: 'secret')
+
+    def test_dispatch(self):
+        self.assertEqual(self.root.dispatch({}, []), 'root')
+        self.assertEqual(self.root.dispatch({}, ['nope', 'x']), 'root')
+        self.assertEqual(self.root.dispatch({}, ['go', 'cal']), ('GO', 'cal'))
+        self.assertEqual(self.root.dispatch({}, ['go']), 'missing')
+        self.assertEqual(self.root.dispatch({}, ['go', 'a', 'b']), 'extra')
+        self.assertEqual(
+            self.root.dispatch({}, ['go', 'say', 'hi', 'there']), 'hi there',
+        )
+
+    def test_unavailable_command_falls_back(self):
+        self.assertEqual(self.root.dispatch({}, ['golf', 'secret']), 'secret')
+        self.assertEqual(
+            self.root.dispatch({}, ['go', 'secret']), ('GO', 'secret'),
+        )
+
+    def test_help_lines(self):
+        self.assertEqual(self.games.help_lines('/x go', game='GO'), [
+            "`/x go [name]` - start GO",
+            "`/x go say` - say something",
+        ])
+
+    def test_deferrable(self):
+        self.assertFalse(views.is_deferrable(['tictac']))
+        self.assertFalse(views.is_deferrable(['tictac', 'help']))
+        self.assertFalse(views.is_deferrable(['hello']))
+        self.assertTrue(views.is_deferrable(['tictac', 'show']))
+        self.assertTrue(views.is_deferrable(['connect4', '@cal']))
+
+
+class ResponseTests(TestCase):
+
+    def test_static_payload_is_encoded_once(self):
+        payload = responses.static({'text': 'hi'})
+        self.assertEqual(json.loads(payload.content.decode('utf8')), {'text': 'hi'})
+        payload.content = b'{"text":"cached"}'
+        response = responses.render(payload)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertEqual(response.content, b'{"text":"cached"}')
+
+    def test_dynamic_payload(self):
+        response = responses.render({'text': 'Zoë has played. It\'s 🤖\'s turn now.'})
+        self.assertJSONEqual(str(response.content, encoding='utf8'), {
+            'text': 'Zoë has played. It\'s 🤖\'s turn now.',
+        })
+
+    def test_encoders_agree(self):
+        payload = {'text': 'a/b "c"', 'attachments': [{'text': 'é\n🤖'}]}
+        self.assertEqual(
+            responses.dumps(payload), responses.stdlib_dumps(payload),
+        )
+        self.assertEqual(
+            json.loads(responses.stdlib_dumps(payload).decode('utf8')),
+            payload,
+        )
+
+
+class TeamLookupTests(TestCase):
+
+    def setUp(self):
+        teams.clear()
+        cache.clear()
+        self.team = factories.TeamFactory.create()
+
+    def test_lookup_is_cached(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(teams.get_team(self.team.token), self.team)
+        with self.assertNumQueries(0):
+            self.assertEqual(teams.get_team(self.team.token), self.team)
+
+    def test_unknown_token(self):
+        self.assertIsNone(teams.get_team('nope'))
+        self.assertIsNone(teams.get_team(''))
+        self.assertIsNone(teams.get_team(None))
+
+    def test_token_rotation_invalidates(self):
+        old_token = self.team.token
+        teams.get_team(old_token)
+        self.team.token = 'a-brand-new-token'
+        self.team.save()
+        self.assertIsNone(teams.get_team(old_token))
+        self.assertEqual(teams.get_team('a-brand-new-token'), self.team)
+
+    def test_delete_invalidates(self):
+        teams.get_team(self.team.token)
+        self.team.delete()
+        self.assertIsNone(teams.get_team(self.team.token))
+
+    @override_settings(TINTG_TEAM_CACHE='default')
+    def test_shared_cache(self):
+        teams.get_team(self.team.token)
+        teams.clear()
+        with self.assertNumQueries(0):
+            self.assertEqual(teams.get_team(self.team.token), self.team)
+        old_token = self.team.token
+        self.team.token = 'a-brand-new-token'
+        self.team.save()
+        teams.clear()
+        self.assertIsNone(teams.get_team(old_token))
+
+    def test_lru_eviction_and_timeout(self):
+        lru = teams.TeamCache(size=2, timeout=300)
+        one, two, three = [
+            factories.TeamFactory.create(slack_id=slack_id, token=slack_id)
+            for slack_id in ('T1', 'T2', 'T3')
+        ]
+        lru.set('T1', one)
+        lru.set('T2', two)
+        lru.get('T1')
+        lru.set('T3', three)
+        self.assertEqual(lru.get('T1'), one)
+        self.assertIsNone(lru.get('T2'))
+        self.assertEqual(lru.get('T3'), three)
+        expired = teams.TeamCache(size=2, timeout=-1)
+        expired.set('T1', one)
+        self.assertIsNone(expired.get('T1'))
+
+
+class WebhookTests(TestCase):
+
+    def test_dispatches_slash_commands_to_lean_handler(self):
+        calls = []
+
+        def app(name):
+            return lambda environ, start_response: calls.append(name)
+
+        dispatcher = webhook.WebhookDispatcher(app('full'), app('webhook'))
+        dispatcher({'REQUEST_METHOD': 'POST', 'PATH_INFO': '/slack/'}, None)
+        dispatcher({'REQUEST_METHOD': 'GET', 'PATH_INFO': '/slack/'}, None)
+        dispatcher({'REQUEST_METHOD': 'POST', 'PATH_INFO': '/admin/'}, None)
+        self.assertEqual(calls, ['webhook', 'full', 'full'])
+
+    def test_lean_handler_middleware(self):
+        handler = webhook.WebhookHandler()
+        with self.settings(TINTG_WEBHOOK_MIDDLEWARE=(
+            'django.middleware.security.SecurityMiddleware',
+            'django.middleware.common.CommonMiddleware',
+        )):
+            handler.load_middleware()
+        self.assertEqual(
+            [type(m.__self__).__name__ for m in handler._request_middleware],
+            ['SecurityMiddleware', 'CommonMiddleware'],
+        )
+        self.assertEqual(len(handler._response_middleware), 2)
+
+
+class StartupTests(TestCase):
+
+    def test_profile_times_imports(self):
+        sys.modules.pop('colorsys', None)
+        records, seconds, rss = startup.profile(
+            lambda: importlib.import_module('colorsys'),
+        )
+        self.assertEqual([r['module'] for r in records], ['colorsys'])
+        self.assertGreaterEqual(records[0]['cumulative'], records[0]['self'])
+        self.assertGreater(rss, 0)
+
+    def test_importtime_budget(self):
+        with self.assertRaisesRegex(CommandError, 'Over the startup budget'):
+            call_command('importtime', budget=0.001, stdout=io.StringIO())
+
+
+class FakeConnectionWrapper(object):
+
+    def __init__(self, usable=True):
+        self.connection = object()
+        self.in_atomic_block = False
+        self.usable = usable
+        self.pings = 0
+
+    def is_usable(self):
+        self.pings += 1
+        return self.usable
+
+    def close(self):
+        self.connection = None
+
+
+class ConnectionHealthCheckTests(TestCase):
+
+    def test_dead_connection_is_closed(self):
+        dead = FakeConnectionWrapper(usable=False)
+        live = FakeConnectionWrapper()
+        self.assertEqual(db.ensure_usable([dead, live], interval=30), 1)
+        self.assertIsNone(dead.connection)
+        self.assertIsNotNone(live.connection)
+
+    def test_checks_are_throttled(self):
+        wrapper = FakeConnectionWrapper()
+        db.ensure_usable([wrapper], interval=30)
+        db.ensure_usable([wrapper], interval=30)
+        self.assertEqual(wrapper.pings, 1)
+        db.ensure_usable([wrapper], interval=0)
+        self.assertEqual(wrapper.pings, 2)
+
+    def test_reconnect_is_checked_again(self):
+        wrapper = FakeConnectionWrapper()
+        db.ensure_usable([wrapper], interval=30)
+        wrapper.connection = object()
+        db.ensure_usable([wrapper], interval=30)
+        self.assertEqual(wrapper.pings, 2)
+
+    def test_skips_closed_and_transactional_connections(self):
+        closed = FakeConnectionWrapper(usable=False)
+        closed.connection = None
+        busy = FakeConnectionWrapper(usable=False)
+        busy.in_atomic_block = True
+        self.assertEqual(db.ensure_usable([closed, busy], interval=0), 0)
+        self.assertEqual(busy.pings, 0)
+
+    def test_runs_on_each_request(self):
+        self.team = factories.TeamFactory.create()
+        with self.settings(TINTG_DB_HEALTH_CHECK_INTERVAL=0):
+            response = self.client.post('/slack/', {
+                'token': self.team.token,
+                'channel_id': 'C12345',
+                'user_id': 'U12345',
+                'user_name': 'Stewart',
+                'text': 'tictac help',
+            })
+        self.assertEqual(response.status_code, 200)
+
+
+class StubSlack(object):
+    """A local stand-in for Slack's response_url endpoint."""
+
+    def __init__(self):
+        self.payloads = []
+        self.received = threading.Event()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_POST(self):
+                length = int(self.headers['Content-Length'])
+                stub.payloads.append(
+                    json.loads(self.rfile.read(length).decode('utf8')),
+                )
+                self.send_response(200)
+                self.end_headers()
+                stub.received.set()
+
+            def log_message(self, *args):
+                pass
+
+        self.server = HTTPServer(('127.0.0.1', 0), Handler)
+        self.origin = 'http://127.0.0.1:{}'.format(self.server.server_port)
+        self.url = self.origin + '/commands/1234/5678'
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def wait(self, timeout=5):
+        received = self.received.wait(timeout)
+        self.received.clear()
+        return received
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@override_settings(TINTG_ASYNC_COMMANDS=True)
+class BackgroundCommandTests(TransactionTestCase):
+
+    def setUp(self):
+        teams.clear()
+        cache.clear()
+        self.team = factories.TeamFactory.create()
+        self.slack = StubSlack()
+        self.addCleanup(self.slack.close)
+        origins = self.settings(
+            TINTG_RESPONSE_URL_ORIGINS=(self.slack.origin,),
+        )
+        origins.enable()
+        self.addCleanup(origins.disable)
+        self.request_factory = RequestFactory()
+
+    def post(self, text, username='Stewart', response_url=None):
+        return views.slash_command(self.request_factory.post('/slack/', {
+            'token': self.team.token,
+            'channel_id': 'C12345',
+            'user_id': 'U12345',
+            'user_name': username,
+            'text': text,
+            'response_url': response_url or self.slack.url,
+        }))
+
+    def test_acknowledges_then_posts_result(self):
+        response = self.post('tictac @cal')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b'')
+        self.assertTrue(self.slack.wait())
+        self.assertEqual(
+            self.slack.payloads[0]['text'],
+            "Stewart has challenged cal to TicTacToe! It is Stewart's turn.",
+        )
+        self.post('tictac move 5')
+        self.assertTrue(self.slack.wait())
+        self.assertEqual(
+            self.slack.payloads[1]['text'],
+            "Stewart has played. It's cal's turn now.",
+        )
+
+    def test_deferred_commands_are_measured_twice(self):
+        with self.assertLogs('tintg.metrics', 'INFO') as logs:
+            self.post('tictac @cal')
+            self.assertTrue(self.slack.wait())
+        # The background run may finish first.
+        records = {
+            record['outcome']: record
+            for record in (json.loads(r.getMessage()) for r in logs.records)
+        }
+        self.assertEqual(sorted(records), ['deferred', 'ok'])
+        self.assertEqual(records['deferred']['subcommand'], 'start')
+        self.assertEqual(records['ok']['subcommand'], 'start')
+        self.assertGreater(records['ok']['db_queries'], 0)
+
+    def test_other_response_urls_are_answered_inline(self):
+        for url in ('http://hooks.slack.com/commands/1/2',
+                    'https://hooks.slack.com.example.com/commands/1/2',
+                    'https://user@hooks.slack.com/commands/1/2',
+                    'http://169.254.169.254/latest/meta-data/',
+                    'file:///etc/passwd'):
+            with mock.patch.object(background, 'submit') as submit:
+                response = self.post('tictac show', response_url=url)
+            self.assertFalse(submit.called, url)
+            self.assertEqual(
+                json.loads(str(response.content, encoding='utf8'))['text'],
+                views.NO_GAME.format('tictac'),
+            )
+        self.assertTrue(background.response_url_allowed(self.slack.url))
+        with self.settings(TINTG_RESPONSE_URL_ORIGINS=(
+            'https://hooks.slack.com',
+        )):
+            self.assertTrue(background.response_url_allowed(
+                'https://hooks.slack.com/commands/1234/5678',
+            ))
+            self.assertFalse(background.response_url_allowed(self.slack.url))
+
+    def test_help_is_answered_inline(self):
+        response = self.post('tictac help')
+        self.assertEqual(
+            json.loads(str(response.content, encoding='utf8'))['text'],
+            "Help for tic-tac-toe",
+        )
+        self.assertFalse(self.slack.payloads)
+
+    def test_failure_posts_fallback(self):
+        def broken(data):
+            raise ValueError(data)
+
+        with self.assertLogs('slack.background', level='ERROR'):
+            future = background.submit(
+                broken,
+                {'text': 'x', 'response_url': self.slack.url},
+                {'text': 'sorry'},
+            )
+            self.assertEqual(future.result(timeout=5), {'text': 'sorry'})
+        self.assertTrue(self.slack.wait())
+        self.assertEqual(self.slack.payloads, [{'text': 'sorry'}])
+
+
+class MetricsTests(TestCase):
+
+    def setUp(self):
+        teams.clear()
+        cache.clear()
+        metrics.registry.clear()
+        self.addCleanup(metrics.registry.clear)
+        self.request_factory = RequestFactory()
+        self.team = factories.TeamFactory.create()
+
+    def command(self, text, username='Stewart', token=None):
+        """Run a slash command; return the record it logged."""
+        request = self.request_factory.post('/slack/', {
+            'token': token or self.team.token,
+            'channel_id': 'C12345',
+            'user_id': 'U12345',
+            'user_name': username,
+            'text': text,
+        })
+        with self.assertLogs('tintg.metrics', 'INFO') as logs:
+            views.slash_command(request)
+        self.assertEqual(len(logs.records), 1)
+        return json.loads(logs.records[0].getMessage())
+
+    def test_records_subcommand_and_outcome(self):
+        record = self.command('tictac @cal')
+        self.assertEqual(record['subcommand'], 'start')
+        self.assertEqual(record['outcome'], 'ok')
+        self.assertGreater(record['db_queries'], 0)
+        self.assertGreater(record['serialization_ms'], 0)
+        self.assertEqual(record['cache']['team'], {'hits': 0, 'misses': 1})
+
+        record = self.command('tictac move 5')
+        self.assertEqual(
+            (record['subcommand'], record['outcome']), ('move', 'played'),
+        )
+        self.assertEqual(record['cache']['team'], {'hits': 1, 'misses': 0})
+
+        record = self.command('tictac show')
+        self.assertEqual((record['subcommand'], record['outcome']),
+                         ('show', 'ok'))
+        self.assertEqual(record['cache']['game'], {'hits': 1, 'misses': 0})
+        # Just the version check a process-local game cache needs.
+        self.assertEqual(record['db_queries'], 1)
+
+        record = self.command('tictac quit')
+        self.assertEqual(record['subcommand'], 'forfeit')
+
+    def test_failure_outcomes(self):
+        record = self.command('tictac show')
+        self.assertEqual(record['outcome'], 'no_game')
+        record = self.command('tictac move')
+        self.assertEqual(
+            (record['subcommand'], record['outcome']),
+            ('move', 'bad_arguments'),
+        )
+        record = self.command('hello', token='not-a-team')
+        self.assertEqual(
+            (record['subcommand'], record['outcome']),
+            ('none', 'missing_team'),
+        )
+        record = self.command('tictac help')
+        self.assertEqual((record['subcommand'], record['outcome']),
+                         ('help', 'ok'))
+        self.assertEqual(record['serialization_ms'], 0)
+
+    def test_get_is_not_measured(self):
+        views.slash_command(self.request_factory.get('/slack/'))
+        self.assertEqual(metrics.registry.totals, {})
+
+    def test_queries_outside_commands_are_not_counted(self):
+        with metrics.measure() as record:
+            Game.objects.count()
+        Game.objects.count()
+        self.assertEqual(record.queries, 1)
+
+    def test_export(self):
+        self.command('tictac show')
+        self.command('tictac show')
+        response = self.client.get('/metrics/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], metrics.CONTENT_TYPE)
+        text = response.content.decode('utf8')
+        labels = 'outcome="no_game",subcommand="show"'
+        self.assertIn('# TYPE tintg_slash_command_seconds histogram', text)
+        self.assertIn(
+            'tintg_slash_command_seconds_bucket{{le="+Inf",{}}} 2'.format(
+                labels,
+            ),
+            text,
+        )
+        self.assertIn(
+            'tintg_slash_command_seconds_count{{{}}} 2'.format(labels), text,
+        )
+        self.assertIn(
+            'tintg_slash_command_cache_misses_total'
+            '{{cache="game",{}}} 2'.format(labels),
+            text,
+        )
+
+    def test_export_is_local_only(self):
+        response = self.client.get('/metrics/', REMOTE_ADDR='203.0.113.7')
+        self.assertEqual(response.status_code, 404)
+        with self.settings(TINTG_METRICS_ADDRESSES=None):
+            response = self.client.get(
+                '/metrics/', REMOTE_ADDR='203.0.113.7',
+            )
+        self.assertEqual(response.status_code, 200)
+
+    def test_export_with_token(self):
+        with self.settings(TINTG_METRICS_TOKEN='s3cret'):
+            response = self.client.get(
+                '/metrics/', REMOTE_ADDR='203.0.113.7',
+                HTTP_AUTHORIZATION='Bearer s3cret',
+            )
+            self.assertEqual(response.status_code, 200)
+            response = self.client.get(
+                '/metrics/', REMOTE_ADDR='203.0.113.7',
+                HTTP_AUTHORIZATION='Bearer guess',
+            )
+            self.assertEqual(response.status_code, 404)
+            response = self.client.get(
+                '/metrics/', REMOTE_ADDR='203.0.113.7',
+                HTTP_AUTHORIZATION='Bearer s3crét',
+            )
+            self.assertEqual(response.status_code, 404)
+
+    def record(self, registry, outcome='ok', seconds=0.002):
+        record = metrics.Record('show', outcome)
+        record.seconds = seconds
+        record.queries = 1
+        registry.observe(record)
+
+    def test_workers_share_totals(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        with self.settings(TINTG_METRICS_DIR=directory):
+            # Two other workers, one of them since exited.
+            first, second = metrics.Registry(), metrics.Registry()
+            self.record(first)
+            self.record(second)
+            self.record(second, seconds=0.2)
+            first.flush()
+            second.flush()
+            self.record(metrics.registry)
+            # Served the same, whichever worker answers.
+            for registry in (metrics.registry, first, second):
+                text = registry.render()
+                self.assertIn(
+                    'tintg_slash_command_seconds_count'
+                    '{outcome="ok",subcommand="show"} 4', text,
+                )
+                self.assertIn(
+                    'tintg_slash_command_seconds_bucket'
+                    '{le="0.25",outcome="ok",subcommand="show"} 4', text,
+                )
+                self.assertIn(
+                    'tintg_slash_command_db_queries_total'
+                    '{outcome="ok",subcommand="show"} 4', text,
+                )
+            # A restart starts the counts over.
+            metrics.clear_directory()
+            self.assertEqual(os.listdir(directory), [])
+
+    def test_forked_workers_start_over(self):
+        registry = metrics.Registry()
+        self.record(registry)
+        # As in a worker forked from a process that had counted some.
+        registry.pid = -1
+        self.record(registry)
+        self.assertEqual(registry.totals['show', 'ok'].count, 1)
+
+    def test_dyno_label(self):
+        self.record(metrics.registry)
+        with mock.patch.dict(os.environ, {'DYNO': 'web.2'}):
+            text = metrics.registry.render()
+        self.assertIn(
+            'tintg_slash_command_seconds_count'
+            '{dyno="web.2",outcome="ok",subcommand="show"} 1', text,
+        )
+
+
+class LoadGeneratorTests(TestCase):
+
+    def setUp(self):
+        teams.clear()
+        cache.clear()
+        self.request_factory = RequestFactory()
+
+    def test_generate_is_deterministic(self):
+        first = loadgen.generate(teams=2, channels=2, run_id='R')
+        self.assertEqual(first, loadgen.generate(teams=2, channels=2,
+                                                 run_id='R'))
+        self.assertNotEqual(first, loadgen.generate(
+            teams=2, channels=2, run_id='R', random_seed=1,
+        ))
+        self.assertEqual(
+            {request['channel_id'] for request in first},
+            {'CLRT0C0', 'CLRT0C1', 'CLRT1C0', 'CLRT1C1'},
+        )
+
+    def test_sessions_play_out(self):
+        loadgen.seed(2, history=3)
+        self.assertEqual(
+            Game.objects.filter(channel__startswith='CHIST').count(), 3,
+        )
+        kinds = set()
+        texts = []
+        for request in loadgen.generate(teams=2, channels=2, run_id='R',
+                                        games=10, forfeit_rate=0.1):
+            kinds.add(loadgen.kind_of(request['text']))
+            response = views.slash_command(
+                self.request_factory.post('/slack/', request),
+            )
+            self.assertFalse(loadgen.failed(response.content))
+            texts.append(json.loads(response.content.decode('utf8'))['text'])
+        self.assertEqual(kinds, {'start', 'move', 'show', 'forfeit'})
+        self.assertIn(views.WRONG_TURN, texts)
+        self.assertTrue(any('has won' in text for text in texts))
+        self.assertNotIn(views.GAME_ALREADY_STARTED, texts)
+        # Every game was won, tied or forfeited.
+        self.assertFalse(Game.objects.filter(
+            channel__startswith='CLR', is_active=True,
+        ).exists())
+
+    def test_seed_is_idempotent(self):
+        loadgen.seed(2)
+        loadgen.seed(3)
+        self.assertEqual(
+            teams.Team.objects.filter(slack_id__startswith='TLOAD').count(),
+            3,
+        )
+
+    def test_record_and_replay(self):
+        requests = loadgen.generate(teams=1, channels=2, run_id='R')
+        recording = io.StringIO()
+        loadgen.write(requests, recording)
+        recording.seek(0)
+        self.assertEqual(loadgen.read(recording), requests)
+
+    def test_kind_of(self):
+        self.assertEqual(loadgen.kind_of('tictac @cal'), 'start')
+        self.assertEqual(loadgen.kind_of('tictac move top left'), 'move')
+        self.assertEqual(loadgen.kind_of('tictac quit'), 'forfeit')
+        self.assertEqual(loadgen.kind_of(''), 'usage')
+
+    def test_summarize(self):
+        rows = loadgen.summarize([
+            loadgen.Result('move', 200, 0.010, False),
+            loadgen.Result('move', 200, 0.030, True),
+            loadgen.Result('show', 500, 0.020, False),
+            loadgen.Result('show', 0, 10, True),
+        ], elapsed=2)
+        self.assertEqual([row[0] for row in rows], ['move', 'show', 'all'])
+        self.assertEqual(rows[0], ('move', 2, 1.0, 0.030, 0.030, 0.030,
+                                   0.030, 0.0, 1))
+        self.assertEqual(rows[1][7], 1.0)
+        self.assertEqual(rows[2][1:3], (4, 2.0))
+        self.assertEqual(rows[2][7], 0.5)
+
+    def test_command_records_without_a_url(self):
+        directory = tempfile.mkdtemp()
+        path = os.path.join(directory, 'traffic.jsonl')
+        self.addCleanup(os.rmdir, directory)
+        self.addCleanup(os.remove, path)
+        output = io.StringIO()
+        call_command('loadtest', teams=1, channels=2, games=1, record=path,
+                     seed=True, stdout=output)
+        self.assertIn('Seeded 1 teams', output.getvalue())
+        with open(path) as recording:
+            self.assertEqual(
+                len({r['channel_id'] for r in loadgen.read(recording)}), 2,
+            )
+
+    def test_post_honours_the_url(self):
+        connections = []
+
+        async def open_connection(host, port, ssl=None):
+            connections.append((host, port, ssl is not None))
+            reader = asyncio.StreamReader()
+            reader.feed_data(b'HTTP/1.0 200 OK\r\nContent-Length: 2\r\n\r\n{}')
+            reader.feed_eof()
+            return reader, mock.Mock()
+
+        loop = asyncio.new_event_loop()
+        self.addCleanup(loop.close)
+        with mock.patch('asyncio.open_connection', open_connection):
+            status, content, _ = loop.run_until_complete(loadgen.post(
+                'https://tintg.example.com/slack/?debug=1', {'text': 'x'},
+            ))
+            loop.run_until_complete(loadgen.post(
+                'http://127.0.0.1:8000/slack/', {'text': 'x'},
+            ))
+        self.assertEqual((status, content), (200, b'{}'))
+        self.assertEqual(connections, [
+            ('tintg.example.com', 443, True), ('127.0.0.1', 8000, False),
+        ])
+        with self.assertRaises(ValueError):
+            loop.run_until_complete(loadgen.post('ftp://example.com/', {}))
+
+    def test_post_closes_the_socket_on_errors(self):
+        writer = mock.Mock()
+
+        async def open_connection(host, port, ssl=None):
+            reader = asyncio.StreamReader()
+            reader.set_exception(ConnectionResetError())
+            return reader, writer
+
+        loop = asyncio.new_event_loop()
+        self.addCleanup(loop.close)
+        with mock.patch('asyncio.open_connection', open_connection):
+            with self.assertRaises(ConnectionResetError):
+                loop.run_until_complete(loadgen.post(
+                    'http://127.0.0.1:8000/slack/', {'text': 'x'},
+                ))
+        self.assertTrue(writer.close.called)
+
+    def test_command_rejects_other_schemes(self):
+        with self.assertRaises(CommandError):
+            call_command('loadtest', 'ftp://example.com/slack/', teams=1,
+                         stdout=io.StringIO())
+
+    def test_command_rejects_bad_recordings(self):
+        with self.assertRaises(CommandError):
+            call_command('loadtest', replay='/nonexistent/traffic.jsonl',
+                         stdout=io.StringIO())
+
+
+class LoadTestFireTests(LiveServerTestCase):
+
+    def setUp(self):
+        teams.clear()
+        cache.clear()
+
+    def test_fire(self):
+        loadgen.seed(2)
+        requests = loadgen.generate(teams=2, channels=2, games=1, run_id='R')
+        loop = asyncio.new_event_loop()
+        self.addCleanup(loop.close)
+        results, elapsed = loop.run_until_complete(loadgen.fire(
+            self.live_server_url + '/slack/', requests, concurrency=4,
+        ))
+        self.assertEqual(len(results), len(requests))
+        self.assertEqual({result.status for result in results}, {200})
+        self.assertFalse(any(result.failed for result in results))
+        self.assertEqual(loadgen.summarize(results, elapsed)[-1][1],
+                         len(requests))
+
+
+class ProvisioningTests(TestCase):
+
+    def setUp(self):
+        teams.clear()
+        cache.clear()
+        self.team = factories.TeamFactory.create()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(self.remove_directory)
+
+    def remove_directory(self):
+        for name in os.listdir(self.directory):
+            os.remove(os.path.join(self.directory, name))
+        os.rmdir(self.directory)
+
+    def write(self, name, content):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w') as output:
+            output.write(content)
+        return path
+
+    def provision(self, path, **options):
+        output = io.StringIO()
+        call_command('provision_teams', path, stdout=output, **options)
+        return output.getvalue()
+
+    def rows(self, count, prefix='tok'):
+        return [
+            {'slack_id': 'T{}'.format(n), 'name': 'Team {}'.format(n),
+             'domain': 'team{}'.format(n), 'token': '{}-{}'.format(prefix, n)}
+            for n in range(count)
+        ]
+
+    def test_csv_import_and_upsert(self):
+        path = self.write('teams.csv', (
+            'slack_id,name,domain,token\n'
+            'T0001,Renamed,slack,cal-stewart-hender-field\n'
+            'T0002,Other,other, other-token \n'
+        ))
+        output = self.provision(path)
+        self.assertIn('1 created, 1 updated, 0 unchanged', output)
+        self.team.refresh_from_db()
+        self.assertEqual(self.team.name, 'Renamed')
+        self.assertEqual(
+            teams.Team.objects.get(slack_id='T0002').token, 'other-token',
+        )
+        self.assertIn('0 created, 0 updated, 2 unchanged',
+                      self.provision(path))
+
+    def test_json_and_json_lines(self):
+        self.provision(self.write('teams.json', json.dumps(self.rows(3))))
+        self.provision(self.write('teams.jsonl', '\n'.join(
+            json.dumps(row) for row in self.rows(5, prefix='new')
+        )))
+        self.assertEqual(
+            sorted(teams.Team.objects.filter(
+                slack_id__in=['T0', 'T4'],
+            ).values_list('token', flat=True)),
+            ['new-0', 'new-4'],
+        )
+
+    def test_batches(self):
+        rows = self.rows(7)
+        with self.assertNumQueries(4 + 4 * 5):
+            # Per batch of 2: validation looks up tokens, then the upsert
+            # reads and inserts in a savepoint, and reloads for warming.
+            counts = provisioning.upsert_teams(rows, batch_size=2)
+        self.assertEqual(counts['created'], 7)
+        for row in rows:
+            row['name'] = row['name'].upper()
+        counts = provisioning.upsert_teams(rows, batch_size=2)
+        self.assertEqual(counts, {'created': 0, 'updated': 7,
+                                  'unchanged': 0})
+        self.assertEqual(
+            teams.Team.objects.get(slack_id='T6').name, 'TEAM 6',
+        )
+
+    def test_update_statements_fit_sqlite_limits(self):
+        rows = self.rows(400)
+        provisioning.upsert_teams(rows)
+        for row in rows:
+            row['domain'] += '-moved'
+        self.assertEqual(provisioning.upsert_teams(rows)['updated'], 400)
+        self.assertEqual(teams.Team.objects.filter(
+            domain__endswith='-moved',
+        ).count(), 400)
+
+    def test_rotate(self):
+        old_token = self.team.token
+        self.assertEqual(teams.get_team(old_token), self.team)
+        path = self.write('tokens.csv', (
+            'slack_id,token\nT0001,rotated-token\n'
+        ))
+        self.assertIn('0 created, 1 updated', self.provision(path,
+                                                             rotate=True))
+        self.assertIsNone(teams.get_team(old_token))
+        team = teams.get_team('rotated-token')
+        self.assertEqual(team, self.team)
+        self.assertEqual(team.name, 'Slack')
+
+    def test_missing_columns_are_left_alone(self):
+        self.provision(self.write('teams.csv', (
+            'slack_id,token\nT0001,new-token\nT0002,other-token\n'
+        )))
+        self.provision(self.write('teams.json', json.dumps([
+            {'slack_id': 'T0001', 'token': 'new-token', 'domain': 'moved'},
+        ])))
+        self.team.refresh_from_db()
+        self.assertEqual(
+            (self.team.name, self.team.domain, self.team.token),
+            ('Slack', 'moved', 'new-token'),
+        )
+        self.assertEqual(
+            teams.Team.objects.get(slack_id='T0002').token, 'other-token',
+        )
+
+    def test_rotate_unknown_team(self):
+        path = self.write('tokens.csv', 'slack_id,token\nT0404,x\n')
+        with self.assertRaisesRegex(CommandError, 'T0404 is not a regis'):
+            self.provision(path, rotate=True)
+
+    def test_invalid_rows_write_nothing(self):
+        path = self.write('teams.csv', (
+            'slack_id,name,domain,token\n'
+            'T1,One,one,token-1\n'
+            'T1,One,one,token-2\n'
+            'T2,Two,two,token-1\n'
+            'T3,Three,three,\n'
+            'T4,Four,four,cal-stewart-hender-field\n'
+        ))
+        with self.assertRaises(CommandError) as raised:
+            self.provision(path)
+        message = str(raised.exception)
+        self.assertIn('4 problem(s)', message)
+        self.assertIn('row 2: T1 appears twice', message)
+        self.assertIn('row 3: T2 has the same token as T1', message)
+        self.assertIn('row 4: slack_id and token are required', message)
+        self.assertIn('T0001 has the token given for T4', message)
+        self.assertEqual(teams.Team.objects.count(), 1)
+
+    def test_token_swap_is_allowed(self):
+        other = factories.TeamFactory.create(slack_id='T2', token='second')
+        path = self.write('teams.json', json.dumps([
+            {'slack_id': 'T0001', 'token': 'second'},
+            {'slack_id': 'T2', 'token': self.team.token},
+        ]))
+        self.provision(path, rotate=True)
+        other.refresh_from_db()
+        self.assertEqual(other.token, 'cal-stewart-hender-field')
+
+    def test_token_swap_across_chunks(self):
+        other = factories.TeamFactory.create(slack_id='T2', token='second')
+        old_token = self.team.token
+        # Between the two chunks, both teams have the token 'second'.
+        teams.Team.objects.filter(pk=self.team.pk).update(
+            token='second', changed=other.changed + datetime.timedelta(1),
+        )
+        self.assertEqual(teams.get_team('second'), self.team)
+        teams.clear()
+        provisioning.upsert_teams([
+            {'slack_id': 'T0001', 'token': 'second'},
+            {'slack_id': 'T2', 'token': old_token},
+        ], batch_size=1)
+        self.assertEqual(teams.get_team('second'), self.team)
+        self.assertEqual(teams.get_team(old_token), other)
+
+    def test_dry_run(self):
+        path = self.write('teams.json', json.dumps(self.rows(3)))
+        self.assertIn('3 teams OK', self.provision(path, dry_run=True))
+        self.assertEqual(teams.Team.objects.count(), 1)
+
+    def test_unknown_format(self):
+        with self.assertRaisesRegex(CommandError, 'Give --format'):
+            self.provision(self.write('teams.txt', ''))
+
+    @override_settings(TINTG_TEAM_CACHE='default')
+    def test_warms_shared_cache(self):
+        path = self.write('teams.json', json.dumps(self.rows(3)))
+        self.provision(path)
+        teams.clear()
+        with self.assertNumQueries(0):
+            self.assertEqual(teams.get_team('tok-2').slack_id, 'T2')
@@ -1,33 +1,66 @@
-from django.http import HttpResponse, JsonResponse
+import functools
+
+from django.db.models import F
+from django.http import HttpResponse
 from django.shortcuts import render
 from django.views.decorators.csrf import csrf_exempt
+from games import engines, services, snapshots
 from games.models import Game, Player
+from tintg import metrics
 
-from .models import Team
+from . import background, responses, routing, teams
 
 
 MISSING_TEAM = "Oh dear. Your slack team isn't registered with TINTG. I'm... I'm not even sure how you reached us."
 
 HELLO = "Hey there!"
 
-HOW_TO_START = "You can start a game of tic-tac-toe with `/tintg tictac [username]`\nYou can see help with `/tintg tictac help`."
+HOW_TO_START = "You can start a game of tic-tac-toe with `/tintg tictac [username]`\nYou can see help with `/tintg tictac help`.\nConnect Four and Gomoku work the same way, with `/tintg connect4` and `/tintg gomoku`."
 
 GAME_ALREADY_STARTED = "There's already a game going in this channel, sorry."
 
+NO_GAME = "There's no game going in this channel. You can start one with `/tintg {} [username]`."
+
 ERROR = "Hmm... something has gone wrong. Maybe try starting a new game?"
 
 WRONG_TURN = "Whoops! It's not your turn to play."
 
 INVALID_MOVE = "Sorry, that's not a valid move."
 
-TICTAC_HELP = """`/tintg tictac [username]` - starts a new game\n`/tintg tictac move [space]` - play in an empty space\n`/tintg tictac show` - show current board state\n`/tintg tictac forfeit` - leave a game you're playing\n`/tintg tictac help` - display this help"""
+MOVE_CONFLICT = "Whoa, someone else moved at the same time. Take a look with `/tintg {} show` and try again."
+
+WRONG_GAME = "The game going in this channel is {}. You can play it with `/tintg {}`."
 
 BAD_PLAYER_NAME = "Hmm... that doesn't seem to be a valid player name."
 
+WIN = "{} has won the game!"
+
+FORCED_WIN = "{0} can't be stopped now, so {0} has won the game!"
+
+FORCED_TIE = "It's a tie! Nobody can win from here."
+
 PLAYING_YOURSELF = "Sorry, playing against yourself isn't support right now. How would that even work, I wonder? ...goes back to lab..."
 
 
+# Constant replies, encoded once.
+MISSING_TEAM_RESPONSE = responses.static({'text': MISSING_TEAM})
+HELLO_RESPONSE = responses.static({'text': HELLO})
+HOW_TO_START_RESPONSE = responses.static({'text': HOW_TO_START})
+UNKNOWN_COMMAND_RESPONSE = responses.static({
+    'text': HOW_TO_START,
+    'mrkdwn': True,
+})
+GAME_ALREADY_STARTED_RESPONSE = responses.static({'text': GAME_ALREADY_STARTED})
+ERROR_RESPONSE = responses.static({'text': ERROR})
+WRONG_TURN_RESPONSE = responses.static({'text': WRONG_TURN})
+INVALID_MOVE_RESPONSE = responses.static({'text': INVALID_MOVE})
+BAD_PLAYER_NAME_RESPONSE = responses.static({'text': BAD_PLAYER_NAME})
+PLAYING_YOURSELF_RESPONSE = responses.static({'text': PLAYING_YOURSELF})
+
+
+
 @csrf_exempt
+@metrics.instrument
 def slash_command(request):
 
     if request.method == 'GET':
@@ -37,174 +70,327 @@ def slash_command(request):
         )
 
     if request.method == 'POST':
-        try:
-            team = Team.objects.get(token=request.POST.get('token'))
-        except Team.DoesNotExist:
-            return JsonResponse({
-                'text': MISSING_TEAM,
-            })
-        command_options = [
-            command for command in request.POST.get('text').split(' ') if command
+        team = teams.get_team(request.POST.get('token'))
+        if team is None:
+            metrics.tag(outcome='missing_team')
+            return responses.render(MISSING_TEAM_RESPONSE)
+        words = split_command(request.POST.get('text'))
+        deferred = (
+            background.enabled() and
+            background.response_url_allowed(
+                request.POST.get('response_url'),
+            ) and
+            is_deferrable(words)
+        )
+        if deferred:
+            metrics.tag(
+                subcommand=router.resolve(words)[0].name, outcome='deferred',
+            )
+            background.submit(
+                metrics.measured(handle_command), request.POST.dict(),
+                fallback=ERROR_RESPONSE,
+            )
+            return HttpResponse()
+        return responses.render(handle_command(request.POST))
+
+
+def split_command(text):
+    return [command for command in (text or '').split(' ') if command]
+
+
+def is_deferrable(command_options):
+    """Commands that need the database; the rest are answered inline."""
+    command, captured, arguments = router.resolve(command_options)
+    return command.uses_database and command.bind(arguments)[0] is not None
+
+
+def handle_command(data):
+    """Run the slash command in `data` and return the response payload."""
+    return router.dispatch(data, split_command(data.get('text')))
+
+
+def how_to_start(data, **kwargs):
+    # Only empty and unrecognised commands get here.
+    if split_command(data.get('text')):
+        return UNKNOWN_COMMAND_RESPONSE
+    return HOW_TO_START_RESPONSE
+
+
+# /tintg ...
+router = routing.Node(routing.Command(how_to_start, name='usage'))
+
+
+# /tintg hello
+@router.route('hello')
+def hello(data):
+    return HELLO_RESPONSE
+
+
+# /tintg {game} {username}
+def start_game(data, engine, opponent, opponent_id=''):
+    opponent = opponent.strip('@')
+    if data.get('user_name').strip('@') == opponent:
+        metrics.tag(outcome='playing_yourself')
+        return PLAYING_YOURSELF_RESPONSE
+    game = None
+    if not Game.objects.active_for_channel(data.get('channel_id')):
+        game = Game.objects.start_game(
+            kind=engine.kind,
+            channel=data.get('channel_id'),
+        )
+    if game is None:
+        metrics.tag(outcome='already_started')
+        return GAME_ALREADY_STARTED_RESPONSE
+    player1 = Player.objects.create(
+        game=game,
+        name=data.get('user_name').strip('@'),
+        is_current=True,
+        remote_user_id=data.get('user_id'),
+    )
+    player2 = Player.objects.create(
+        game=game,
+        name=opponent,
+        remote_user_id=opponent_id,
+    )
+    snapshots.store(game, [player1, player2])
+    return {
+        'response_type': 'in_channel',
+        'text': "{} has challenged {} to {}! It is {}'s turn.".format(
+            player1,
+            player2,
+            engine.title,
+            player1,
+        ),
+        'attachments': [
+            {'text': game.board_state_to_slack()}
+        ]
+    }
+
+
+game_commands = router.capture_with('engine', engines.for_command)
+game_commands.command = routing.Command(
+    start_game,
+    arguments=('opponent',),
+    missing=HOW_TO_START_RESPONSE,
+    extra=BAD_PLAYER_NAME_RESPONSE,
+    usage='[username]',
+    help="starts a new game",
+    uses_database=True,
+    name='start',
+)
+
+
+# /tintg {game} bot
+@game_commands.route(
+    'bot',
+    when=lambda engine: engine.has_bot,
+    help="starts a new game against me",
+    uses_database=True,
+)
+def start_bot_game(data, engine):
+    return start_game(data, engine, Player.BOT_NAME, Player.BOT_USER_ID)
+
+
+# /tintg {game} move {move}
+@game_commands.route(
+    'move',
+    arguments=('move',),
+    greedy=True,
+    missing=INVALID_MOVE_RESPONSE,
+    usage='[{engine.move_argument}]',
+    help="{engine.move_help}",
+    uses_database=True,
+)
+def make_move(data, engine, move):
+    move = services.play_move(
+        channel=data.get('channel_id'),
+        user_name=data.get('user_name'),
+        user_id=data.get('user_id'),
+        move=move,
+        kind=engine.kind,
+    )
+    metrics.tag(outcome=move.status)
+    game = move.game
+    if move.status == services.NO_GAME:
+        return no_game(engine)
+    if move.status == services.WRONG_GAME:
+        return wrong_game(game.engine)
+    if move.status == services.NO_PLAYERS:
+        return ERROR_RESPONSE
+    if move.status == services.WRONG_TURN:
+        return WRONG_TURN_RESPONSE
+    if move.status == services.INVALID_MOVE:
+        return INVALID_MOVE_RESPONSE
+    if move.status == services.CONFLICT:
+        return move_conflict(engine)
+    if move.status == services.TIE:
+        return {
+            'response_type': 'in_channel',
+            'text': FORCED_TIE if move.forced else "It's a tie!",
+            'attachments': [{
+                'text': game.board_state_to_slack(),
+            }]
+        }
+    if move.status == services.BOT_PLAYED:
+        return {
+            'response_type': 'in_channel',
+            'text': "{} has played and {} answered. It's {}'s turn now.".format(
+                move.player, move.opponent, move.player,
+            ),
+            'attachments': [
+                {'text': game.board_state_to_slack()}
+            ]
+        }
+    if move.status in (services.BOT_WON, services.LOST):
+        return {
+            'response_type': 'in_channel',
+            'text': (FORCED_WIN if move.forced else WIN).format(
+                move.opponent,
+            ),
+            'attachments': [{
+                'text': game.board_state_to_slack(),
+            }]
+        }
+    if move.status == services.WON:
+        return {
+            'response_type': 'in_channel',
+            'text': (FORCED_WIN if move.forced else WIN).format(move.player),
+            'attachments': [{
+                'text': game.board_state_to_slack(),
+            }]
+        }
+    return {
+        'response_type': 'in_channel',
+        'text': "{} has played. It's {}'s turn now.".format(
+            move.player, move.opponent,
+        ),
+        'attachments': [
+            {'text': game.board_state_to_slack()}
         ]
-        if len(command_options) < 1:
-            return JsonResponse({
-                'text': HOW_TO_START,
-            })
-        if command_options[0] == 'tictac':
-            # /tintg tictac
-            if len(command_options) < 2:
-                return JsonResponse({
-                    'text': HOW_TO_START
-                })
-            game = None
-            try:
-                game = Game.objects.get(
-                    channel=request.POST.get('channel_id'),
-                    is_active=True,
-                )
-            except Game.DoesNotExist:
-                pass
-            # /tintg tictac show
-            if command_options[1] == 'show' and game:
-                try:
-                    current_player = Player.objects.get(
-                        game=game,
-                        is_current=True,
-                    )
-                except Player.DoesNotExist:
-                    return JsonResponse({
-                        'text': ERROR,
-                    })
-                return JsonResponse({
-                    'response_type': 'in_channel',
-                    'text': "It is {}'s turn.".format(current_player),
-                    'attachments': [
-                        {'text': game.board_state_to_slack()},
-                    ]
-                })
-            # /tintg tictac forfeit
-            if command_options[1] in ('forfeit', 'quit') and game:
-                player1, player2 = get_players(game, request.POST)
-                if not player1 or not player2:
-                    return JsonResponse({
-                        'text': ERROR,
-                    })
-                game.is_active = False
-                game.save()
-                return JsonResponse({
-                    'response_type': 'in_channel',
-                    'text': "{} forfeits! {} wins the game!".format(
-                        player1, player2,
-                    )
-                })
-            # /tintg tictac help
-            if command_options[1] == 'help':
-                return JsonResponse({
-                    'text': "Help for tic-tac-toe",
-                    'attachments': [{
-                        'text': TICTAC_HELP,
-                        'mrkdwn_in': ["text"],
-                    }],
-                })
-            # /tintg tictac move {move}
-            if command_options[1] == 'move' and game:
-                player1, player2 = get_players(game, request.POST)
-                if not player1 or not player2:
-                    return JsonResponse({
-                        'text': ERROR,
-                    })
-                if not player1.is_current:
-                    return JsonResponse({
-                        'text': WRONG_TURN
-                    })
-                valid = game.make_move_if_valid(' '.join(command_options[2:]))
-                if valid:
-                    win_state = game.is_won()
-                    if win_state == 'tie':
-                        game.is_active = False
-                        game.save()
-                        return JsonResponse({
-                            'response_type': 'in_channel',
-                            'text': "It's a tie!",
-                            'attachments': [{
-                                'text': game.board_state_to_slack(),
-                            }]
-                        })
-                    if win_state:
-                        game.is_active = False
-                        game.save()
-                        return JsonResponse({
-                            'response_type': 'in_channel',
-                            'text': "{} has won the game!".format(player1),
-                            'attachments': [{
-                                'text': game.board_state_to_slack(),
-                            }]
-                        })
-                    player1.is_current = False
-                    player1.save()
-                    player2.is_current = True
-                    player2.save()
-                    return JsonResponse({
-                        'response_type': 'in_channel',
-                        'text': "{} has played. It's {}'s turn now.".format(
-                            player1, player2,
-                        ),
-                        'attachments': [
-                            {'text': game.board_state_to_slack()}
-                        ]
-                    })
-                else:
-                    return JsonResponse({
-                        'text': INVALID_MOVE,
-                    })
-            # /tintg tictac {username}
-            else:
-                if game:
-                    return JsonResponse({
-                        'text': GAME_ALREADY_STARTED
-                    })
-                if len(command_options) > 2:
-                    return JsonResponse({
-                        'text': BAD_PLAYER_NAME
-                    })
-                if request.POST.get('user_name').strip('@') == command_options[1].strip('@'):
-                    return JsonResponse({
-                        'text': PLAYING_YOURSELF
-                    })
-                game = Game.objects.start_game(
-                    kind=str(Game.TICTACTOE),
-                    channel=request.POST.get('channel_id'),
-                )
-                player1 = Player.objects.create(
-                    game=game,
-                    name=request.POST.get('user_name').strip('@'),
-                    is_current=True,
-                    remote_user_id=request.POST.get('user_id'),
-                )
-                player2 = Player.objects.create(
-                    game=game,
-                    name=command_options[1].strip('@'),
-                )
-                return JsonResponse({
-                    'response_type': 'in_channel',
-                    'text': "{} has challenged {} to TicTacToe! It is {}'s turn.".format(
-                        player1, 
-                        player2,
-                        player1,
-                    ),
-                    'attachments': [
-                        {'text': game.board_state_to_slack()}
-                    ]
-                })
-
-        if command_options[0] == 'hello':
-            return JsonResponse({
-                'text': HELLO,
-            })
-        return JsonResponse({
-            'text': HOW_TO_START,
-            'mrkdwn': True,
-        })
+    }
+
+
+# /tintg {game} show
+@game_commands.route(
+    'show',
+    help="show current board state",
+    uses_database=True,
+)
+def show(data, engine):
+    snapshot = services.active_snapshot(data.get('channel_id'))
+    if not snapshot:
+        metrics.tag(outcome='no_game')
+        return no_game(engine)
+    if snapshot['kind'] != engine.kind:
+        metrics.tag(outcome=services.WRONG_GAME)
+        return wrong_game(engines.get(snapshot['kind']))
+    if not snapshot['current']:
+        metrics.tag(outcome='error')
+        return ERROR_RESPONSE
+    return {
+        'response_type': 'in_channel',
+        'text': "It is {}'s turn.".format(snapshot['current']),
+        'attachments': [
+            {'text': engines.get(snapshot['kind']).render(
+                snapshot['state'],
+            )},
+        ]
+    }
+
+
+# /tintg {game} forfeit
+@game_commands.route(
+    'forfeit',
+    help="leave a game you're playing",
+    uses_database=True,
+)
+def forfeit(data, engine):
+    game = Game.objects.active_for_channel(data.get('channel_id'))
+    if not game:
+        metrics.tag(outcome='no_game')
+        return no_game(engine)
+    if game.kind != engine.kind:
+        metrics.tag(outcome=services.WRONG_GAME)
+        return wrong_game(game.engine)
+    player1, player2 = get_players(game, data)
+    if not player1 or not player2:
+        metrics.tag(outcome='error')
+        return ERROR_RESPONSE
+    game.outcome = game.piece_of(player2)
+    # Only if nobody has moved since the game was loaded, like a move.
+    swapped = Game.objects.filter(
+        id=game.id, version=game.version, is_active=True,
+    ).update(
+        is_active=False,
+        outcome=game.outcome,
+        state=game.state,
+        ply=game.ply,
+        checkpoint_ply=game.ply,
+        version=F('version') + 1,
+    )
+    if not swapped:
+        metrics.tag(outcome=services.CONFLICT)
+        return move_conflict(engine)
+    snapshots.delete(game.channel)
+    return {
+        'response_type': 'in_channel',
+        'text': "{} forfeits! {} wins the game!".format(
+            player1, player2,
+        )
+    }
+
+
+game_commands.add(('quit',), routing.Command(forfeit, uses_database=True))
+
+
+# /tintg {game} help
+@game_commands.route('help', help="display this help")
+def game_help(data, engine):
+    return help_response(engine)
+
+
+@functools.lru_cache(maxsize=None)
+def help_response(engine):
+    return responses.static({
+        'text': "Help for {}".format(engine.label.lower()),
+        'attachments': [{
+            'text': help_text(engine),
+            'mrkdwn_in': ["text"],
+        }],
+    })
+
+
+@functools.lru_cache(maxsize=None)
+def help_text(engine):
+    return '\n'.join(game_commands.help_lines(
+        '/tintg {}'.format(engine.command), engine=engine,
+    ))
+
+
+@functools.lru_cache(maxsize=None)
+def no_game(engine):
+    return responses.static({
+        'text': NO_GAME.format(engine.command),
+    })
+
+
+@functools.lru_cache(maxsize=None)
+def wrong_game(engine):
+    """The reply when the channel's game is `engine`'s, not the command's."""
+    return responses.static({
+        'text': WRONG_GAME.format(engine.title, engine.command),
+    })
+
+
+@functools.lru_cache(maxsize=None)
+def move_conflict(engine):
+    return responses.static({
+        'text': MOVE_CONFLICT.format(engine.command),
+    })
+
+
+TICTAC_HELP = help_text(engines.get(Game.TICTACTOE))
+
 
 def get_players(game, command_data):
     player1 = None
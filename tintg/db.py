@@ -0,0 +1,56 @@
+"""
+Persistent database connections.
+
+With CONN_MAX_AGE set, each gunicorn thread and background command worker
+keeps its connection between requests instead of reconnecting every time.
+Django only tests a kept connection after an error, so one dropped by
+Postgres or pgbouncer (a restart, an idle timeout) would fail the next
+command. ensure_usable() pings kept connections that haven't been checked
+for TINTG_DB_HEALTH_CHECK_INTERVAL seconds and closes dead ones, so they
+are reopened on first use.
+"""
+import time
+
+from django.conf import settings
+from django.db import connections
+
+
+DEFAULT_HEALTH_CHECK_INTERVAL = 30
+
+
+def health_check_interval():
+    return getattr(
+        settings, 'TINTG_DB_HEALTH_CHECK_INTERVAL',
+        DEFAULT_HEALTH_CHECK_INTERVAL,
+    )
+
+
+def ensure_usable(wrappers=None, interval=None):
+    """Close kept connections that no longer answer; return how many."""
+    if interval is None:
+        interval = health_check_interval()
+    if wrappers is None:
+        wrappers = connections.all()
+    now = time.time()
+    closed = 0
+    for wrapper in wrappers:
+        if wrapper.connection is None or wrapper.in_atomic_block:
+            continue
+        checked = getattr(wrapper, 'tintg_checked', None)
+        # The raw connection is replaced when Django reconnects, so a check
+        # only counts for the connection it was made on.
+        if checked and checked[0] is wrapper.connection and \
+                now - checked[1] < interval:
+            continue
+        if wrapper.is_usable():
+            wrapper.tintg_checked = (wrapper.connection, now)
+        else:
+            wrapper.close()
+            closed += 1
+    return closed
+
+
+def check_connections(**kwargs):
+    """request_started handler."""
+    if health_check_interval() is not None:
+        ensure_usable()
@@ -0,0 +1,52 @@
+"""
+Gunicorn settings for the web dyno.
+
+Each worker process serves requests from a pool of threads, so a request
+waiting on Postgres or Slack only ties up one thread instead of a whole
+worker. Heroku sets WEB_CONCURRENCY from the dyno size; WEB_THREADS,
+WEB_WORKER_CLASS and WEB_PRELOAD can be overridden per app.
+"""
+import os
+
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+worker_class = os.environ.get('WEB_WORKER_CLASS', 'gthread')
+threads = int(os.environ.get('WEB_THREADS', 8))
+# Load the app once in the master and fork workers from it, so a new worker
+# serves its first slash command without importing Django first, and the
+# workers share the master's copy of the code. WEB_PRELOAD=0 turns it off,
+# e.g. to let `kill -HUP` pick up new code.
+preload_app = os.environ.get('WEB_PRELOAD', '1').lower() not in (
+    '0', 'false', 'no',
+)
+# Slack gives up after 3 seconds, so there's no point holding a request
+# much longer than that.
+timeout = int(os.environ.get('WEB_TIMEOUT', 10))
+
+# With persistent connections every request thread, and every background
+# command worker, can hold its own database connection. Keep the total for
+# the dyno within what Postgres (TINTG_DB_MAX_CONNECTIONS) or a local
+# pgbouncer (PGBOUNCER_MAX_CLIENT_CONN) will accept.
+db_connections_per_worker = (
+    (threads if worker_class == 'gthread' else 1) +
+    int(os.environ.get('TINTG_COMMAND_WORKERS', 4))
+)
+db_connections = workers * db_connections_per_worker
+
+
+def when_ready(server):
+    # Before any worker starts: the totals of a previous run's workers
+    # would otherwise be counted again.
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'tintg.prod_settings')
+    from tintg import metrics
+    metrics.clear_directory()
+    if preload_app:
+        from tintg.startup import warm_up
+        warm_up()
+    for name in ('TINTG_DB_MAX_CONNECTIONS', 'PGBOUNCER_MAX_CLIENT_CONN'):
+        limit = int(os.environ.get(name, 0))
+        if limit and db_connections > limit:
+            server.log.warning(
+                "%d workers can open %d database connections, but %s is %d. "
+                "Lower WEB_CONCURRENCY, WEB_THREADS or TINTG_COMMAND_WORKERS.",
+                workers, db_connections, name, limit,
+            )
@@ -0,0 +1,471 @@
+"""
+Instrumentation for slash commands.
+
+Each command runs inside a Record (see measure()), which adds up its wall
+time, the database queries it ran and the time spent in them, cache hits and
+misses, and the time spent encoding its response. Records are tagged with
+the subcommand (`move`, `show`, `start`, ...) and its outcome (`won`,
+`no_game`, `deferred`, ...). A finished record is written to the
+`tintg.metrics` logger as one JSON line and added to this process's totals,
+which export() serves as Prometheus text at /metrics/ to the addresses in
+TINTG_METRICS_ADDRESSES, or to requests bearing TINTG_METRICS_TOKEN.
+
+Totals are kept per process. With TINTG_METRICS_DIR set, each process also
+writes its totals to a file of its own there, at most every
+FLUSH_INTERVAL seconds, and export() adds up every file, so whichever
+worker answers a scrape serves the same, never-decreasing counters. Files
+of workers that have exited are kept, so their counts aren't lost; the
+gunicorn master clears the directory when it starts. Series are labelled
+with the Heroku dyno, if any, since each dyno has its own directory.
+A deferred command gives two records: the acknowledgement, with outcome
+`deferred`, and the background run.
+"""
+import atexit
+import bisect
+import functools
+import glob
+import hmac
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db.backends import utils
+from django.http import Http404, HttpResponse
+
+
+logger = logging.getLogger(__name__)
+
+# Histogram buckets for wall time, in seconds. Slack gives up after 3.
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 3.0, 5.0)
+
+DEFAULT_ADDRESSES = ('127.0.0.1', '::1')
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Seconds between writes of a process's totals to TINTG_METRICS_DIR.
+FLUSH_INTERVAL = 1.0
+
+
+class Record(object):
+    """What one slash command cost."""
+
+    def __init__(self, subcommand='none', outcome='ok'):
+        self.subcommand = subcommand
+        self.outcome = outcome
+        self.started = time.perf_counter()
+        self.seconds = 0.0
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.serialization_seconds = 0.0
+        # cache name -> [hits, misses]
+        self.caches = {}
+
+    def as_dict(self):
+        return {
+            'event': 'slash_command',
+            'subcommand': self.subcommand,
+            'outcome': self.outcome,
+            'wall_ms': round(self.seconds * 1000, 3),
+            'db_queries': self.queries,
+            'db_ms': round(self.query_seconds * 1000, 3),
+            'serialization_ms': round(self.serialization_seconds * 1000, 3),
+            'cache': {
+                name: {'hits': hits, 'misses': misses}
+                for name, (hits, misses) in self.caches.items()
+            },
+        }
+
+
+_local = threading.local()
+
+
+def current():
+    """The Record for the command running on this thread, or None."""
+    return getattr(_local, 'record', None)
+
+
+def tag(subcommand=None, outcome=None):
+    record = current()
+    if record is None:
+        return
+    if subcommand is not None:
+        record.subcommand = subcommand
+    if outcome is not None:
+        record.outcome = outcome
+
+
+def cache_result(cache, hit):
+    """Count a lookup in `cache` as a hit or a miss."""
+    record = current()
+    if record is not None:
+        counts = record.caches.setdefault(cache, [0, 0])
+        counts[0 if hit else 1] += 1
+
+
+def serialized(seconds):
+    record = current()
+    if record is not None:
+        record.serialization_seconds += seconds
+
+
+@contextmanager
+def measure(**tags):
+    """Run the block as one command, then log and count its Record."""
+    record = Record(**tags)
+    previous = current()
+    _local.record = record
+    try:
+        yield record
+    except Exception:
+        record.outcome = 'exception'
+        raise
+    finally:
+        _local.record = previous
+        record.seconds = time.perf_counter() - record.started
+        finish(record)
+
+
+def measured(func, **tags):
+    """`func`, measured as a command each time it is called."""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with measure(**tags):
+            return func(*args, **kwargs)
+    return wrapper
+
+
+def instrument(view):
+    """View decorator: measure POSTs, i.e. slash commands."""
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if request.method != 'POST':
+            return view(request, *args, **kwargs)
+        with measure():
+            return view(request, *args, **kwargs)
+    return wrapper
+
+
+def finish(record):
+    registry.observe(record)
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(json.dumps(record.as_dict(), sort_keys=True))
+
+
+class TimedCursorMixin(object):
+    """Counts and times queries run while a command is being measured."""
+
+    def _timed(self, method, *args):
+        record = current()
+        if record is None:
+            return method(*args)
+        started = time.perf_counter()
+        try:
+            return method(*args)
+        finally:
+            record.queries += 1
+            record.query_seconds += time.perf_counter() - started
+
+    def callproc(self, procname, params=None):
+        return self._timed(
+            super(TimedCursorMixin, self).callproc, procname, params,
+        )
+
+    def execute(self, sql, params=None):
+        return self._timed(super(TimedCursorMixin, self).execute, sql, params)
+
+    def executemany(self, sql, param_list):
+        return self._timed(
+            super(TimedCursorMixin, self).executemany, sql, param_list,
+        )
+
+
+class TimedCursorWrapper(TimedCursorMixin, utils.CursorWrapper):
+    pass
+
+
+class TimedCursorDebugWrapper(TimedCursorMixin, utils.CursorDebugWrapper):
+    pass
+
+
+def install(sender=None, connection=None, **kwargs):
+    """connection_created handler: time queries run through `connection`."""
+    if getattr(connection, 'tintg_timed', False):
+        return
+    connection.make_cursor = functools.partial(
+        TimedCursorWrapper, db=connection,
+    )
+    connection.make_debug_cursor = functools.partial(
+        TimedCursorDebugWrapper, db=connection,
+    )
+    connection.tintg_timed = True
+
+
+class Totals(object):
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        # Non-cumulative counts per bucket, the last for over BUCKETS[-1].
+        self.buckets = [0] * (len(BUCKETS) + 1)
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.serialization_seconds = 0.0
+        self.caches = {}
+
+    def add(self, record):
+        self.count += 1
+        self.seconds += record.seconds
+        self.buckets[bisect.bisect_left(BUCKETS, record.seconds)] += 1
+        self.queries += record.queries
+        self.query_seconds += record.query_seconds
+        self.serialization_seconds += record.serialization_seconds
+        for name, (hits, misses) in record.caches.items():
+            counts = self.caches.setdefault(name, [0, 0])
+            counts[0] += hits
+            counts[1] += misses
+
+    def merge(self, other):
+        """Add in `other`, another process's Totals."""
+        self.count += other.count
+        self.seconds += other.seconds
+        self.buckets = [a + b for a, b in zip(self.buckets, other.buckets)]
+        self.queries += other.queries
+        self.query_seconds += other.query_seconds
+        self.serialization_seconds += other.serialization_seconds
+        for name, (hits, misses) in other.caches.items():
+            counts = self.caches.setdefault(name, [0, 0])
+            counts[0] += hits
+            counts[1] += misses
+
+    def as_dict(self):
+        return dict(vars(self))
+
+    @classmethod
+    def from_dict(cls, values):
+        totals = cls()
+        vars(totals).update(values)
+        return totals
+
+
+def labels(**values):
+    return '{{{}}}'.format(','.join(
+        '{}="{}"'.format(name, str(value).replace('\\', r'\\')
+                         .replace('"', r'\"').replace('\n', r'\n'))
+        for name, value in sorted(values.items())
+    ))
+
+
+def number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def directory():
+    return getattr(settings, 'TINTG_METRICS_DIR', None)
+
+
+def clear_directory(path=None):
+    """Remove the totals files in `path`, creating it if need be."""
+    path = path or directory()
+    if not path:
+        return
+    os.makedirs(path, exist_ok=True)
+    for name in glob.glob(os.path.join(path, '*.json')):
+        try:
+            os.remove(name)
+        except OSError:
+            pass
+
+
+def dyno_labels():
+    dyno = os.environ.get('DYNO')
+    return {'dyno': dyno} if dyno else {}
+
+
+class Registry(object):
+    """Totals per (subcommand, outcome) for this process."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.totals = {}
+        self.pid = None
+        self.path = None
+        self.flushed = 0.0
+
+    def _check_pid(self):
+        # A forked worker starts over: what it inherited is its parent's.
+        pid = os.getpid()
+        if pid != self.pid:
+            if self.pid is not None:
+                self.totals.clear()
+            self.pid = pid
+            self.path = None
+
+    def observe(self, record):
+        with self.lock:
+            self._check_pid()
+            key = (record.subcommand, record.outcome)
+            totals = self.totals.get(key)
+            if totals is None:
+                totals = self.totals[key] = Totals()
+            totals.add(record)
+            if time.monotonic() - self.flushed >= FLUSH_INTERVAL:
+                self._flush()
+
+    def flush(self):
+        """Write this process's totals to TINTG_METRICS_DIR, if it is set."""
+        with self.lock:
+            self._check_pid()
+            self._flush()
+
+    def _flush(self):
+        path = directory()
+        if not path or not self.totals:
+            return
+        if self.path is None or os.path.dirname(self.path) != path:
+            # Unique per process, so a reused pid can't overwrite the
+            # counts of a worker that has exited.
+            os.makedirs(path, exist_ok=True)
+            self.path = os.path.join(path, '{}-{}.json'.format(
+                self.pid, uuid.uuid4().hex[:8],
+            ))
+            atexit.register(self.flush)
+        temporary = self.path + '.tmp'
+        try:
+            with open(temporary, 'w') as output:
+                json.dump([
+                    [subcommand, outcome, totals.as_dict()]
+                    for (subcommand, outcome), totals in self.totals.items()
+                ], output)
+            os.replace(temporary, self.path)
+        except OSError:
+            # Metrics mustn't fail a command; the next flush tries again.
+            logger.exception("Can't write metrics to %s", self.path)
+        self.flushed = time.monotonic()
+
+    def clear(self):
+        with self.lock:
+            self.totals.clear()
+
+    def combined(self):
+        """Every process's totals, from TINTG_METRICS_DIR if it is set."""
+        path = directory()
+        if not path:
+            with self.lock:
+                self._check_pid()
+                return dict(self.totals)
+        self.flush()
+        combined = {}
+        for name in glob.glob(os.path.join(path, '*.json')):
+            try:
+                with open(name) as source:
+                    rows = json.load(source)
+            except (OSError, ValueError):
+                # Cleared, or from another version; skip it.
+                continue
+            for subcommand, outcome, values in rows:
+                totals = combined.setdefault((subcommand, outcome), Totals())
+                totals.merge(Totals.from_dict(values))
+        return combined
+
+    def render(self):
+        """The totals in the Prometheus text exposition format."""
+        extra = dyno_labels()
+        series = sorted(self.combined().items(), key=lambda item: item[0])
+        with self.lock:
+            lines = []
+
+            def family(name, kind, help, samples):
+                lines.append('# HELP {} {}'.format(name, help))
+                lines.append('# TYPE {} {}'.format(name, kind))
+                lines.extend(samples)
+
+            def sample(name, value, **values):
+                values.update(extra)
+                return '{}{} {}'.format(name, labels(**values), number(value))
+
+            histogram = []
+            for (subcommand, outcome), totals in series:
+                cumulative = 0
+                for bound, count in zip(BUCKETS + ('+Inf',), totals.buckets):
+                    cumulative += count
+                    histogram.append(sample(
+                        'tintg_slash_command_seconds_bucket', cumulative,
+                        subcommand=subcommand, outcome=outcome,
+                        le=bound if bound == '+Inf' else number(bound),
+                    ))
+                histogram.append(sample(
+                    'tintg_slash_command_seconds_sum', totals.seconds,
+                    subcommand=subcommand, outcome=outcome,
+                ))
+                histogram.append(sample(
+                    'tintg_slash_command_seconds_count', totals.count,
+                    subcommand=subcommand, outcome=outcome,
+                ))
+            family('tintg_slash_command_seconds', 'histogram',
+                   'Wall time of slash commands.', histogram)
+
+            for name, attribute, help in (
+                ('tintg_slash_command_db_queries_total', 'queries',
+                 'Database queries run by slash commands.'),
+                ('tintg_slash_command_db_seconds_total', 'query_seconds',
+                 'Time slash commands spent in database queries.'),
+                ('tintg_slash_command_serialization_seconds_total',
+                 'serialization_seconds',
+                 'Time spent encoding slash command responses.'),
+            ):
+                family(name, 'counter', help, [
+                    sample(name, getattr(totals, attribute),
+                           subcommand=subcommand, outcome=outcome)
+                    for (subcommand, outcome), totals in series
+                ])
+
+            for name, index, help in (
+                ('tintg_slash_command_cache_hits_total', 0,
+                 'Cache hits during slash commands.'),
+                ('tintg_slash_command_cache_misses_total', 1,
+                 'Cache misses during slash commands.'),
+            ):
+                family(name, 'counter', help, [
+                    sample(name, counts[index], subcommand=subcommand,
+                           outcome=outcome, cache=cache)
+                    for (subcommand, outcome), totals in series
+                    for cache, counts in sorted(totals.caches.items())
+                ])
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+def allowed(request):
+    """
+    Whether `request` may read the metrics: it bears TINTG_METRICS_TOKEN,
+    or comes from one of TINTG_METRICS_ADDRESSES. Behind a router such as
+    Heroku's, REMOTE_ADDR is the router's, so only the token works there.
+    """
+    token = getattr(settings, 'TINTG_METRICS_TOKEN', None)
+    if token:
+        scheme, _, given = request.META.get(
+            'HTTP_AUTHORIZATION', '',
+        ).partition(' ')
+        # compare_digest only takes ASCII strings, so compare bytes.
+        if scheme.lower() == 'bearer' and hmac.compare_digest(
+            given.strip().encode('utf-8'), token.encode('utf-8'),
+        ):
+            return True
+    addresses = getattr(
+        settings, 'TINTG_METRICS_ADDRESSES', DEFAULT_ADDRESSES,
+    )
+    return addresses is None or request.META.get('REMOTE_ADDR') in addresses
+
+
+def export(request):
+    """Serve the totals to Prometheus, from allowed clients."""
+    if not allowed(request):
+        raise Http404
+    return HttpResponse(registry.render(), content_type=CONTENT_TYPE)
@@ -1,10 +1,22 @@
+import os
+import tempfile
+
 import dj_database_url
 from tintg.settings import *
 
 DEBUG = False
 TEMPLATE_DEBUG = False
 
-DATABASES['default'] = dj_database_url.parse(get_env_variable('TINTG_DB_URL'))
+# Keep connections open between requests. If a pooler such as pgbouncer
+# runs alongside the app, point TINTG_DB_POOL_URL at it; each thread then
+# holds a cheap client connection and pgbouncer shares the server ones.
+DATABASES['default'] = dj_database_url.parse(
+    os.environ.get('TINTG_DB_POOL_URL') or get_env_variable('TINTG_DB_URL'),
+    conn_max_age=int(os.environ.get('TINTG_DB_CONN_MAX_AGE', 600)),
+)
+
+# Read by tintg/gunicorn_conf.py too, to size the connection budget.
+TINTG_COMMAND_WORKERS = int(os.environ.get('TINTG_COMMAND_WORKERS', 4))
 
 SECRET_KEY = get_env_variable('TINTG_SECRET_KEY')
 
@@ -36,4 +48,37 @@ OPBEAT = {
     'ORGANIZATION_ID': get_env_variable("OPBEAT_ORG_ID"),
     'APP_ID': get_env_variable("OPBEAT_APP_ID"),
     'SECRET_TOKEN': get_env_variable("OPBEAT_SECRET_KEY"),
-}
\ No newline at end of file
+}
+
+# Behind the Heroku router every client address is the router's, so
+# Prometheus authenticates with a bearer token; without one, /metrics/ is
+# only served on the dyno itself. The workers share their totals through a
+# directory on the dyno.
+TINTG_METRICS_TOKEN = os.environ.get('TINTG_METRICS_TOKEN')
+TINTG_METRICS_DIR = os.environ.get(
+    'TINTG_METRICS_DIR', os.path.join(tempfile.gettempdir(), 'tintg-metrics'),
+)
+
+# One JSON line per slash command, from tintg.metrics, on stdout for the
+# log drain.
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'message': {'format': '%(message)s'},
+    },
+    'handlers': {
+        'metrics': {
+            'class': 'logging.StreamHandler',
+            'formatter': 'message',
+            'stream': 'ext://sys.stdout',
+        },
+    },
+    'loggers': {
+        'tintg.metrics': {
+            'handlers': ['metrics'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
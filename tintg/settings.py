@@ -132,3 +132,78 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/1.9/howto/static-files/
 
 STATIC_URL = '/static/'
+
+
+# Slack webhook
+
+# Team lookups are cached in each worker process. Set TINTG_TEAM_CACHE to an
+# alias in CACHES to share them between workers as well.
+TINTG_TEAM_CACHE = None
+TINTG_TEAM_CACHE_SIZE = 1024
+TINTG_TEAM_CACHE_TIMEOUT = 300
+
+# Snapshots of each channel's active game, used to answer read-only commands
+# without touching the database.
+TINTG_GAME_CACHE = 'default'
+TINTG_GAME_CACHE_TIMEOUT = 600
+# Snapshots from a process-local cache (LocMemCache, the default) are
+# checked against the game's version before use, since gunicorn runs
+# several workers. Point TINTG_GAME_CACHE at a shared cache such as
+# memcached to skip the check; set this to override the guess.
+TINTG_GAME_CACHE_SHARED = None
+
+# Emoji set used to draw boards; see games.rendering.THEMES.
+TINTG_BOARD_THEME = 'slack'
+
+# Extra game engines to register at startup, as dotted paths to
+# games.engines.Engine subclasses.
+TINTG_GAME_ENGINES = ()
+
+# Acknowledge game commands immediately and post the result to Slack's
+# response_url from a pool of TINTG_COMMAND_WORKERS threads per process.
+TINTG_ASYNC_COMMANDS = False
+TINTG_COMMAND_WORKERS = 4
+TINTG_SLACK_HTTP_CLIENT = 'slack.background.UrllibClient'
+# Only response_urls at these origins are posted to; commands from anywhere
+# else are answered inline, so a leaked token can't aim the workers at
+# other hosts.
+TINTG_RESPONSE_URL_ORIGINS = ('https://hooks.slack.com',)
+
+# Persistent connections (CONN_MAX_AGE) unused for this many seconds are
+# pinged before the next request uses them. None turns the check off.
+TINTG_DB_HEALTH_CHECK_INTERVAL = 30
+
+# Slash command POSTs to TINTG_WEBHOOK_PATH only run these middleware; see
+# tintg/webhook.py.
+TINTG_WEBHOOK_PATH = '/slack/'
+TINTG_WEBHOOK_MIDDLEWARE = (
+    'django.middleware.security.SecurityMiddleware',
+)
+
+# Budget for booting a worker, checked by `manage.py importtime`: seconds,
+# and KiB of resident memory. None skips the check.
+TINTG_STARTUP_BUDGET = 1.0
+TINTG_STARTUP_RSS_BUDGET = 64 * 1024
+
+# `manage.py archive_games` moves finished games out of the live tables in
+# batches of this many, sleeping TINTG_ARCHIVE_PAUSE seconds between them.
+TINTG_ARCHIVE_BATCH_SIZE = 500
+TINTG_ARCHIVE_PAUSE = 0.5
+
+# Moves are appended to the move log; a game's full state is only written
+# every TINTG_CHECKPOINT_INTERVAL moves, and when it ends.
+TINTG_CHECKPOINT_INTERVAL = 4
+
+# End games as soon as their result is settled: when one side can force a
+# win, or nobody can win any more, rather than once the board says so.
+TINTG_END_FORCED_GAMES = True
+
+# Per-command metrics (see tintg/metrics.py) are served at /metrics/ to
+# these client addresses only; None serves them to anyone. Requests with
+# an `Authorization: Bearer` header matching TINTG_METRICS_TOKEN are served
+# from anywhere.
+TINTG_METRICS_ADDRESSES = ('127.0.0.1', '::1')
+TINTG_METRICS_TOKEN = None
+# Set to a directory every worker process can write to, so /metrics/ adds
+# up all of them rather than serving whichever worker answers.
+TINTG_METRICS_DIR = None
@@ -0,0 +1,128 @@
+"""
+Worker startup: warming up, and measuring what boot costs.
+
+warm_up() does the work the first slash command would otherwise pay for.
+gunicorn_conf.py runs it in the master when preload_app is on, so forked
+workers share the imported code and start serving immediately.
+
+Run as a script, this module boots Django in a fresh interpreter with every
+import timed, and prints one JSON record per module: cumulative and own
+import time in seconds, and the RSS growth while it loaded, in KiB. The
+`importtime` management command reads the records and checks them against
+a budget.
+"""
+import json
+import resource
+import sys
+import time
+
+
+def warm_up():
+    """Import the URLconf and views, and map the solver table."""
+    from django.core.urlresolvers import get_resolver
+    from games import solver
+    get_resolver(None).url_patterns
+    solver.table()
+
+
+def rss():
+    """Current resident set size in KiB."""
+    try:
+        with open('/proc/self/statm') as statm:
+            pages = int(statm.read().split()[1])
+        return pages * resource.getpagesize() // 1024
+    except (IOError, OSError):
+        # No /proc; the peak is the best we can do.
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class TimedLoader(object):
+    """Wraps a module loader to record how long exec_module takes."""
+
+    def __init__(self, loader, name, records, stack):
+        self.loader = loader
+        self.name = name
+        self.records = records
+        self.stack = stack
+
+    def __getattr__(self, name):
+        return getattr(self.loader, name)
+
+    def create_module(self, spec):
+        create = getattr(self.loader, 'create_module', None)
+        return create(spec) if create else None
+
+    def exec_module(self, module):
+        children = []
+        self.stack.append(children)
+        started = time.perf_counter()
+        rss_before = rss()
+        try:
+            self.loader.exec_module(module)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.stack.pop()
+            if self.stack:
+                self.stack[-1].append(elapsed)
+            self.records.append({
+                'module': self.name,
+                'cumulative': elapsed,
+                'self': elapsed - sum(children),
+                'rss': rss() - rss_before,
+            })
+
+
+class TimingFinder(object):
+    """A meta path finder that wraps the loaders the other finders find."""
+
+    def __init__(self):
+        self.records = []
+        self.stack = []
+
+    def find_spec(self, name, path, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, 'find_spec'):
+                continue
+            spec = finder.find_spec(name, path, target)
+            if spec is not None:
+                if spec.loader is not None and \
+                        hasattr(spec.loader, 'exec_module'):
+                    spec.loader = TimedLoader(
+                        spec.loader, name, self.records, self.stack,
+                    )
+                return spec
+        return None
+
+
+def profile(boot):
+    """Run `boot()` with imports timed; return (records, seconds, RSS)."""
+    finder = TimingFinder()
+    sys.meta_path.insert(0, finder)
+    started = time.perf_counter()
+    try:
+        boot()
+    finally:
+        sys.meta_path.remove(finder)
+    return finder.records, time.perf_counter() - started, rss()
+
+
+def boot_worker():
+    """Everything a gunicorn worker does before its first request."""
+    from tintg.wsgi import application
+    handler = getattr(application, 'application', application)
+    handler.load_middleware()
+    getattr(application, 'webhook', handler).load_middleware()
+    warm_up()
+
+
+def main():
+    records, seconds, final_rss = profile(boot_worker)
+    json.dump({
+        'modules': records,
+        'seconds': seconds,
+        'rss': final_rss,
+    }, sys.stdout)
+
+
+if __name__ == '__main__':
+    main()
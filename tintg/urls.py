@@ -17,9 +17,11 @@ from django.conf.urls import url
 from django.contrib import admin
 from django.views.generic import TemplateView
 from slack.views import slash_command
+from tintg import metrics
 
 urlpatterns = [
     url(r'^admin/', admin.site.urls),
     url(r'^slack/$', slash_command),
+    url(r'^metrics/$', metrics.export),
     url(r'^$', TemplateView.as_view(template_name="slash_command.html")),
 ]
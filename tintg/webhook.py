@@ -0,0 +1,77 @@
+"""
+A lean request path for the Slack webhook.
+
+Slash commands are authenticated by their token, so the session, auth,
+message, CSRF and clickjacking middleware in MIDDLEWARE_CLASSES only add
+work to them. WebhookDispatcher sends POSTs to TINTG_WEBHOOK_PATH through a
+handler that loads just TINTG_WEBHOOK_MIDDLEWARE, and everything else (the
+admin, the landing page) through the full stack.
+"""
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.handlers.wsgi import WSGIHandler
+from django.utils.module_loading import import_string
+
+
+DEFAULT_PATH = '/slack/'
+DEFAULT_MIDDLEWARE = (
+    'django.middleware.security.SecurityMiddleware',
+)
+
+
+def webhook_path():
+    return getattr(settings, 'TINTG_WEBHOOK_PATH', DEFAULT_PATH)
+
+
+def webhook_middleware():
+    return getattr(settings, 'TINTG_WEBHOOK_MIDDLEWARE', DEFAULT_MIDDLEWARE)
+
+
+class WebhookHandler(WSGIHandler):
+    """A WSGIHandler that only runs TINTG_WEBHOOK_MIDDLEWARE."""
+
+    def load_middleware(self):
+        # The same as BaseHandler.load_middleware, which only reads
+        # settings.MIDDLEWARE_CLASSES.
+        self._view_middleware = []
+        self._template_response_middleware = []
+        self._response_middleware = []
+        self._exception_middleware = []
+
+        request_middleware = []
+        for middleware_path in webhook_middleware():
+            try:
+                middleware = import_string(middleware_path)()
+            except MiddlewareNotUsed:
+                continue
+            if hasattr(middleware, 'process_request'):
+                request_middleware.append(middleware.process_request)
+            if hasattr(middleware, 'process_view'):
+                self._view_middleware.append(middleware.process_view)
+            if hasattr(middleware, 'process_template_response'):
+                self._template_response_middleware.insert(
+                    0, middleware.process_template_response,
+                )
+            if hasattr(middleware, 'process_response'):
+                self._response_middleware.insert(
+                    0, middleware.process_response,
+                )
+            if hasattr(middleware, 'process_exception'):
+                self._exception_middleware.insert(
+                    0, middleware.process_exception,
+                )
+        self._request_middleware = request_middleware
+
+
+class WebhookDispatcher(object):
+
+    def __init__(self, application, webhook=None):
+        self.application = application
+        self.webhook = webhook or WebhookHandler()
+        self.path = webhook_path()
+
+    def __call__(self, environ, start_response):
+        if environ.get('REQUEST_METHOD') == 'POST' and \
+                environ.get('PATH_INFO') == self.path:
+            return self.webhook(environ, start_response)
+        return self.application(environ, start_response)
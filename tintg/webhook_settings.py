@@ -0,0 +1,45 @@
+"""
+Settings for a process that only serves the Slack webhook.
+
+Starts from the settings module named by TINTG_BASE_SETTINGS (production by
+default) and drops the admin and the session, auth and message apps, along
+with their middleware and context processors, so workers import and keep
+less. Run it with
+
+    DJANGO_SETTINGS_MODULE=tintg.webhook_settings gunicorn tintg.wsgi ...
+"""
+import importlib
+import os
+
+_base = importlib.import_module(
+    os.environ.get('TINTG_BASE_SETTINGS', 'tintg.prod_settings'),
+)
+globals().update(
+    (name, value) for name, value in vars(_base).items() if name.isupper()
+)
+
+WEBHOOK_EXCLUDED_APPS = (
+    'django.contrib.admin',
+    'django.contrib.auth',
+    'django.contrib.contenttypes',
+    'django.contrib.sessions',
+    'django.contrib.messages',
+    'django.contrib.staticfiles',
+)
+
+INSTALLED_APPS = [
+    app for app in INSTALLED_APPS if app not in WEBHOOK_EXCLUDED_APPS
+]
+
+MIDDLEWARE_CLASSES = TINTG_WEBHOOK_MIDDLEWARE
+
+ROOT_URLCONF = 'tintg.webhook_urls'
+
+TEMPLATES = [dict(
+    TEMPLATES[0],
+    OPTIONS=dict(TEMPLATES[0]['OPTIONS'], context_processors=[
+        processor
+        for processor in TEMPLATES[0]['OPTIONS']['context_processors']
+        if not processor.startswith('django.contrib.')
+    ]),
+)]
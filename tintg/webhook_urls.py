@@ -0,0 +1,11 @@
+"""URLs served by tintg.webhook_settings: the slash command and its metrics."""
+from django.conf.urls import url
+from django.views.generic import TemplateView
+from slack.views import slash_command
+from tintg import metrics
+
+urlpatterns = [
+    url(r'^slack/$', slash_command),
+    url(r'^metrics/$', metrics.export),
+    url(r'^$', TemplateView.as_view(template_name="slash_command.html")),
+]
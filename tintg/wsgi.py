@@ -2,6 +2,7 @@
 WSGI config for tintg project.
 
 It exposes the WSGI callable as a module-level variable named ``application``.
+Slash command POSTs skip the session/auth middleware; see tintg/webhook.py.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/1.9/howto/deployment/wsgi/
@@ -10,7 +11,8 @@ https://docs.djangoproject.com/en/1.9/howto/deployment/wsgi/
 import os
 
 from django.core.wsgi import get_wsgi_application
+from tintg.webhook import WebhookDispatcher
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "tintg.prod_settings")
 
-application = get_wsgi_application()
+application = WebhookDispatcher(get_wsgi_application())